@@ -0,0 +1,87 @@
+# backend/archive.py
+
+import logging
+from datetime import datetime
+from backend.models import db, Game, ArchivedGame
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+def ensure_archive_schema():
+    """Создает таблицу архива в архивной базе, если ее еще нет."""
+    ArchivedGame.__table__.create(bind=db.get_engine(bind='archive'), checkfirst=True)
+
+
+def archive_finished_games(older_than, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """
+    Переносит завершенные партии старше порога из таблицы game в архивную базу.
+
+    Партии переносятся пачками: сначала пачка записывается в архив, затем удаляется из основной базы.
+    Каждая пачка — две короткие транзакции, поэтому основная таблица не блокируется надолго.
+    Если процесс прервется между ними, при следующем запуске уже заархивированные партии
+    не записываются повторно, а просто удаляются из основной таблицы.
+
+    Турнирные партии не архивируются: по ним считаются сыгранные соперники для жеребьевки и
+    коэффициент Бухгольца (backend.tournament), а архив не хранит турнир и тур партии.
+
+    Аргументы:
+        older_than (timedelta): Минимальный возраст партии (по времени окончания).
+        batch_size (int, необязательный): Количество партий в одной пачке.
+        max_batches (int, необязательный): Ограничение на число пачек за один вызов.
+
+    Возвращает:
+        int: Количество перенесенных партий.
+    """
+    cutoff = datetime.utcnow() - older_than
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        games = (Game.query
+                 .filter_by(is_active=False)
+                 .filter(Game.finished_at.isnot(None), Game.finished_at < cutoff, Game.tournament_id.is_(None))
+                 .order_by(Game.id)
+                 .limit(batch_size)
+                 .all())
+        if not games:
+            break
+        ids = [game.id for game in games]
+
+        already_archived = {row.id for row in ArchivedGame.query.filter(ArchivedGame.id.in_(ids))}
+        db.session.add_all(ArchivedGame.from_game(game) for game in games if game.id not in already_archived)
+        db.session.commit()
+
+        Game.query.filter(Game.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        moved += len(ids)
+        batches += 1
+    if moved:
+        logging.info(f'Archived {moved} finished games older than {cutoff.isoformat()}')
+    return moved
+
+
+def run_archiver(app, sleep, interval, older_than):
+    """
+    Фоновый цикл архивации для запуска через socketio.start_background_task.
+
+    Аргументы:
+        app (Flask): Приложение, в контексте которого выполняется архивация.
+        sleep (callable): Функция ожидания, совместимая с асинхронным режимом (socketio.sleep).
+        interval (int): Пауза между проходами в секундах.
+        older_than (timedelta): Минимальный возраст архивируемых партий.
+    """
+    with app.app_context():
+        ensure_archive_schema()
+    while True:
+        try:
+            with app.app_context():
+                archive_finished_games(older_than)
+        except Exception as e:
+            logging.error(f'Archiving failed: {e}', exc_info=True)
+        sleep(interval)
+
+
+def find_game(game_id):
+    """Ищет партию сначала в основной таблице, затем в архиве."""
+    return db.session.get(Game, game_id) or db.session.get(ArchivedGame, game_id)
+
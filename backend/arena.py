@@ -0,0 +1,236 @@
+# backend/arena.py
+
+from bisect import bisect_left
+from backend.models import db, Game, TournamentPlayer, User
+
+ARENA_WIN = 2  # очков за победу
+ARENA_DRAW = 1  # очков за ничью
+STREAK_LENGTH = 2  # побед подряд, после которых очки за партию удваиваются
+REMATCH_WAIT = 3  # проходов жеребьевки, после которых допускается повторная встреча с прошлым соперником
+
+
+def arena_points(outcome, streak):
+    """
+    Очки за партию арены и новая серия побед.
+
+    Аргументы:
+        outcome (float): 1 — победа, 0.5 — ничья, 0 — поражение.
+        streak (int): Побед подряд до этой партии.
+
+    Возвращает:
+        tuple: (очки, серия побед после партии).
+    """
+    multiplier = 2 if streak >= STREAK_LENGTH else 1
+    if outcome == 1:
+        return ARENA_WIN * multiplier, streak + 1
+    if outcome == 0.5:
+        return ARENA_DRAW * multiplier, 0
+    return 0, 0
+
+
+class ArenaStandings:
+    """
+    Таблица арены, обновляемая по одной строке.
+
+    Ключи (-очки, id) хранятся отсортированными, поэтому изменение очков участника — это удаление и
+    вставка ключа (bisect). Дельта для рассылки состоит только из перемещений изменившихся участников
+    (новое место и очки): клиент повторяет их над своей копией — удаляет строку участника и вставляет
+    ее на новое место, — а места остальных строк сдвигаются сами. Поэтому размер дельты не зависит
+    от числа участников с равными очками. Номер версии растет с каждой дельтой: клиент, пропустивший
+    дельту (from_version не совпадает с его версией), запрашивает таблицу целиком.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.rows = {}  # user_id -> (очки, имя)
+        self.version = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _row(self, index):
+        user_id = self.keys[index][1]
+        score, username = self.rows[user_id]
+        return {'rank': index + 1, 'user_id': user_id, 'username': username, 'score': score}
+
+    def _set(self, user_id, username, score):
+        """Обновляет строку участника и возвращает его новое место (с 1)."""
+        old = self.rows.get(user_id)
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old[0], user_id))]
+        self.rows[user_id] = (score, username)
+        key = (-score, user_id)
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        return index + 1
+
+    def update(self, changes):
+        """
+        Применяет изменения очков и возвращает одну дельту для рассылки.
+
+        Аргументы:
+            changes (list): Кортежи (user_id, имя, очки).
+
+        Возвращает:
+            dict: {'from_version', 'version', 'moves'} — перемещения в порядке применения.
+        """
+        from_version = self.version
+        moves = [{'rank': self._set(user_id, username, score), 'user_id': user_id, 'username': username,
+                  'score': score} for user_id, username, score in changes]
+        self.version += 1
+        return {'from_version': from_version, 'version': self.version, 'moves': moves}
+
+    def snapshot(self, limit=None):
+        """Таблица целиком (или первые limit мест) с текущей версией."""
+        count = len(self.keys) if limit is None else min(limit, len(self.keys))
+        return {'version': self.version, 'rows': [self._row(index) for index in range(count)]}
+
+
+class ArenaEvent:
+    """
+    Состояние идущей арены в памяти процесса, который ведет ее жеребьевку.
+
+    Участник находится либо в очереди (waiting), либо в партии (playing); закончив партию, он сразу
+    возвращается в очередь. Жеребьевка (pair) сводит ожидающих с ближайшими по очкам, избегая
+    немедленной повторной встречи с прошлым соперником, и чередует цвета.
+
+    Аргументы:
+        tournament_id (int): Идентификатор турнира.
+    """
+
+    def __init__(self, tournament_id):
+        self.tournament_id = tournament_id
+        self.standings = ArenaStandings()
+        self.waiting = {}  # user_id -> число проходов жеребьевки, которые участник ждет
+        self.playing = set()
+        self.last_opponent = {}
+        self.last_color = {}
+        self.closed = False  # время арены вышло: новые партии не начинаются
+
+    def enqueue(self, user_id):
+        if not self.closed:
+            self.waiting.setdefault(user_id, 0)
+        self.playing.discard(user_id)
+
+    def discard(self, user_id):
+        self.waiting.pop(user_id, None)
+
+    def _colors(self, a, b):
+        """(белые, черные): цвет чередуется относительно прошлой партии каждого."""
+        if self.last_color.get(a) == 'w' and self.last_color.get(b) != 'w':
+            return b, a
+        if self.last_color.get(b) == 'b' and self.last_color.get(a) != 'b':
+            return b, a
+        return a, b
+
+    def pair(self):
+        """
+        Сводит ожидающих участников в пары по местам в таблице: соседи по очкам играют между собой.
+
+        Если соседом оказывается прошлый соперник, он меняется местами со следующим в очереди;
+        повторная встреча допускается, только если оба ждут не меньше REMATCH_WAIT проходов.
+        Участник без пары остается в очереди до следующего прохода.
+
+        Возвращает:
+            list: Пары (id белых, id черных).
+        """
+        queue = sorted(self.waiting, key=lambda user_id: (-self.standings.rows[user_id][0], user_id))
+        pairs = []
+        index = 0
+        while index + 1 < len(queue):
+            a, b = queue[index], queue[index + 1]
+            if self.last_opponent.get(a) == b:
+                if index + 2 < len(queue):
+                    queue[index + 1], queue[index + 2] = queue[index + 2], queue[index + 1]
+                    b = queue[index + 1]
+                elif min(self.waiting[a], self.waiting[b]) < REMATCH_WAIT:
+                    break
+            pairs.append(self._colors(a, b))
+            index += 2
+        for user_id in self.waiting:
+            self.waiting[user_id] += 1
+        for white_id, black_id in pairs:
+            for user_id, opponent_id, color in ((white_id, black_id, 'w'), (black_id, white_id, 'b')):
+                del self.waiting[user_id]
+                self.playing.add(user_id)
+                self.last_opponent[user_id] = opponent_id
+                self.last_color[user_id] = color
+        return pairs
+
+
+def load_event(tournament):
+    """
+    Восстанавливает состояние арены из базы (при первом обращении процесса к арене или после перезапуска).
+
+    Участники без идущей партии арены попадают в очередь; прошлые соперники и цвета берутся из
+    последних партий участников.
+    """
+    event = ArenaEvent(tournament.id)
+    rows = (db.session.query(TournamentPlayer, User.username)
+            .join(User, User.id == TournamentPlayer.user_id)
+            .filter(TournamentPlayer.tournament_id == tournament.id)
+            .all())
+    event.standings.update([(player.user_id, username, player.score) for player, username in rows])
+    games = (db.session.query(Game.player_white_id, Game.player_black_id, Game.is_active)
+             .filter(Game.tournament_id == tournament.id)
+             .order_by(Game.id))
+    for white_id, black_id, is_active in games:
+        event.last_opponent[white_id], event.last_opponent[black_id] = black_id, white_id
+        event.last_color[white_id], event.last_color[black_id] = 'w', 'b'
+        if is_active:
+            event.playing.update((white_id, black_id))
+    for player, _ in rows:
+        if not player.withdrawn and player.user_id not in event.playing:
+            event.enqueue(player.user_id)
+    return event
+
+
+def record_result(game):
+    """
+    Начисляет очки арены обоим игрокам завершенной партии (коммит выполняет вызывающая функция).
+
+    Возвращает:
+        list: Обновленные участники TournamentPlayer (белые, черные).
+    """
+    outcome = {'white': 1, 'black': 0, 'draw': 0.5}[game.result]
+    players = []
+    for user_id, player_outcome in ((game.player_white_id, outcome), (game.player_black_id, 1 - outcome)):
+        player = db.session.get(TournamentPlayer, (game.tournament_id, user_id))
+        points, player.streak = arena_points(player_outcome, player.streak)
+        player.score += points
+        players.append(player)
+    return players
+
+
+
+def reconcile(event):
+    """
+    Сверяет состояние арены в памяти с базой перед проходом жеребьевки.
+
+    Возвращает в очередь участников, чьи партии закончились без уведомления этого процесса
+    (партию завершил другой рабочий процесс или фоновая очистка), добавляет вошедших и убирает
+    вышедших через другой процесс. Читаются только идентификаторы и очки, без партий целиком.
+
+    Возвращает:
+        list: Изменения таблицы (user_id, имя, очки) для участников, чьи очки в памяти устарели.
+    """
+    games = (db.session.query(Game.player_white_id, Game.player_black_id)
+             .filter(Game.tournament_id == event.tournament_id, Game.is_active.is_(True)))
+    active = {user_id for pair in games for user_id in pair}
+    rows = (db.session.query(TournamentPlayer.user_id, TournamentPlayer.score, TournamentPlayer.withdrawn,
+                             User.username)
+            .join(User, User.id == TournamentPlayer.user_id)
+            .filter(TournamentPlayer.tournament_id == event.tournament_id))
+    changes = []
+    for user_id, score, withdrawn, username in rows:
+        if user_id in active:
+            continue
+        if withdrawn:
+            event.discard(user_id)
+            event.playing.discard(user_id)
+        elif user_id not in event.waiting:
+            event.enqueue(user_id)
+        known = event.standings.rows.get(user_id)
+        if known is None or known[0] != score:
+            changes.append((user_id, username, score))
+    return changes
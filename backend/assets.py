@@ -0,0 +1,98 @@
+# backend/assets.py
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаются gzip и несжатые файлы
+    brotli = None
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 256  # байт; меньшие файлы не сжимаются
+
+
+class Asset:
+    """Один статический файл: содержимое, отпечаток и заранее сжатые варианты."""
+
+    __slots__ = ('path', 'fingerprint', 'mimetype', 'bodies')
+
+    def __init__(self, path, data):
+        self.path = path
+        self.fingerprint = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.bodies = {'identity': data}
+        if len(data) >= MIN_COMPRESS_SIZE and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            candidates = {'gzip': gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                candidates['br'] = brotli.compress(data, quality=11)
+            for encoding, body in candidates.items():
+                if len(body) < len(data):
+                    self.bodies[encoding] = body
+
+    @property
+    def url_name(self):
+        """Имя файла с отпечатком: css/styles.css -> css/styles.<отпечаток>.css."""
+        root, ext = os.path.splitext(self.path)
+        return f'{root}.{self.fingerprint}{ext}'
+
+    def etag(self, encoding):
+        """Сильный ETag варианта: у сжатых вариантов свои теги, так как байты отличаются."""
+        return self.fingerprint if encoding == 'identity' else f'{self.fingerprint}-{encoding}'
+
+
+class AssetStore:
+    """
+    Статические файлы мини-приложения, подготовленные один раз при запуске.
+
+    Каждый файл из static_folder читается в память, получает отпечаток по содержимому (SHA-256)
+    и сжимается gzip (и brotli, если модуль установлен). Адреса файлов содержат отпечаток,
+    поэтому их можно кэшировать навсегда: после изменения файла меняется и адрес.
+    Изменения файлов на диске подхватываются только после перезапуска процесса.
+    """
+
+    def __init__(self, static_folder):
+        self.assets = {}
+        self.by_url_name = {}
+        for directory, _, filenames in os.walk(static_folder):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                path = os.path.relpath(full_path, static_folder).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    asset = Asset(path, f.read())
+                self.assets[path] = asset
+                self.by_url_name[asset.url_name] = asset
+
+    def url_name(self, path):
+        """
+        Возвращает имя файла с отпечатком для пути относительно static_folder.
+
+        Исключения:
+            KeyError: Если такого файла нет.
+        """
+        return self.assets[path].url_name
+
+    def lookup(self, url_name):
+        """Находит файл по имени с отпечатком; для устаревшего или неизвестного имени возвращает None."""
+        return self.by_url_name.get(url_name)
+
+
+def choose_encoding(asset, accept_encodings):
+    """
+    Выбирает лучший из заранее сжатых вариантов, который принимает клиент.
+
+    Аргументы:
+        asset (Asset): Файл.
+        accept_encodings (werkzeug.datastructures.Accept): Разобранный заголовок Accept-Encoding.
+
+    Возвращает:
+        str: 'br', 'gzip' или 'identity'.
+    """
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.bodies and accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
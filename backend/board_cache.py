@@ -0,0 +1,244 @@
+# backend/board_cache.py
+
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict
+import chess
+
+# Оценка памяти доски python-chess (замер tracemalloc, см. benchmarks/bench_board_cache.py): сама доска
+# и по одной записи в move_stack и во внутреннем стеке состояний на каждый сделанный полуход.
+BOARD_BYTES = 700
+MOVE_BYTES = 480
+BOARD_CACHE_BYTES = 64 * 1024 * 1024  # бюджет памяти досок по умолчанию
+BOARD_IDLE_SECONDS = 3600  # доска без событий дольше этого вытесняется при очистке
+BOARD_COMPACT_SECONDS = 120  # доска без событий дольше этого сжимается в BoardSnapshot
+
+# Позиция снимка: 9 битбордов (фигуры по типам, цвета, превращенные фигуры), права на рокировку,
+# очередь хода, поле взятия на проходе (-1 — нет), счетчики полуходов и ходов.
+POSITION = struct.Struct('<10Q?bHH')
+
+
+def board_bytes(board):
+    """Оценка памяти, занимаемой доской с историей ходов."""
+    return BOARD_BYTES + MOVE_BYTES * len(board.move_stack)
+
+
+def pack_move(move):
+    """Ход в 16 битах: поле начала, поле конца (по 6 бит) и фигура превращения (3 бита)."""
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def unpack_move(packed):
+    return chess.Move(packed & 63, packed >> 6 & 63, packed >> 12 or None)
+
+
+class BoardSnapshot:
+    """
+    Компактный снимок доски партии, в которой давно не было ходов.
+
+    Хранит позицию на момент последнего необратимого хода (взятие или ход пешкой) в одной упакованной
+    строке байтов и ходы после нее по 16 бит. Ходы до этой позиции не нужны: позиции до необратимого
+    хода не могут повториться, а правило 75 ходов считается по счетчику полуходов. Поэтому inflate
+    восстанавливает доску, у которой проверки окончания партии (is_game_over, в том числе повторение
+    позиции) дают тот же результат, что и у исходной, проигрывая не больше halfmove_clock ходов.
+
+    В move_stack восстановленной доски только ходы после этой позиции; номер полухода партии
+    считается по fullmove_number (см. ply).
+    """
+
+    __slots__ = ('position', 'moves')
+
+    def __init__(self, position, moves):
+        self.position = position
+        self.moves = moves
+
+    @classmethod
+    def from_board(cls, board):
+        tail = min(board.halfmove_clock, len(board.move_stack))
+        root = board.copy(stack=tail).root() if tail else board
+        position = POSITION.pack(
+            root.pawns, root.knights, root.bishops, root.rooks, root.queens, root.kings,
+            root.occupied_co[chess.WHITE], root.occupied_co[chess.BLACK], root.promoted, root.castling_rights,
+            root.turn, -1 if root.ep_square is None else root.ep_square, root.halfmove_clock, root.fullmove_number)
+        moves = array('H', [pack_move(move) for move in board.move_stack[len(board.move_stack) - tail:]])
+        return cls(position, moves.tobytes())
+
+    def inflate(self):
+        """Полная доска chess.Board: позиция снимка и ходы после нее."""
+        (pawns, knights, bishops, rooks, queens, kings, white, black, promoted, castling_rights, turn, ep_square,
+         halfmove_clock, fullmove_number) = POSITION.unpack(self.position)
+        board = chess.Board(None)
+        board.pawns, board.knights, board.bishops = pawns, knights, bishops
+        board.rooks, board.queens, board.kings = rooks, queens, kings
+        board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK] = white, black
+        board.occupied = white | black
+        board.promoted = promoted
+        board.castling_rights = castling_rights
+        board.turn = turn
+        board.ep_square = None if ep_square < 0 else ep_square
+        board.halfmove_clock = halfmove_clock
+        board.fullmove_number = fullmove_number
+        moves = array('H')
+        moves.frombytes(self.moves)
+        for packed in moves:
+            board.push(unpack_move(packed))
+        return board
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.position) + sys.getsizeof(self.moves)
+
+
+def ply(board):
+    """Номер полухода партии; в отличие от len(move_stack) верен и для доски, восстановленной из снимка."""
+    return 2 * (board.fullmove_number - 1) + (board.turn == chess.BLACK)
+
+
+def restore_board(uci_moves):
+    """Восстанавливает доску партии по сохраненным ходам (после перезапуска или вытеснения доски)."""
+    board = chess.Board()
+    for uci in (uci_moves or '').split():
+        board.push(chess.Move.from_uci(uci))
+    return board
+
+
+class BoardCache:
+    """
+    Доски идущих партий в памяти процесса с ограничением по объему (LRU).
+
+    Для каждой доски учитывается оценка ее памяти (board_bytes); когда сумма превышает max_bytes,
+    вытесняются доски, к которым дольше всего не обращались. При очистке доски без событий дольше
+    compact секунд заменяются компактными снимками (compact_idle, BoardSnapshot), которые
+    разворачиваются обратно при следующем обращении, а без событий дольше idle секунд —
+    вытесняются (evict_idle). Вытесненная доска не теряется: ходы партии хранятся в базе, и load
+    восстанавливает ее при следующем событии. Поэтому память досок ограничена независимо от числа
+    открытых партий, в том числе долгих партий по переписке.
+
+    Аргументы:
+        max_bytes (int): Бюджет памяти досок.
+        idle (float): Время без обращений, после которого доска вытесняется при очистке, секунды.
+        compact (float): Время без обращений, после которого доска сжимается в снимок, секунды.
+        on_evict (callable, необязательный): Вызывается с комнатой вытесненной доски.
+        clock (callable): Источник монотонного времени.
+    """
+
+    def __init__(self, max_bytes=BOARD_CACHE_BYTES, idle=BOARD_IDLE_SECONDS, on_evict=None, clock=time.monotonic,
+                 compact=BOARD_COMPACT_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle = idle
+        self.compact = compact
+        self.on_evict = on_evict
+        self.clock = clock
+        self.entries = OrderedDict()  # комната -> [доска или снимок, оценка памяти, время последнего обращения]
+        self.bytes = 0
+        self.loads = 0
+        self.evictions = 0
+        self.inflations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, room):
+        return room in self.entries
+
+    def get(self, room):
+        """
+        Доска комнаты или None; обращение делает доску последней в очереди на вытеснение,
+        а снимок разворачивается в доску.
+        """
+        entry = self.entries.get(room)
+        if entry is None:
+            return None
+        entry[2] = self.clock()
+        self.entries.move_to_end(room)
+        if isinstance(entry[0], BoardSnapshot):
+            entry[0] = entry[0].inflate()
+            self.inflations += 1
+            self.resize(room)
+        return entry[0]
+
+    def load(self, room, uci_moves):
+        """Доска комнаты; если ее нет в памяти, восстанавливается по ходам партии."""
+        board = self.get(room)
+        if board is None:
+            board = restore_board(uci_moves)
+            self.loads += 1
+            self.put(room, board)
+        return board
+
+    def put(self, room, board):
+        self.pop(room)
+        size = board_bytes(board)
+        self.entries[room] = [board, size, self.clock()]
+        self.bytes += size
+        self._shrink(keep=room)
+
+    def resize(self, room):
+        """Пересчитывает оценку памяти доски после ходов и при превышении бюджета вытесняет старые доски."""
+        entry = self.entries.get(room)
+        if entry is None:
+            return
+        size = board_bytes(entry[0]) if isinstance(entry[0], chess.Board) else entry[0].nbytes()
+        self.bytes += size - entry[1]
+        entry[1] = size
+        self._shrink(keep=room)
+
+    def pop(self, room):
+        """Убирает доску комнаты; возвращает доску или снимок BoardSnapshot (None, если доски нет)."""
+        entry = self.entries.pop(room, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            return entry[0]
+        return None
+
+    def _evict(self, room):
+        self.pop(room)
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(room)
+
+    def _shrink(self, keep):
+        """Вытесняет самые давние доски, пока сумма не уложится в бюджет; доску keep не трогает."""
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            room = next(iter(self.entries))
+            if room == keep:
+                break
+            self._evict(room)
+
+    def evict_idle(self):
+        """
+        Вытесняет доски без обращений дольше idle секунд.
+
+        Возвращает:
+            int: Количество вытесненных досок.
+        """
+        cutoff = self.clock() - self.idle
+        count = 0
+        while self.entries:
+            room, entry = next(iter(self.entries.items()))
+            if entry[2] >= cutoff:
+                break
+            self._evict(room)
+            count += 1
+        return count
+
+    def compact_idle(self):
+        """
+        Заменяет снимками BoardSnapshot доски без обращений дольше compact секунд.
+
+        Возвращает:
+            int: Количество сжатых досок.
+        """
+        cutoff = self.clock() - self.compact
+        count = 0
+        for room, entry in self.entries.items():
+            if entry[2] >= cutoff:
+                break
+            if isinstance(entry[0], chess.Board):
+                entry[0] = BoardSnapshot.from_board(entry[0])
+                size = entry[0].nbytes()
+                self.bytes += size - entry[1]
+                entry[1] = size
+                count += 1
+        return count
@@ -1,6 +1,10 @@
 import os
 import uuid
-import requests
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import urllib.parse
+import chess
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import (
@@ -9,10 +13,13 @@ from telegram.ext import (
     MessageHandler,
     ConversationHandler,
     ContextTypes,
+    PersistenceInput,
+    PicklePersistence,
     filters
 )
-from backend.models import db, User
-from backend.main import app
+from backend.bot_client import BackendClient, SESSION_KEY, session_record
+from backend.notifier import OutboxSender
+from backend.bot_updates import ChatOrderedUpdateProcessor, MAX_RUNNING_UPDATES, MAX_PENDING_UPDATES
 
 load_dotenv()
 
@@ -23,8 +30,41 @@ FRONTEND_URL = os.getenv('FRONTEND_URL')
 if not BOT_TOKEN or not FRONTEND_URL:
     raise ValueError("BOT_TOKEN and FRONTEND_URL must be set in the .env file.")
 
+# Режим webhook включается заданием BOT_WEBHOOK_URL (внешний адрес, по которому Telegram шлет обновления).
+BOT_WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL')
+BOT_WEBHOOK_LISTEN = os.getenv('BOT_WEBHOOK_LISTEN', '0.0.0.0')
+BOT_WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', '8443'))
+BOT_WEBHOOK_PATH = os.getenv('BOT_WEBHOOK_PATH', 'telegram')
+BOT_WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET')
+BOT_MAX_RUNNING_UPDATES = int(os.getenv('BOT_MAX_RUNNING_UPDATES', str(MAX_RUNNING_UPDATES)))
+BOT_MAX_PENDING_UPDATES = int(os.getenv('BOT_MAX_PENDING_UPDATES', str(MAX_PENDING_UPDATES)))
+BOT_IO_THREADS = int(os.getenv('BOT_IO_THREADS', str(BOT_MAX_RUNNING_UPDATES)))  # потоков для запросов к бэкенду
+# Записи о входе и состояние диалогов переживают перезапуск бота; запись на диск — пачкой раз в интервал.
+BOT_PERSISTENCE_PATH = os.getenv('BOT_PERSISTENCE_PATH', 'bot_state.pickle')
+BOT_PERSISTENCE_INTERVAL = int(os.getenv('BOT_PERSISTENCE_INTERVAL', '60'))  # секунд между записями
+OUTBOX_SECRET = os.getenv('OUTBOX_SECRET')  # тот же секрет, что у бэкенда; без него уведомления не отправляются
+
 REGISTER_USERNAME, REGISTER_PASSWORD = range(2)
 LOGIN_USERNAME, LOGIN_PASSWORD = range(2, 4)
+EXPLORER_MOVES_SHOWN = 8
+
+backend = BackendClient(BASE_URL, pool_size=BOT_IO_THREADS, outbox_secret=OUTBOX_SECRET)
+
+
+def download_pgn(username, buffer):
+    """
+    Скачивает PGN партий пользователя по частям в buffer (блокирующий вызов, выполняется в отдельном потоке).
+
+    Возвращает:
+        bool: True, если сервер вернул партии, иначе False.
+    """
+    response = backend.get(f'/users/{urllib.parse.quote(username)}/games.pgn', stream=True)
+    if response.status_code != 200:
+        return False
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        buffer.write(chunk)
+    return True
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -71,7 +111,7 @@ async def register_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     username = context.user_data['username']
     password = update.message.text
-    response = requests.post(f'{BASE_URL}/register', data={'username': username, 'password': password})
+    response = await asyncio.to_thread(backend.post, '/register', data={'username': username, 'password': password})
 
     if response.status_code == 200:
         await update.message.reply_text("Registration successful! You can now /login.")
@@ -106,19 +146,20 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ConversationHandler.END: Завершается текущее состояние в обработчике беседы.
 
     Примечания:
-        - В случае успешного входа сервер возвращает токен аутентификации, который сохраняется в `context.user_data['auth_token']`.
+        - В случае успешного входа в `context.user_data['session']` сохраняется только запись о входе
+          (id пользователя, имя и подписанный токен сессии, см. session_record); она переживает перезапуск бота.
         - В случае ошибки, например, неверного пароля или отсутствующего пользователя, сервер вернет сообщение об ошибке, которое будет отправлено пользователю.
     """
     username = context.user_data['username']
     password = update.message.text
-    session = requests.Session()
-    response = session.post(f'{BASE_URL}/login', data={'username': username, 'password': password})
+    response = await asyncio.to_thread(backend.post, '/login',
+                                       data={'username': username, 'password': password,
+                                             'chat_id': update.effective_chat.id})
 
     if response.status_code == 200:
-        auth_token = response.json().get('auth_token')
-        context.user_data['auth_token'] = auth_token
-        context.user_data['session'] = session
-        context.user_data['username'] = username
+        data = response.json()
+        context.user_data.clear()
+        context.user_data[SESSION_KEY] = session_record(data['user_id'], username, data['session_token'])
         await update.message.reply_text(
             "Login successful! Use /startgame to play online or /playlocal to play locally."
         )
@@ -130,10 +171,10 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def logout(update, context):
     """Handles user logout."""
-    session = context.user_data.get('session')
+    session = context.user_data.get(SESSION_KEY)
     if session:
-        response = session.get(f'{BASE_URL}/logout')  # Ensure this is the call being made
-        if response.status_code == 200:
+        response = await asyncio.to_thread(backend.get, '/logout', session)
+        if response.status_code in (200, 401):  # 401: сессия уже недействительна на сервере
             context.user_data.clear()
             await update.message.reply_text("You have been logged out.")
         else:
@@ -158,30 +199,27 @@ async def startgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     Примечания:
         - Если пользователь не авторизован (нет сессии), ему будет предложено сначала войти в систему.
+        - Токен для мини-приложения выдает сам бэкенд в ответе /start_game; бот не обращается к базе.
         - При успешном старте игры пользователю отправляется кнопка с ссылкой на страницу игры в мини-приложении.
+        - Контроль времени передается аргументом команды: /startgame 3+2 (предустановки см. backend.clock).
     
     Ошибки:
         - Если пользователь не авторизован, отправляется сообщение с просьбой войти в систему.
+        - Если сессия истекла или отозвана, запись о входе удаляется и пользователю предлагается войти снова.
         - Если при создании игры произошла ошибка, пользователю отправляется сообщение об ошибке.
     """
-    session = context.user_data.get('session')
+    session = context.user_data.get(SESSION_KEY)
     
     if not session:
         await update.message.reply_text("You need to /login first.")
         return
-    response = session.get(f'{BASE_URL}/start_game')
+    params = {'time_control': context.args[0]} if context.args else None
+    response = await asyncio.to_thread(backend.get, '/start_game', session, params=params)
     
     if response.status_code == 200:
         data = response.json()
         game_id = data['game_id']
-        username = context.user_data.get('username')
-        
-        with app.app_context():
-            user = User.query.filter_by(username=username).first()
-            if not user:
-                await update.message.reply_text("User not found.")
-                return
-            token = user.generate_auth_token()
+        token = data['auth_token']
 
         play_url = f'{FRONTEND_URL}/play?game_id={game_id}&token={token}&local=false'
         web_app = WebAppInfo(url=play_url)
@@ -190,6 +228,12 @@ async def startgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Game created! Use the MiniApp below to start playing:",
             reply_markup=InlineKeyboardMarkup.from_button(InlineKeyboardButton("Open Game", web_app=web_app))
         )
+    elif response.status_code == 401:
+        context.user_data.pop(SESSION_KEY, None)
+        await update.message.reply_text("Your session has expired. Please /login again.")
+    elif response.status_code == 400:
+        presets = ', '.join(response.json().get('presets', []))
+        await update.message.reply_text(f"Unknown time control. Use one of: {presets}")
     else:
         await update.message.reply_text("Error starting game.")
 
@@ -220,7 +264,7 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Ошибки:
         - Если запрос к серверу завершился с ошибкой, пользователю будет отправлено сообщение об ошибке.
     """
-    response = requests.get(f'{BASE_URL}/leaderboard')
+    response = await asyncio.to_thread(backend.get, '/leaderboard')
     
     if response.status_code == 200:
         data = response.json()
@@ -234,20 +278,165 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Error fetching leaderboard.")
 
 
+async def exportpgn(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обрабатывает команду /exportpgn и отправляет пользователю файл с его партиями в формате PGN.
+
+    Имя пользователя берется из аргумента команды (/exportpgn <username>), а если он не указан —
+    из данных вошедшего пользователя. Ответ сервера читается по частям во временный файл, который
+    переходит с памяти на диск при большом объеме, поэтому размер истории не влияет на память бота.
+
+    Аргументы:
+        update (Update): Объект обновления, содержащий информацию о сообщении от пользователя.
+        context (ContextTypes.DEFAULT_TYPE): Контекст команды с аргументами и данными пользователя.
+
+    Возвращает:
+        None
+
+    Ошибки:
+        - Если имя пользователя неизвестно, отправляется подсказка по использованию команды.
+        - Если запрос к серверу завершился с ошибкой, пользователю отправляется сообщение об ошибке.
+    """
+    session = context.user_data.get(SESSION_KEY)
+    username = context.args[0] if context.args else session and session['username']
+    if not username:
+        await update.message.reply_text("Usage: /exportpgn <username>, or /login first.")
+        return
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+        if not await asyncio.to_thread(download_pgn, username, buffer):
+            await update.message.reply_text("Error exporting games.")
+            return
+        if buffer.tell() == 0:
+            await update.message.reply_text("No finished games to export.")
+            return
+        buffer.seek(0)
+        await update.message.reply_document(document=buffer, filename=f'{username}.pgn')
+
+
+async def explorer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обрабатывает команду /explorer и показывает дебютный справочник для позиции.
+
+    Позиция задается ходами в нотации SAN после команды (например, "/explorer e4 e5 Nf3"); без
+    аргументов используется начальная позиция. Для каждого хода выводится количество партий,
+    результаты (+ победы белых, = ничьи, - победы черных) и средний рейтинг. Справочник доступен
+    только после входа и не во время своей партии (бэкенд отвечает 403): иначе он был бы подсказкой.
+
+    Аргументы:
+        update (Update): Объект обновления, содержащий информацию о сообщении от пользователя.
+        context (ContextTypes.DEFAULT_TYPE): Контекст команды с ходами в context.args.
+
+    Возвращает:
+        None
+
+    Ошибки:
+        - Если пользователь не вошел или сессия истекла, ему предлагается войти.
+        - Если у пользователя идет партия, справочник не показывается.
+        - Если ход недопустим, пользователю отправляется сообщение с этим ходом.
+        - Если запрос к серверу завершился с ошибкой, пользователю отправляется сообщение об ошибке.
+    """
+    session = context.user_data.get(SESSION_KEY)
+    if not session:
+        await update.message.reply_text("You need to /login first.")
+        return
+    board = chess.Board()
+    for san in context.args or []:
+        try:
+            board.push_san(san)
+        except ValueError:
+            await update.message.reply_text(f"Illegal move: {san}")
+            return
+
+    response = await asyncio.to_thread(backend.get, '/explorer', session, params={'fen': board.fen()})
+    if response.status_code == 401:
+        context.user_data.pop(SESSION_KEY, None)
+        await update.message.reply_text("Your session has expired. Please /login again.")
+        return
+    if response.status_code == 403:
+        await update.message.reply_text("The opening explorer is unavailable while you are playing a game.")
+        return
+    if response.status_code != 200:
+        await update.message.reply_text("Error fetching opening explorer.")
+        return
+
+    moves = response.json()['moves']
+    if not moves:
+        await update.message.reply_text("No games found for this position.")
+        return
+
+    text = "Opening explorer:\n"
+    for move in moves[:EXPLORER_MOVES_SHOWN]:
+        rating = move['average_rating'] if move['average_rating'] is not None else '-'
+        text += (f"{move['san']}: {move['games']} games "
+                 f"(+{move['white_wins']} ={move['draws']} -{move['black_wins']}), avg {rating}\n")
+    await update.message.reply_text(text)
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Operation cancelled.")
     return ConversationHandler.END
 
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+def configure_io_threads():
+    """
+    Задает пул потоков для блокирующих запросов к бэкенду (asyncio.to_thread).
+
+    Пул по умолчанию ограничен числом ядер и стал бы узким местом при параллельной обработке обновлений.
+    """
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BOT_IO_THREADS, thread_name_prefix='bot-io'))
+
+
+async def post_init(application):
+    """Запускается после инициализации бота: пул потоков и отправка уведомлений из outbox (если задан OUTBOX_SECRET)."""
+    configure_io_threads()
+    if OUTBOX_SECRET:
+        sender = application.bot_data['outbox_sender'] = OutboxSender(application.bot, backend)
+        sender.start()
+
+
+async def post_stop(application):
+    sender = application.bot_data.pop('outbox_sender', None)
+    if sender:
+        await sender.stop()
+
+
+def build_application(builder=None, update_processor=None):
+    """
+    Создает приложение бота со всеми обработчиками.
 
+    Обновления обрабатываются параллельно, но строго по порядку внутри каждого чата
+    (см. ChatOrderedUpdateProcessor), поэтому состояние ConversationHandler не нарушается.
+    Если в builder задано хранилище (persistence), диалоги регистрации и входа сохраняются в нем
+    вместе с записями о входе.
+
+    Аргументы:
+        builder (ApplicationBuilder, необязательный): Настроенный построитель (например, с другим
+            адресом Bot API); по умолчанию используется токен BOT_TOKEN.
+        update_processor (BaseUpdateProcessor, необязательный): Порядок обработки обновлений;
+            по умолчанию ChatOrderedUpdateProcessor с лимитами из BOT_MAX_RUNNING_UPDATES и BOT_MAX_PENDING_UPDATES.
+
+    Возвращает:
+        Application: Готовое к запуску приложение.
+    """
+    builder = builder or Application.builder().token(BOT_TOKEN)
+    update_processor = update_processor or ChatOrderedUpdateProcessor(BOT_MAX_RUNNING_UPDATES, BOT_MAX_PENDING_UPDATES)
+    application = (builder
+                   .concurrent_updates(update_processor)
+                   .post_init(post_init)
+                   .post_stop(post_stop)
+                   .build())
+
+    persistent = application.persistence is not None
     register_conv = ConversationHandler(
         entry_points=[CommandHandler('register', register)],
         states={
             REGISTER_USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, register_username)],
             REGISTER_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, register_password)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='register',
+        persistent=persistent,
     )
 
     login_conv = ConversationHandler(
@@ -256,7 +445,9 @@ def main():
             LOGIN_USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_username)],
             LOGIN_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, login_password)],
         },
-        fallbacks=[CommandHandler('cancel', cancel)]
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='login',
+        persistent=persistent,
     )
 
     application.add_handler(CommandHandler('start', start))
@@ -264,10 +455,45 @@ def main():
     application.add_handler(CommandHandler('logout', logout))
     application.add_handler(CommandHandler('startgame', startgame))
     application.add_handler(CommandHandler('playlocal', playlocal))
+    application.add_handler(CommandHandler('exportpgn', exportpgn))
+    application.add_handler(CommandHandler('explorer', explorer))
     application.add_handler(register_conv)
     application.add_handler(login_conv)
+    return application
+
+
+def make_persistence():
+    """
+    Создает локальное хранилище записей о входе и состояний диалогов (файл BOT_PERSISTENCE_PATH).
+
+    Сохраняются только user_data и диалоги; изменения копятся в памяти и записываются на диск
+    раз в BOT_PERSISTENCE_INTERVAL секунд и при остановке бота.
+    """
+    return PicklePersistence(
+        filepath=BOT_PERSISTENCE_PATH,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+        update_interval=BOT_PERSISTENCE_INTERVAL,
+    )
+
 
-    application.run_polling()
+def main():
+    """
+    Запускает бота: в режиме webhook, если задан BOT_WEBHOOK_URL, иначе в режиме long polling.
+
+    В режиме webhook встроенный сервер принимает обновления на BOT_WEBHOOK_LISTEN:BOT_WEBHOOK_PORT
+    по пути BOT_WEBHOOK_PATH и проверяет заголовок с секретом BOT_WEBHOOK_SECRET.
+    """
+    application = build_application(Application.builder().token(BOT_TOKEN).persistence(make_persistence()))
+    if BOT_WEBHOOK_URL:
+        application.run_webhook(
+            listen=BOT_WEBHOOK_LISTEN,
+            port=BOT_WEBHOOK_PORT,
+            url_path=BOT_WEBHOOK_PATH,
+            webhook_url=f"{BOT_WEBHOOK_URL.rstrip('/')}/{BOT_WEBHOOK_PATH}",
+            secret_token=BOT_WEBHOOK_SECRET,
+        )
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,93 @@
+# backend/bot_client.py
+
+from http import cookiejar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SESSION_KEY = 'session'  # ключ записи о входе в context.user_data
+BACKEND_TIMEOUT = 10  # секунд на запрос к бэкенду
+
+
+def session_record(user_id, username, token):
+    """
+    Запись о входе пользователя, которая хранится в user_data и сохраняется между перезапусками бота.
+
+    Аргументы:
+        user_id (int): Идентификатор пользователя на бэкенде.
+        username (str): Имя пользователя (для команд, которым оно нужно без запроса к бэкенду).
+        token (str): Подписанный токен сессии (см. User.generate_session_token).
+
+    Возвращает:
+        dict: Запись с ключами user_id, username и token.
+    """
+    return {'user_id': user_id, 'username': username, 'token': token}
+
+
+class NoCookies(cookiejar.DefaultCookiePolicy):
+    """Политика, не принимающая и не отправляющая cookie: клиент общий для всех пользователей бота."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class BackendClient:
+    """
+    Общий HTTP-клиент бота к бэкенду.
+
+    Одна сессия requests с пулом постоянных соединений обслуживает всех пользователей; пользователь
+    определяется только заголовком Authorization с токеном из его записи о входе. Cookie отключены,
+    чтобы сессия одного пользователя не попала в запросы другого. Методы блокирующие и потокобезопасные,
+    в обработчиках вызываются через asyncio.to_thread.
+    """
+
+    def __init__(self, base_url, pool_size=10, timeout=BACKEND_TIMEOUT, outbox_secret=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.outbox_secret = outbox_secret
+        self.http = requests.Session()
+        self.http.cookies.set_policy(NoCookies())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+
+    def request(self, method, path, session=None, **kwargs):
+        """
+        Выполняет запрос к бэкенду.
+
+        Аргументы:
+            method (str): HTTP-метод.
+            path (str): Путь относительно адреса бэкенда (например, '/leaderboard').
+            session (dict, необязательный): Запись о входе (session_record) для авторизованных запросов.
+            **kwargs: Параметры requests (params, data, stream и т.д.).
+
+        Возвращает:
+            requests.Response: Ответ бэкенда.
+        """
+        if session:
+            kwargs['headers'] = {**kwargs.get('headers', {}), 'Authorization': f"Bearer {session['token']}"}
+        kwargs.setdefault('timeout', self.timeout)
+        return self.http.request(method, f'{self.base_url}{path}', **kwargs)
+
+    def get(self, path, session=None, **kwargs):
+        return self.request('GET', path, session, **kwargs)
+
+    def post(self, path, session=None, **kwargs):
+        return self.request('POST', path, session, **kwargs)
+
+    def claim_notifications(self, limit):
+        """Забирает пачку уведомлений из outbox бэкенда (см. OutboxSender)."""
+        response = self.post('/outbox/claim', json={'limit': limit}, headers={'X-Outbox-Secret': self.outbox_secret})
+        response.raise_for_status()
+        return response.json()['notifications']
+
+    def ack_notifications(self, ids):
+        """Подтверждает отправку уведомлений, после чего бэкенд их удаляет."""
+        response = self.post('/outbox/ack', json={'ids': ids}, headers={'X-Outbox-Secret': self.outbox_secret})
+        response.raise_for_status()
+
+    def close(self):
+        self.http.close()
@@ -0,0 +1,75 @@
+# backend/bot_updates.py
+
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+MAX_RUNNING_UPDATES = 64  # обновлений, обрабатываемых одновременно
+MAX_PENDING_UPDATES = 4096  # обновлений в работе вместе с ожидающими своей очереди в чате
+
+
+def update_key(update):
+    """
+    Возвращает ключ очереди для обновления: чат, а если его нет — пользователь.
+
+    ConversationHandler хранит состояние по (чат, пользователь), поэтому последовательная обработка
+    обновлений одного чата исключает гонки между шагами диалога одного пользователя.
+    Для обновлений без чата и пользователя (и не-Update объектов) возвращается None.
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return 'chat', update.effective_chat.id
+    if update.effective_user is not None:
+        return 'user', update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений с сохранением порядка внутри каждого чата.
+
+    Обновления разных чатов обрабатываются одновременно (не более max_running), обновления одного
+    чата — строго по одному в порядке поступления. Ожидание своей очереди в чате не занимает место
+    среди выполняющихся, поэтому пользователь, приславший много сообщений подряд, не задерживает
+    остальных. Общее число обновлений в работе ограничено max_concurrent_updates.
+
+    Очереди чатов существуют только пока в чате есть необработанные обновления, поэтому память
+    зависит от числа активных чатов, а не от числа пользователей бота.
+    """
+
+    def __init__(self, max_running=MAX_RUNNING_UPDATES, max_concurrent_updates=MAX_PENDING_UPDATES):
+        super().__init__(max(max_concurrent_updates, max_running))
+        self.max_running = max_running
+        self._running = asyncio.Semaphore(max_running)
+        self._chats = {}  # ключ -> [блокировка, число обновлений чата в работе]
+
+    async def do_process_update(self, update, coroutine):
+        key = update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._running:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def __len__(self):
+        """Число чатов, у которых есть обновления в работе."""
+        return len(self._chats)
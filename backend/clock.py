@@ -0,0 +1,179 @@
+# backend/clock.py
+
+import time
+from array import array
+from datetime import datetime
+
+# Предустановленные контроли времени: название -> (категория, основное время в секундах, добавление в секундах).
+TIME_CONTROLS = {
+    '1+0': ('bullet', 60, 0),
+    '2+1': ('bullet', 120, 1),
+    '3+0': ('blitz', 180, 0),
+    '3+2': ('blitz', 180, 2),
+    '5+0': ('blitz', 300, 0),
+    '5+3': ('blitz', 300, 3),
+    '10+0': ('rapid', 600, 0),
+    '10+5': ('rapid', 600, 5),
+    '15+10': ('rapid', 900, 10),
+}
+DEFAULT_TIME_CONTROL = '10+0'
+MAX_LAG_COMPENSATION_MS = 1000  # не больше стольких миллисекунд задержки сети возвращается за ход
+LAG_SMOOTHING = 0.3  # вес нового замера в скользящей оценке задержки
+PREMOVE_TIME_MS = 100  # время, списываемое за предварительный ход (premove)
+PREMOVE_MARK = 2 ** 32 - 1  # записывается в move_times вместо времени предварительного хода
+MAX_MOVE_TIME_MS = PREMOVE_MARK - 1  # время хода хранится 32-битным беззнаковым числом
+
+
+def parse_time_control(value):
+    """
+    Разбирает контроль времени: название предустановки ('3+2') или формат PGN ('180+2').
+
+    Аргументы:
+        value (str): Контроль времени.
+
+    Возвращает:
+        tuple: (основное время, добавление за ход) в миллисекундах.
+
+    Ошибки:
+        ValueError: Неизвестная предустановка или неверный формат.
+    """
+    if value in TIME_CONTROLS:
+        _, base, increment = TIME_CONTROLS[value]
+        return base * 1000, increment * 1000
+    base, _, increment = str(value).partition('+')
+    base, increment = int(base), int(increment or 0)
+    if base <= 0 or increment < 0:
+        raise ValueError(f'Invalid time control: {value}')
+    return base * 1000, increment * 1000
+
+
+def pgn_time_control(value):
+    """Контроль времени в формате PGN ('180+2') для предустановки или строки PGN."""
+    base, increment = parse_time_control(value)
+    return f'{base // 1000}+{increment // 1000}'
+
+
+def increment_ms(time_control):
+    """Добавление за ход в миллисекундах; для партий без контроля времени ('-', None) — 0."""
+    try:
+        return parse_time_control(time_control)[1]
+    except (TypeError, ValueError):
+        return 0
+
+
+def charge_move(time_left_ms, elapsed_ms, lag_ms, increment_ms):
+    """
+    Списывает с часов игрока время хода.
+
+    Из прошедшего на сервере времени вычитается оценка задержки сети (не больше
+    MAX_LAG_COMPENSATION_MS и не больше самого хода), после хода добавляется increment_ms.
+
+    Возвращает:
+        tuple: (оставшееся время в миллисекундах, флаг падения): при падении флажка время 0 и добавления нет.
+    """
+    remaining = time_left_ms - think_time_ms(elapsed_ms, lag_ms)
+    if remaining <= 0:
+        return 0, True
+    return remaining + increment_ms, False
+
+
+def think_time_ms(elapsed_ms, lag_ms):
+    """Время обдумывания хода: прошедшее на сервере время за вычетом компенсации задержки сети."""
+    return max(0, elapsed_ms - min(lag_ms, MAX_LAG_COMPENSATION_MS))
+
+
+def append_move_time(move_times, time_ms):
+    """
+    Добавляет время хода к временам ходов партии.
+
+    Времена хранятся одной строкой байтов (array('I'), 4 байта на полуход) в том же порядке, что и ходы.
+    Предварительный ход записывается меткой PREMOVE_MARK: его время не обдумывалось, а назначено.
+
+    Аргументы:
+        move_times (bytes): Времена предыдущих ходов или None.
+        time_ms (int): Время хода в миллисекундах или None для предварительного хода.
+    """
+    time_ms = PREMOVE_MARK if time_ms is None else min(time_ms, MAX_MOVE_TIME_MS)
+    return (move_times or b'') + array('I', [time_ms]).tobytes()
+
+
+def unpack_move_times(move_times):
+    """Времена ходов партии в миллисекундах (array('I'))."""
+    times = array('I')
+    times.frombytes(move_times or b'')
+    return times
+
+
+class TurnTimer:
+    """
+    Отсчет времени текущего хода по монотонным часам процесса.
+
+    Момент начала хода хранится для каждой комнаты в памяти; переводы системных часов на него не
+    влияют. Если отметки нет (перезапуск процесса, партию вел другой процесс), начало хода
+    восстанавливается один раз по сохраненному в партии времени последнего хода.
+
+    Аргументы:
+        clock (callable): Источник монотонного времени в секундах.
+        wall_clock (callable): Текущее время UTC (для восстановления по last_move_time).
+    """
+
+    def __init__(self, clock=time.monotonic, wall_clock=datetime.utcnow):
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.started = {}  # комната -> монотонное время начала текущего хода
+
+    def start(self, room):
+        self.started[room] = self.clock()
+
+    def elapsed_ms(self, room, last_move_time):
+        """Миллисекунд с начала текущего хода."""
+        started = self.started.get(room)
+        if started is None:
+            since = max(0.0, (self.wall_clock() - last_move_time).total_seconds()) if last_move_time else 0.0
+            started = self.started[room] = self.clock() - since
+        return round((self.clock() - started) * 1000)
+
+    def discard(self, room):
+        self.started.pop(room, None)
+
+
+class LagTracker:
+    """
+    Оценка сетевой задержки игроков по замерам сервера.
+
+    После каждого хода сервер отправляет в комнату clock_ping и засекает время; клиент сразу отвечает
+    clock_pong. Время ответа — полный круг до клиента и обратно: именно столько сервер засчитывает
+    игроку сверх его раздумья (ход доходит до игрока и ответ возвращается). Оценка сглаживается
+    (LAG_SMOOTHING), поэтому одна задержанная посылка мало ее меняет.
+
+    Аргументы:
+        clock (callable): Источник монотонного времени в секундах.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.pings = {}  # комната -> монотонное время отправки clock_ping
+        self.estimates = {}  # (комната, user_id) -> оценка времени круга, мс
+
+    def ping(self, room):
+        self.pings[room] = self.clock()
+
+    def pong(self, room, user_id):
+        """Учитывает ответ игрока на последний clock_ping комнаты; возвращает новую оценку или None."""
+        sent = self.pings.get(room)
+        if sent is None:
+            return None
+        sample = (self.clock() - sent) * 1000
+        key = (room, user_id)
+        previous = self.estimates.get(key)
+        estimate = sample if previous is None else previous + LAG_SMOOTHING * (sample - previous)
+        self.estimates[key] = estimate
+        return estimate
+
+    def lag_ms(self, room, user_id):
+        return int(self.estimates.get((room, user_id), 0))
+
+    def discard(self, room):
+        self.pings.pop(room, None)
+        for key in [key for key in self.estimates if key[0] == room]:
+            del self.estimates[key]
@@ -0,0 +1,173 @@
+# backend/db_profile.py
+
+import threading
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from backend.db_threads import DriverThreadPool, GreenQueuePool, install_driver_threads
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 20
+DEFAULT_POOL_TIMEOUT = 30  # секунд ожидания свободного соединения
+DEFAULT_POOL_RECYCLE = 1800  # секунд, после которых соединение с сервером БД пересоздается
+DEFAULT_SQLITE_BUSY_TIMEOUT = 5000  # миллисекунд ожидания блокировки SQLite
+
+
+def is_memory_sqlite(sa_url):
+    """Проверяет, указывает ли адрес на базу SQLite в памяти."""
+    return sa_url.drivername.startswith('sqlite') and sa_url.database in (None, '', ':memory:')
+
+
+def engine_options(sa_url, config, options=None):
+    """
+    Дополняет параметры create_engine профилем пула для данной базы.
+
+    - SQLite в памяти не меняется (Flask-SQLAlchemy использует для нее StaticPool).
+    - Файл SQLite получает пул постоянных соединений вместо NullPool и ожидание блокировки
+      на уровне драйвера; режим журнала настраивается отдельно (install_sqlite_pragmas).
+    - Серверные базы получают размер пула, переполнение, pre-ping и пересоздание соединений.
+    - При DB_THREADS > 0 пул ждет соединения кооперативно (GreenQueuePool), а вызовы драйвера
+      выполняются в пуле потоков (см. ProfiledSQLAlchemy.create_engine).
+
+    Аргументы:
+        sa_url (sqlalchemy.engine.URL): Адрес базы.
+        config (dict): Конфигурация приложения (ключи DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+            DB_POOL_RECYCLE, SQLITE_BUSY_TIMEOUT, DB_THREADS; отсутствующие заменяются значениями
+            по умолчанию).
+        options (dict, необязательный): Уже собранные параметры, которые нужно дополнить.
+
+    Возвращает:
+        dict: Параметры для sqlalchemy.create_engine.
+    """
+    options = dict(options or {})
+    if is_memory_sqlite(sa_url):
+        return options
+    pool_size = config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)
+    max_overflow = config.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)
+    pool_timeout = config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
+    if sa_url.drivername.startswith('sqlite'):
+        busy_timeout = config.get('SQLITE_BUSY_TIMEOUT', DEFAULT_SQLITE_BUSY_TIMEOUT)
+        options['poolclass'] = QueuePool
+        connect_args = options.setdefault('connect_args', {})
+        connect_args['timeout'] = busy_timeout / 1000
+        connect_args['check_same_thread'] = False  # соединение из пула может достаться другому потоку
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = config.get('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE)
+    if config.get('DB_THREADS', 0) > 0:
+        options['poolclass'] = GreenQueuePool
+    options['pool_size'] = pool_size
+    options['max_overflow'] = max_overflow
+    options['pool_timeout'] = pool_timeout
+    return options
+
+
+def install_sqlite_pragmas(engine, busy_timeout=DEFAULT_SQLITE_BUSY_TIMEOUT):
+    """
+    Настраивает каждое новое соединение с файлом SQLite.
+
+    WAL позволяет читать во время записи (читатели больше не блокируют писателя), busy_timeout
+    заставляет ждать блокировку вместо немедленной ошибки "database is locked", а synchronous=NORMAL
+    в режиме WAL убирает fsync на каждом коммите, сохраняя целостность базы при сбое процесса.
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+def install_engine_profile(engine, sa_url, engine_opts, driver_threads=None):
+    """
+    Настраивает созданный движок по параметрам из engine_options: PRAGMA для файла SQLite и,
+    если выбран GreenQueuePool, выполнение вызовов драйвера в пуле потоков driver_threads.
+    """
+    threaded = engine_opts.get('poolclass') is GreenQueuePool
+    if sa_url.drivername.startswith('sqlite') and not is_memory_sqlite(sa_url):
+        # Ожидание блокировки драйвера (секунды) и PRAGMA busy_timeout (миллисекунды) совпадают;
+        # в пуле потоков блокировку ждет гринлет, а не драйвер (см. DriverCalls).
+        timeout = engine_opts.get('connect_args', {}).get('timeout', DEFAULT_SQLITE_BUSY_TIMEOUT / 1000)
+        install_sqlite_pragmas(engine, 0 if threaded else timeout * 1000)
+        if threaded:
+            install_driver_threads(engine, driver_threads, busy_timeout=timeout)
+    elif threaded:
+        install_driver_threads(engine, driver_threads)
+
+
+class PoolStats:
+    """Счетчики событий пула одного движка (открытые, выданные и возвращенные соединения)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def snapshot(self):
+        """Возвращает текущее состояние пула и счетчики в виде словаря."""
+        pool = self.engine.pool
+        data = {
+            'dialect': self.engine.dialect.name,
+            'pool': type(pool).__name__,
+            'connects': self.connects,
+            'checkouts': self.checkouts,
+            'checkins': self.checkins,
+        }
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                        overflow=pool.overflow())
+        return data
+
+
+class ProfiledSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy с профилем соединений из конфигурации приложения.
+
+    Параметры пула подставляются для каждой базы (основной и привязанных через SQLALCHEMY_BINDS)
+    по ее адресу; явные SQLALCHEMY_ENGINE_OPTIONS по-прежнему имеют приоритет. При DB_THREADS > 0
+    блокирующие вызовы драйвера всех баз (кроме SQLite в памяти) выполняются в общем пуле из
+    DB_THREADS системных потоков (DriverThreadPool), не останавливая цикл событий gevent.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_stats = {}
+        self.driver_threads = None
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        threads = app.config.get('DB_THREADS', 0)
+        if threads > 0 and (self.driver_threads is None or self.driver_threads.size != threads):
+            self.driver_threads = DriverThreadPool(threads)
+        return sa_url, engine_options(sa_url, app.config, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        install_engine_profile(engine, sa_url, engine_opts, self.driver_threads)
+        # Движок пересоздается при смене адреса, поэтому счетчики хранятся по адресу базы.
+        self.pool_stats[sa_url.render_as_string(hide_password=True)] = PoolStats(engine)
+        return engine
+
+    def pool_status(self):
+        """Возвращает состояние пулов всех созданных движков (для мониторинга)."""
+        return {url: stats.snapshot() for url, stats in self.pool_stats.items()}
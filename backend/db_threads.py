@@ -0,0 +1,294 @@
+# backend/db_threads.py
+
+import functools
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import gevent
+from gevent.event import Event
+from gevent.lock import BoundedSemaphore, Semaphore
+from gevent.threadpool import ThreadPool
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_DB_THREADS = 8  # потоков для блокирующих вызовов драйвера БД
+BUSY_RETRY_DELAYS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05)  # паузы между попытками взять блокировку SQLite, секунды
+
+
+class DriverThreadPool:
+    """
+    Пул системных потоков (gevent.threadpool) для блокирующих вызовов драйвера БД.
+
+    Вызов run приостанавливает только текущий гринлет: пока драйвер выполняет запрос или ждет
+    fsync при коммите в системном потоке, цикл событий gevent обслуживает остальные соединения.
+    Число потоков ограничено size; лишние вызовы ждут свободный поток в очереди пула, тоже не
+    блокируя цикл событий. Пул создается при первом вызове, в потоке, где работает цикл событий.
+    """
+
+    def __init__(self, size=DEFAULT_DB_THREADS):
+        self.size = size
+        self.calls = 0
+        self._pool = None
+
+    def run(self, func, *args, **kwargs):
+        if self._pool is None:
+            self._pool = ThreadPool(self.size)
+        self.calls += 1
+        ok, result = self._pool.apply(_capture, (func, args, kwargs))
+        if not ok:
+            raise result
+        return result
+
+    def snapshot(self):
+        """Состояние пула для мониторинга."""
+        return {'threads': self.size, 'pending': len(self._pool) if self._pool is not None else 0,
+                'calls': self.calls}
+
+
+def _capture(func, args, kwargs):
+    # Ошибку драйвера поднимает вызвавший гринлет; иначе gevent печатал бы каждую (в том числе
+    # ожидаемую SQLITE_BUSY) в поток ошибок как необработанную.
+    try:
+        return True, func(*args, **kwargs)
+    except Exception as e:
+        return False, e
+
+
+def is_sqlite_busy(error):
+    """Занята ли база SQLite другим соединением (SQLITE_BUSY; повтор запроса может пройти)."""
+    return (isinstance(error, sqlite3.OperationalError)
+            and getattr(error, 'sqlite_errorcode', sqlite3.SQLITE_BUSY) == sqlite3.SQLITE_BUSY)
+
+
+class WriteQueue:
+    """
+    Очередь соединений одного движка SQLite, ждущих блокировку записи.
+
+    SQLite пускает писателей по одному. Соединение, получившее SQLITE_BUSY, встает в очередь turn
+    (по порядку прихода), и повторяет запрос только первое в очереди — после того как какое-нибудь
+    соединение движка завершит транзакцию (released) или, для блокировок других процессов, после
+    паузы из BUSY_RETRY_DELAYS. Без очереди все ждущие опрашивали бы базу одновременно, занимая
+    потоки пула и получая блокировку в случайном порядке.
+    """
+
+    def __init__(self):
+        self.turn = Semaphore()
+        self._released = Event()
+
+    def released(self):
+        """Соединение движка завершило транзакцию: блокировка записи, возможно, свободна."""
+        event, self._released = self._released, Event()
+        event.set()
+
+    def wait(self, timeout):
+        self._released.wait(timeout)
+
+
+class DriverCalls:
+    """
+    Выполнение вызовов одного соединения в пуле потоков.
+
+    Для SQLite (задана очередь writers) ожидание блокировки базы тоже идет в гринлете: драйвер
+    возвращает SQLITE_BUSY сразу (PRAGMA busy_timeout=0), а вызов повторяется в порядке очереди
+    WriteQueue, пока не истечет busy_timeout секунд. Если бы драйвер ждал блокировку сам, ожидающие
+    соединения заняли бы все потоки пула, и COMMIT соединения, которое держит блокировку, стоял бы
+    в очереди за ними до истечения их ожидания.
+    """
+
+    __slots__ = ('threads', 'busy_timeout', 'writers', 'queued')
+
+    def __init__(self, threads, busy_timeout=None, writers=None):
+        self.threads = threads
+        self.busy_timeout = busy_timeout
+        self.writers = writers
+        self.queued = False  # соединение заняло очередь writers.turn до конца своей транзакции
+
+    def __call__(self, func, *args, **kwargs):
+        try:
+            return self.threads.run(func, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if self.writers is None or not is_sqlite_busy(e):
+                raise
+        deadline = time.monotonic() + self.busy_timeout
+        if not self.queued:
+            if not self.writers.turn.acquire(timeout=self.busy_timeout):
+                raise sqlite3.OperationalError('database is locked')
+            self.queued = True
+        attempt = 0
+        while True:
+            try:
+                return self.threads.run(func, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                remaining = deadline - time.monotonic()
+                if not is_sqlite_busy(e) or remaining <= 0:
+                    self.leave()
+                    raise
+            self.writers.wait(min(BUSY_RETRY_DELAYS[min(attempt, len(BUSY_RETRY_DELAYS) - 1)], remaining))
+            attempt += 1
+
+    def end(self, func, *args, **kwargs):
+        """Вызов, завершающий транзакцию (commit, rollback, close): освобождает очередь писателей."""
+        try:
+            return self(func, *args, **kwargs)
+        finally:
+            if self.writers is not None:
+                self.leave()
+                self.writers.released()
+
+    def leave(self):
+        if self.queued:
+            self.queued = False
+            self.writers.turn.release()
+
+
+class ThreadedCursor:
+    """Курсор DBAPI, блокирующие методы которого выполняются через DriverCalls."""
+
+    BLOCKING = frozenset(('execute', 'executemany', 'fetchone', 'fetchmany', 'fetchall', 'close', 'callproc',
+                          'nextset'))
+
+    def __init__(self, cursor, calls):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_calls', calls)
+
+    def __getattr__(self, name):
+        value = getattr(self._cursor, name)
+        if name in self.BLOCKING:
+            return functools.partial(self._calls, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class ThreadedConnection:
+    """
+    Соединение DBAPI, блокирующие методы которого (и методы его курсоров) выполняются через
+    DriverCalls. Остальные атрибуты передаются исходному соединению без изменений.
+    """
+
+    BLOCKING = frozenset(('execute', 'executemany', 'executescript'))
+    ENDING = frozenset(('commit', 'rollback', 'close'))
+
+    def __init__(self, connection, calls):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_calls', calls)
+
+    def cursor(self, *args, **kwargs):
+        return ThreadedCursor(self._connection.cursor(*args, **kwargs), self._calls)
+
+    def __getattr__(self, name):
+        value = getattr(self._connection, name)
+        if name in self.BLOCKING:
+            return functools.partial(self._calls, value)
+        if name in self.ENDING:
+            return functools.partial(self._calls.end, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+
+class GreenQueuePool(QueuePool):
+    """
+    QueuePool, в котором ожидание свободного соединения не блокирует цикл событий gevent.
+
+    QueuePool ждет соединение на системной блокировке; пока драйвер работал в потоке сервера,
+    гринлет с соединением не уступал управление, и до ожидания почти не доходило. С DriverThreadPool
+    каждый запрос уступает управление, поэтому соединения одновременно держат многие гринлеты, и ожидание
+    на системной блокировке остановило бы весь процесс вместе с гринлетами, которые должны вернуть
+    соединения. Здесь очередь за соединением — семафор gevent на pool_size + max_overflow мест, так что
+    сам QueuePool никогда не ждет.
+    """
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, timeout=30.0, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, timeout=timeout, **kw)
+        self._gate = BoundedSemaphore(pool_size + max_overflow) if max_overflow >= 0 else None
+
+    def _do_get(self):
+        if self._gate is not None and not self._gate.acquire(timeout=self._timeout):
+            raise exc.TimeoutError(
+                f'GreenQueuePool limit of size {self.size()} overflow {self._max_overflow} reached, '
+                f'connection timed out, timeout {self._timeout:0.2f}')
+        try:
+            return super()._do_get()
+        except BaseException:
+            if self._gate is not None:
+                self._gate.release()
+            raise
+
+    def _do_return_conn(self, conn):
+        try:
+            super()._do_return_conn(conn)
+        finally:
+            if self._gate is not None:
+                self._gate.release()
+
+
+def install_driver_threads(engine, threads, busy_timeout=None):
+    """
+    Переводит соединения движка (установку и все блокирующие вызовы) в пул потоков threads.
+
+    Аргументы:
+        busy_timeout (float, необязательный): Для SQLite — сколько секунд ждать блокировку базы
+            (кооперативно, в очереди WriteQueue, см. DriverCalls); у самого драйвера ожидание должно
+            быть выключено (install_sqlite_pragmas с busy_timeout=0).
+    """
+    writers = WriteQueue() if busy_timeout is not None else None
+
+    @event.listens_for(engine, 'do_connect')
+    def connect_in_thread(dialect, connection_record, cargs, cparams):
+        calls = DriverCalls(threads, busy_timeout, writers)
+        return ThreadedConnection(calls(dialect.connect, *cargs, **cparams), calls)
+
+
+class EventScopes:
+    """
+    Явные границы сессии для событий Socket.IO.
+
+    Событие, обернутое в scope (или декоратор scoped), работает со своей сессией, которая закрывается
+    при выходе из события (незакоммиченные изменения откатываются, соединение возвращается в пул), —
+    независимо от того, завершился ли контекст приложения. События одной партии выполняются по одному:
+    пока запросы события ждут пул потоков, другие гринлеты работают, и без очереди два хода одной партии
+    могли бы чередоваться между чтением и записью.
+
+    Аргументы:
+        session (scoped_session): Сессия с областью видимости гринлета (db.session).
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._queues = {}  # ключ -> [семафор, число событий, ждущих или выполняющихся]
+
+    @contextmanager
+    def scope(self, key=None):
+        queue = None
+        if key is not None:
+            queue = self._queues.setdefault(key, [Semaphore(), 0])
+            queue[1] += 1
+            queue[0].acquire()
+        try:
+            yield
+        finally:
+            try:
+                self.session.remove()
+            finally:
+                if queue is not None:
+                    queue[0].release()
+                    queue[1] -= 1
+                    if not queue[1]:
+                        del self._queues[key]
+
+    def scoped(self, handler):
+        """Декоратор обработчика: scope с ключом data['game_id'], если событие относится к партии."""
+        @functools.wraps(handler)
+        def wrapper(*args):
+            data = args[0] if args and isinstance(args[0], dict) else {}
+            game_id = data.get('game_id')
+            with self.scope(str(game_id) if game_id else None):
+                return handler(*args)
+        return wrapper
@@ -0,0 +1,127 @@
+# backend/eco.py
+
+import csv
+import functools
+import json
+import os
+
+import chess
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+ECO_SOURCE_PATH = os.path.join(DATA_DIR, 'eco.tsv')  # исходная таблица: код, название, ходы в SAN
+# В репозитории лежит сокращенная таблица (основные системы каждого раздела A–E). Полную таблицу
+# A00–E99 с вариантами (например, файлы a.tsv … e.tsv из lichess-org/chess-openings, столбцы те же)
+# подключает "flask build-eco --source <файл или каталог>".
+ECO_TRIE_PATH = os.path.join(DATA_DIR, 'eco.trie.json')  # собранное дерево (см. build_trie)
+NO_LABEL = -1
+MAX_DEPTH = 40  # полуходов, дальше которых дерево не заходит
+
+
+def iter_openings(source_path=ECO_SOURCE_PATH):
+    """
+    Читает таблицу дебютов.
+
+    Возвращает:
+        generator: Тройки (код ECO, название, список ходов в UCI).
+
+    Исключения:
+        ValueError: Если в строке таблицы есть невозможный ход.
+    """
+    with open(source_path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            board = chess.Board()
+            moves = []
+            for token in row['pgn'].split():
+                if token.endswith('.'):
+                    continue  # номер хода
+                moves.append(board.push_san(token).uci())
+            yield row['eco'], row['name'], moves
+
+
+def source_files(paths):
+    """
+    Раскрывает список источников таблицы дебютов.
+
+    Аргументы:
+        paths (iterable): Пути к файлам .tsv или к каталогам с ними.
+
+    Возвращает:
+        list: Пути к файлам; файлы каталога идут в порядке имен (a.tsv … e.tsv).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith('.tsv'))
+        else:
+            files.append(path)
+    return files
+
+
+def build_trie(sources=(ECO_SOURCE_PATH,), trie_path=ECO_TRIE_PATH):
+    """
+    Собирает дерево дебютов из таблиц и сохраняет его в компактном виде.
+
+    Узел дерева — пара [номер метки или -1, {ход UCI: дочерний узел}], метки (код и название)
+    хранятся один раз в отдельном списке. Файл пишется без пробелов и читается одним json.load.
+
+    Аргументы:
+        sources (iterable, необязательный): Файлы таблиц или каталоги с ними (см. source_files).
+            Если одна и та же линия встречается несколько раз, остается последняя метка.
+        trie_path (str, необязательный): Путь к файлу дерева.
+
+    Возвращает:
+        int: Количество дебютов в дереве.
+    """
+    labels = []
+    label_ids = {}
+    root = [NO_LABEL, {}]
+    count = 0
+    for eco, name, moves in (opening for path in source_files(sources) for opening in iter_openings(path)):
+        node = root
+        for uci in moves:
+            node = node[1].setdefault(uci, [NO_LABEL, {}])
+        if (eco, name) not in label_ids:
+            label_ids[(eco, name)] = len(labels)
+            labels.append([eco, name])
+        node[0] = label_ids[(eco, name)]
+        count += 1
+    tmp_path = f'{trie_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'labels': labels, 'root': root}, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, trie_path)
+    return count
+
+
+@functools.lru_cache(maxsize=None)
+def load_trie(trie_path=ECO_TRIE_PATH):
+    """Загружает дерево дебютов; файл читается один раз на процесс (и на процесс-обработчик импорта)."""
+    with open(trie_path, encoding='utf-8') as f:
+        data = json.load(f)
+    return [tuple(label) for label in data['labels']], data['root']
+
+
+def classify(uci_moves, trie_path=ECO_TRIE_PATH):
+    """
+    Определяет дебют партии по самому длинному совпадению начала партии с деревом.
+
+    Проход по дереву останавливается на первом ходе, которого в дереве нет, поэтому для длинной
+    партии просматривается только ее дебютная часть.
+
+    Аргументы:
+        uci_moves (str): Ходы в формате UCI через пробел (поле "Game.moves").
+        trie_path (str, необязательный): Путь к файлу дерева.
+
+    Возвращает:
+        tuple: (код ECO, название) или (None, None), если не совпал даже первый ход.
+    """
+    labels, node = load_trie(trie_path)
+    best = None
+    for uci in uci_moves.split(maxsplit=MAX_DEPTH)[:MAX_DEPTH]:
+        node = node[1].get(uci)
+        if node is None:
+            break
+        if node[0] != NO_LABEL:
+            best = node[0]
+    return labels[best] if best is not None else (None, None)
+
@@ -0,0 +1,188 @@
+# backend/explorer.py
+
+import chess
+from sqlalchemy import tuple_, update
+from backend.models import db, OpeningStat
+from backend.position_index import position_hash
+
+EXPLORER_DEPTH = 30  # полуходов каждой партии, которые попадают в справочник
+RESULT_INDEX = {'white': 0, 'draw': 1, 'black': 2}  # порядок счетчиков в приращениях
+FLUSH_KEYS = 100000  # ключей в памяти при полной перестройке до записи в базу
+KEY_SLICE = 400  # ключей в одном запросе (лимит параметров SQLite)
+
+
+def signed_hash(board):
+    """Хеш Зобриста позиции в знаковом 64-битном виде (для колонки BIGINT)."""
+    key = position_hash(board)
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+def game_average_rating(game):
+    """Средний рейтинг партии или None, если рейтинг одного из игроков неизвестен."""
+    if game.white_elo is None or game.black_elo is None:
+        return None
+    return (game.white_elo + game.black_elo) // 2
+
+
+def iter_opening_moves(uci_moves, depth=EXPLORER_DEPTH):
+    """Возвращает пары (хеш позиции перед ходом, ход UCI) для первых depth полуходов партии."""
+    board = chess.Board()
+    for uci in uci_moves.split()[:depth]:
+        yield signed_hash(board), uci
+        board.push(chess.Move.from_uci(uci))
+
+
+def game_deltas(game, depth=EXPLORER_DEPTH):
+    """
+    Считает приращения статистики для одной партии.
+
+    Возвращает:
+        dict: {(хеш позиции, ход): [белые выиграли, ничьи, черные выиграли, сумма рейтингов, партий с рейтингом]}
+        Пустой словарь, если у партии нет результата.
+    """
+    if game.result not in RESULT_INDEX:
+        return {}
+    column = RESULT_INDEX[game.result]
+    rating = game_average_rating(game)
+    deltas = {}
+    for key in iter_opening_moves(game.moves or '', depth):
+        if key in deltas:
+            continue  # повтор позиции внутри партии учитывается один раз
+        delta = deltas[key] = [0, 0, 0, 0, 0]
+        delta[column] += 1
+        if rating is not None:
+            delta[3] += rating
+            delta[4] += 1
+    return deltas
+
+
+COUNTERS = ('white_wins', 'draws', 'black_wins', 'rating_sum', 'rated_games')  # порядок как в приращениях
+
+
+def upsert_statement(dialect_name):
+    """
+    INSERT в opening_stat, который при существующем ключе прибавляет значения к счетчикам строки.
+
+    Возвращает:
+        Insert: Выражение для массовой вставки или None, если база не поддерживает такую вставку.
+    """
+    table = OpeningStat.__table__
+    if dialect_name in ('sqlite', 'postgresql'):
+        if dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.position_hash, table.c.move],
+            set_={name: table.c[name] + statement.excluded[name] for name in COUNTERS})
+    if dialect_name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        return statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in COUNTERS})
+    return None
+
+
+def apply_deltas(deltas):
+    """
+    Прибавляет приращения к таблице opening_stat. Коммит выполняет вызывающая функция.
+
+    Строки пишутся одной массовой вставкой с обновлением при конфликте ключа ("колонка = колонка + n",
+    без чтения значений в Python). Поэтому две партии, одновременно завершившиеся в разных процессах
+    и дошедшие до новой позиции, не сталкиваются на первичном ключе: вторая вставка прибавит свои
+    счетчики к строке первой. Для баз без такой вставки существующие ключи находятся запросом
+    и обновляются, остальные вставляются.
+    """
+    if not deltas:
+        return
+    rows = [{'position_hash': key[0], 'move': key[1], **dict(zip(COUNTERS, delta))} for key, delta in deltas.items()]
+    statement = upsert_statement(db.engine.dialect.name)
+    if statement is not None:
+        db.session.execute(statement, rows)
+        return
+
+    keys = list(deltas)
+    for i in range(0, len(keys), KEY_SLICE):
+        part = keys[i:i + KEY_SLICE]
+        existing = set(db.session.query(OpeningStat.position_hash, OpeningStat.move)
+                       .filter(tuple_(OpeningStat.position_hash, OpeningStat.move).in_(part)))
+        new_rows = []
+        for key in part:
+            if key in existing:
+                db.session.execute(
+                    update(OpeningStat)
+                    .where(OpeningStat.position_hash == key[0], OpeningStat.move == key[1])
+                    .values({name: getattr(OpeningStat, name) + value for name, value in zip(COUNTERS, deltas[key])})
+                )
+            else:
+                new_rows.append({'position_hash': key[0], 'move': key[1], **dict(zip(COUNTERS, deltas[key]))})
+        if new_rows:
+            db.session.execute(OpeningStat.__table__.insert(), new_rows)
+
+
+def record_game(game):
+    """Добавляет завершенную партию в дебютный справочник (вызывается при окончании партии)."""
+    apply_deltas(game_deltas(game))
+
+
+def rebuild(games):
+    """
+    Полностью перестраивает справочник по всем партиям.
+
+    Приращения копятся в памяти и сбрасываются в базу пачками по FLUSH_KEYS ключей, каждая пачка
+    в своей транзакции.
+
+    Аргументы:
+        games (iterable): Завершенные партии (Game или ArchivedGame).
+
+    Возвращает:
+        int: Количество обработанных партий.
+    """
+    OpeningStat.query.delete()
+    db.session.commit()
+    pending = {}
+    processed = 0
+    for game in games:
+        for key, delta in game_deltas(game).items():
+            total = pending.setdefault(key, [0, 0, 0, 0, 0])
+            for i, value in enumerate(delta):
+                total[i] += value
+        processed += 1
+        if len(pending) >= FLUSH_KEYS:
+            apply_deltas(pending)
+            db.session.commit()
+            pending = {}
+    apply_deltas(pending)
+    db.session.commit()
+    return processed
+
+
+def explore(board):
+    """
+    Возвращает ходы, сыгранные из позиции, со статистикой результатов.
+
+    Аргументы:
+        board (chess.Board): Позиция.
+
+    Возвращает:
+        list: Словари с ключами 'uci', 'san', 'games', 'white_wins', 'draws', 'black_wins' и
+              'average_rating', отсортированные по числу партий.
+    """
+    rows = OpeningStat.query.filter_by(position_hash=signed_hash(board)).all()
+    moves = []
+    for row in rows:
+        move = chess.Move.from_uci(row.move)
+        if move not in board.legal_moves:
+            continue  # коллизия хеша
+        moves.append({
+            'uci': row.move,
+            'san': board.san(move),
+            'games': row.white_wins + row.draws + row.black_wins,
+            'white_wins': row.white_wins,
+            'draws': row.draws,
+            'black_wins': row.black_wins,
+            'average_rating': row.rating_sum // row.rated_games if row.rated_games else None,
+        })
+    moves.sort(key=lambda item: item['games'], reverse=True)
+    return moves
@@ -0,0 +1,263 @@
+# backend/fairplay.py
+
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count, islice
+
+import chess
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для отчета fairplay-report, игровой сервер работает без него
+    np = None
+
+from backend.clock import PREMOVE_MARK, parse_time_control, unpack_move_times
+
+OPENING_PLIES = 10  # первые полуходы партии (заученный дебют) не учитываются
+EXPECTED_MOVES = 40  # ходов игрока в партии для оценки общего времени партии (основное + 40 добавлений)
+CHUNK_MOVES = 1 << 20  # ходов, накапливаемых в буферах перед векторной сверткой
+GAME_BATCH = 200  # партий в одной задаче для процесса, оценивающего сложность позиций
+MIN_MOVES = 200  # меньше ходов — статистика игрока не оценивается
+SUSPICIOUS_CV = 0.35  # коэффициент вариации времени хода ниже этого — время подозрительно ровное
+SUSPICIOUS_CORRELATION = 0.05  # корреляция времени хода со сложностью позиции ниже этого — не зависит от позиции
+
+
+def time_budget_ms(time_control):
+    """
+    Оценка общего времени игрока на партию: основное время и добавления за EXPECTED_MOVES ходов.
+
+    Возвращает:
+        int: Миллисекунды или None для партий без контроля времени.
+    """
+    try:
+        base, increment = parse_time_control(time_control)
+    except (TypeError, ValueError):
+        return None
+    return base + EXPECTED_MOVES * increment
+
+
+def position_complexity(uci_moves):
+    """
+    Сложность позиций партии, в которых делались учитываемые ходы (после OPENING_PLIES полуходов).
+
+    Возвращает:
+        bytes: Число допустимых ходов в каждой позиции (array('H')).
+    """
+    board = chess.Board()
+    complexity = array('H')
+    for ply, uci in enumerate(uci_moves.split()):
+        if ply >= OPENING_PLIES:
+            complexity.append(board.legal_moves.count())
+        board.push(chess.Move.from_uci(uci))
+    return complexity.tobytes()
+
+
+def batch_complexity(batch):
+    """position_complexity для пачки партий (задача для процесса-обработчика)."""
+    return [position_complexity(uci_moves) for uci_moves in batch]
+
+
+class TimingStats:
+    """
+    Статистика времени ходов по игрокам для отчета о честной игре.
+
+    Время хода нормируется на оценку времени партии (time_budget_ms), поэтому партии с разным
+    контролем времени сравнимы; сложность позиции — число допустимых ходов в ней. Предварительные ходы
+    (метка PREMOVE_MARK) не учитываются: их время назначено сервером, а не обдумано. Для каждого игрока
+    накапливаются только суммы (число ходов, Σt, Σt², Σc, Σc², Σt·c), из которых в report считаются
+    среднее, дисперсия, коэффициент вариации времени и корреляция времени со сложностью. Ходы
+    собираются в компактные буферы array и сворачиваются в суммы векторно (numpy.bincount) пачками по
+    chunk_moves, поэтому память не зависит от количества ходов, а свертка миллионов ходов занимает
+    доли секунды — основное время уходит на проигрывание партий для оценки сложности.
+
+    Ошибки:
+        RuntimeError: numpy не установлен.
+    """
+
+    def __init__(self, chunk_moves=CHUNK_MOVES):
+        if np is None:
+            raise RuntimeError('numpy is required for timing statistics')
+        self.chunk_moves = chunk_moves
+        self.players = {}  # id пользователя -> номер столбца в sums
+        self.sums = np.zeros((6, 0))  # строки: число ходов, Σt, Σt², Σc, Σc², Σt·c; столбцы — игроки
+        self.games = 0
+        self.skipped = 0
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self._players = array('I')
+        self._times = array('d')
+        self._complexity = array('H')
+
+    def _index(self, user_id):
+        return self.players.setdefault(user_id, len(self.players))
+
+    def accepts(self, black_id, uci_moves, move_times, time_control):
+        """
+        Можно ли учесть партию. Партии без соперника, без времен ходов, без контроля времени или
+        с числом времен, не совпадающим с числом ходов (начатые до записи времен), не учитываются.
+        """
+        moves = len((uci_moves or '').split())
+        return bool(moves and black_id is not None and time_budget_ms(time_control)
+                    and len(unpack_move_times(move_times)) == moves)
+
+    def add_game(self, white_id, black_id, uci_moves, move_times, time_control, complexity=None):
+        """
+        Добавляет ходы партии; партии, которые нельзя учесть (accepts), пропускаются.
+
+        Аргументы:
+            complexity (bytes, необязательный): Результат position_complexity, если уже посчитан
+                (например, в процессе-обработчике); иначе партия проигрывается здесь.
+
+        Возвращает:
+            bool: True, если партия учтена.
+        """
+        if not self.accepts(black_id, uci_moves, move_times, time_control):
+            self.skipped += 1
+            return False
+        if complexity is None:
+            complexity = position_complexity(uci_moves)
+        budget = time_budget_ms(time_control)
+        players = (self._index(white_id), self._index(black_id))
+        positions = array('H')
+        positions.frombytes(complexity)
+        for ply, time_ms, legal_moves in zip(count(OPENING_PLIES), unpack_move_times(move_times)[OPENING_PLIES:],
+                                             positions):
+            if time_ms != PREMOVE_MARK:
+                self._players.append(players[ply % 2])
+                self._times.append(time_ms / budget)
+                self._complexity.append(legal_moves)
+        self.games += 1
+        if len(self._players) >= self.chunk_moves:
+            self.flush()
+        return True
+
+    def add_moves(self, players, times, complexity):
+        """
+        Сворачивает в суммы пачку ходов, заданную массивами numpy одной длины.
+
+        Аргументы:
+            players (numpy.ndarray): Номера игроков (столбцы sums).
+            times (numpy.ndarray): Время хода в долях времени партии.
+            complexity (numpy.ndarray): Число допустимых ходов в позиции.
+        """
+        count = self._grow()
+        complexity = complexity.astype(np.float64)
+        weights = (None, times, times * times, complexity, complexity * complexity, times * complexity)
+        for row, weight in enumerate(weights):
+            self.sums[row] += np.bincount(players, weight, minlength=count)
+
+    def _grow(self):
+        """Добавляет в sums столбцы новых игроков; возвращает число игроков."""
+        count = len(self.players)
+        if self.sums.shape[1] < count:
+            self.sums = np.pad(self.sums, ((0, 0), (0, count - self.sums.shape[1])))
+        return count
+
+    def flush(self):
+        """Сворачивает накопленные в буферах ходы."""
+        if self._players:
+            self.add_moves(np.frombuffer(self._players, dtype=np.uint32).astype(np.intp),
+                           np.frombuffer(self._times, dtype=np.float64),
+                           np.frombuffer(self._complexity, dtype=np.uint16))
+        self._reset_buffers()
+
+    def report(self, min_moves=MIN_MOVES):
+        """
+        Статистика игроков, у которых не меньше min_moves учтенных ходов, от самых подозрительных.
+
+        Игрок отмечается (flagged), если время его ходов одновременно ровное (коэффициент вариации ниже
+        SUSPICIOUS_CV) и не зависит от сложности позиции (корреляция ниже SUSPICIOUS_CORRELATION):
+        человек думает дольше в сложных позициях и неравномерно, программа с фиксированной задержкой — нет.
+
+        Возвращает:
+            list: Словари {'user_id', 'moves', 'mean_time', 'std_time', 'cv', 'complexity_correlation',
+                  'flagged'}; время — в долях времени партии.
+        """
+        self.flush()
+        self._grow()
+        moves, sum_t, sum_tt, sum_c, sum_cc, sum_tc = self.sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_t, mean_c = sum_t / moves, sum_c / moves
+            var_t = np.maximum(sum_tt / moves - mean_t ** 2, 0)
+            var_c = np.maximum(sum_cc / moves - mean_c ** 2, 0)
+            std_t = np.sqrt(var_t)
+            cv = std_t / mean_t
+            correlation = (sum_tc / moves - mean_t * mean_c) / np.sqrt(var_t * var_c)
+        correlation = np.nan_to_num(correlation)
+        flagged = (cv < SUSPICIOUS_CV) & (correlation < SUSPICIOUS_CORRELATION)
+        user_ids = np.array(list(self.players), dtype=np.int64)
+        selected = np.flatnonzero(moves >= min_moves)
+        selected = selected[np.lexsort((cv[selected], ~flagged[selected]))]
+        return [{
+            'user_id': int(user_ids[i]),
+            'moves': int(moves[i]),
+            'mean_time': float(mean_t[i]),
+            'std_time': float(std_t[i]),
+            'cv': float(np.nan_to_num(cv[i])),
+            'complexity_correlation': float(correlation[i]),
+            'flagged': bool(flagged[i]),
+        } for i in selected]
+
+
+def map_batches(rows, workers, batch_size=GAME_BATCH):
+    """
+    Считает сложность позиций партий пачками в пуле процессов, сохраняя порядок.
+
+    В работе одновременно не больше 2 * workers пачек, так что память основного процесса не растет
+    с количеством партий. При workers == 0 все считается в текущем процессе.
+
+    Аргументы:
+        rows (iterable): Кортежи (white_id, black_id, uci_moves, move_times, time_control).
+
+    Возвращает:
+        generator: Пары (пачка строк, сложности позиций для каждой строки).
+    """
+    rows = iter(rows)
+    batches = iter(lambda: list(islice(rows, batch_size)), [])
+    if workers == 0:
+        for batch in batches:
+            yield batch, batch_complexity([row[2] for row in batch])
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(batch_complexity, [row[2] for row in batch])))
+            if len(pending) >= workers * 2:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+
+def timing_report(games, min_moves=MIN_MOVES, chunk_moves=CHUNK_MOVES, workers=None):
+    """
+    Отчет о времени ходов по партиям games (например, history.iter_finished_games()).
+
+    Основное время уходит на оценку сложности позиций, поэтому она считается в workers процессах
+    (map_batches; по умолчанию os.cpu_count(), 0 — в текущем процессе); свертка сумм остается
+    в основном процессе.
+
+    Возвращает:
+        tuple: (строки TimingStats.report, накопитель TimingStats со счетчиками партий).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stats = TimingStats(chunk_moves)
+
+    def timed_rows():
+        for game in games:
+            row = (game.player_white_id, game.player_black_id, game.moves, game.move_times, game.time_control)
+            if stats.accepts(*row[1:]):
+                yield row
+            else:
+                stats.skipped += 1
+
+    for batch, complexity in map_batches(timed_rows(), workers):
+        for row, game_complexity in zip(batch, complexity):
+            stats.add_game(*row, complexity=game_complexity)
+    return stats.report(min_moves), stats
@@ -0,0 +1,79 @@
+# backend/game_context.py
+
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+from backend.models import db, Game
+
+
+class PlayerInfo:
+    """Данные игрока, нужные обработчикам событий партии (без привязки к сессии SQLAlchemy)."""
+
+    __slots__ = ('id', 'username', 'elorating', 'telegram_chat_id')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.elorating = user.elorating
+        self.telegram_chat_id = user.telegram_chat_id
+
+
+class GameContext:
+    """
+    Состояние активной партии для обработчиков Socket.IO.
+
+    Загружается одним запросом (партия вместе с обоими игроками) и хранится рядом с доской партии,
+    поэтому последующие события не читают базу. Объекты SQLAlchemy живут только в пределах одного
+    события, поэтому контекст хранит копии значений, а не сами объекты.
+
+    Изменения записываются сквозным образом (update), без повторного чтения партии. Контекст
+    сбрасывается при окончании партии, при изменении рейтингов игроков и при подборе соперника.
+    """
+
+    __slots__ = ('id', 'player_white_id', 'player_black_id', 'player_white', 'player_black', 'is_active',
+                 'time_left_white_ms', 'time_left_black_ms', 'last_move_time', 'time_control', 'result', 'fen',
+                 'moves', 'move_times', 'eco', 'opening')
+
+    FIELDS = ('is_active', 'time_left_white_ms', 'time_left_black_ms', 'last_move_time', 'time_control', 'result',
+              'fen', 'moves', 'move_times', 'eco', 'opening')
+
+    def __init__(self, game):
+        self.id = game.id
+        self.player_white_id = game.player_white_id
+        self.player_black_id = game.player_black_id
+        self.player_white = PlayerInfo(game.player_white) if game.player_white else None
+        self.player_black = PlayerInfo(game.player_black) if game.player_black else None
+        for field in self.FIELDS:
+            setattr(self, field, getattr(game, field))
+        self.moves = self.moves or ''
+
+    def color_of(self, user_id):
+        """Возвращает цвет пользователя в партии ('white' или 'black') или None, если он не участник."""
+        if user_id == self.player_white_id:
+            return 'white'
+        if user_id == self.player_black_id:
+            return 'black'
+        return None
+
+    def save(self, **values):
+        """
+        Обновляет поля контекста и той же командой UPDATE — строку партии в базе.
+
+        Коммит выполняет вызывающая функция.
+        """
+        for field, value in values.items():
+            setattr(self, field, value)
+        db.session.execute(update(Game).where(Game.id == self.id).values(**values))
+
+
+def load_game(game_id):
+    """Загружает партию вместе с обоими игроками одним запросом (JOIN)."""
+    return (Game.query
+            .options(joinedload(Game.player_white), joinedload(Game.player_black))
+            .filter(Game.id == game_id)
+            .first())
+
+
+def load_game_context(game_id):
+    """Создает контекст партии; для несуществующей партии возвращает None."""
+    game = load_game(game_id)
+    return GameContext(game) if game else None
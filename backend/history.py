@@ -0,0 +1,162 @@
+# backend/history.py
+
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+from backend.models import User, Game, ArchivedGame
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+COLORS = ('white', 'black')
+RESULT_FILTERS = ('win', 'loss', 'draw')
+
+
+def encode_cursor(finished_at, game_id):
+    """Кодирует позицию последней партии страницы (время окончания и id) в непрозрачный курсор."""
+    raw = f'{finished_at.isoformat()}|{game_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Раскодирует курсор, полученный от encode_cursor.
+
+    Исключения:
+        ValueError: Если курсор поврежден.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        finished_at, game_id = raw.split('|')
+        return datetime.fromisoformat(finished_at), int(game_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def _color_query(model, user_id, color, after, result):
+    """
+    Строит запрос партий пользователя одним цветом, начиная после позиции курсора.
+
+    Условие на игрока и время окончания совпадает с составным индексом (player_<color>_id, finished_at),
+    который есть и у основной таблицы, и у архива, поэтому база читает индекс с нужного места,
+    а не пропускает предыдущие страницы через OFFSET.
+    """
+    player_column = model.player_white_id if color == 'white' else model.player_black_id
+    query = model.query.filter(player_column == user_id, model.finished_at.isnot(None))
+    if model is Game:
+        query = query.options(joinedload(Game.player_white), joinedload(Game.player_black))
+    if after:
+        finished_at, game_id = after
+        query = query.filter(or_(model.finished_at < finished_at,
+                                 and_(model.finished_at == finished_at, model.id < game_id)))
+    if result == 'win':
+        query = query.filter(model.result == color)
+    elif result == 'loss':
+        query = query.filter(model.result == ('black' if color == 'white' else 'white'))
+    elif result == 'draw':
+        query = query.filter(model.result == 'draw')
+    return query.order_by(model.finished_at.desc(), model.id.desc())
+
+
+def attach_players(archived_games):
+    """Заполняет player_white/player_black у архивных партий одним запросом к таблице пользователей."""
+    user_ids = {game.player_white_id for game in archived_games}
+    user_ids |= {game.player_black_id for game in archived_games if game.player_black_id}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    for game in archived_games:
+        game.player_white = users.get(game.player_white_id)
+        game.player_black = users.get(game.player_black_id)
+
+
+def fetch_history_page(user_id, cursor=None, limit=DEFAULT_PAGE_SIZE, result=None, color=None):
+    """
+    Возвращает одну страницу завершенных партий пользователя, от новых к старым.
+
+    Партии белыми и черными выбираются отдельными запросами по своим индексам (каждый не больше
+    limit + 1 строк) из основной таблицы и из архива, а затем сливаются по (finished_at, id).
+    Поэтому заархивированные партии видны в истории так же, как и свежие, а стоимость страницы
+    не зависит от ее номера.
+
+    Аргументы:
+        user_id (int): Идентификатор пользователя.
+        cursor (str, необязательный): Курсор из предыдущей страницы; без него возвращается первая страница.
+        limit (int, необязательный): Размер страницы.
+        result (str, необязательный): Фильтр по результату с точки зрения пользователя: 'win', 'loss' или 'draw'.
+        color (str, необязательный): Фильтр по цвету пользователя: 'white' или 'black'.
+
+    Возвращает:
+        tuple: (список партий Game или ArchivedGame, курсор следующей страницы или None).
+
+    Исключения:
+        ValueError: Если курсор поврежден.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    candidates = {}
+    for model in (Game, ArchivedGame):
+        for query_color in ([color] if color else COLORS):
+            for game in _color_query(model, user_id, query_color, after, result).limit(limit + 1):
+                # Партия, архивация которой прервалась, может временно оказаться в обеих базах.
+                candidates.setdefault(game.id, game)
+    ordered = sorted(candidates.values(), key=lambda game: (game.finished_at, game.id), reverse=True)
+
+    page = ordered[:limit]
+    attach_players([game for game in page if isinstance(game, ArchivedGame)])
+    next_cursor = None
+    if len(ordered) > limit:
+        next_cursor = encode_cursor(page[-1].finished_at, page[-1].id)
+    return page, next_cursor
+
+
+def iter_history(user_id, page_size=MAX_PAGE_SIZE):
+    """Перебирает все завершенные партии пользователя постранично, от новых к старым."""
+    cursor = None
+    while True:
+        page, cursor = fetch_history_page(user_id, cursor=cursor, limit=page_size)
+        yield from page
+        if not cursor:
+            return
+
+
+def iter_finished_games(batch_size=1000):
+    """
+    Перебирает все завершенные партии из основной таблицы и архива постранично по id.
+
+    Используется для полной перестройки производных структур (индекс позиций, дебютная статистика).
+    Партия, которая есть в обеих таблицах (архивация прервалась между записью в архив и удалением
+    из основной таблицы), выдается один раз — из основной таблицы.
+    """
+    for model in (Game, ArchivedGame):
+        last_id = 0
+        while True:
+            batch = (model.query
+                     .filter(model.finished_at.isnot(None), model.id > last_id)
+                     .order_by(model.id)
+                     .limit(batch_size)
+                     .all())
+            if not batch:
+                break
+            last_id = batch[-1].id
+            if model is ArchivedGame:
+                # Архив может лежать в другой базе, поэтому исключить такие партии в самом запросе нельзя.
+                ids = [game.id for game in batch]
+                live = {row.id for row in Game.query.with_entities(Game.id).filter(Game.id.in_(ids))}
+                batch = [game for game in batch if game.id not in live]
+            yield from batch
+
+
+def serialize_game(game, user_id):
+    """Преобразует партию в словарь для JSON-ответа истории."""
+    return {
+        'id': game.id,
+        'white': game.player_white.username if game.player_white else None,
+        'black': game.player_black.username if game.player_black else None,
+        'white_elo': game.white_elo,
+        'black_elo': game.black_elo,
+        'your_color': 'white' if game.player_white_id == user_id else 'black',
+        'result': game.result,
+        'time_control': game.time_control,
+        'eco': game.eco,
+        'opening': game.opening,
+        'plies': len(game.moves.split()) if game.moves else 0,
+        'finished_at': game.finished_at.isoformat(),
+    }
@@ -1,16 +1,50 @@
-from flask import Flask, request, jsonify, session, render_template
+from flask import Flask, Response, abort, request, jsonify, session, stream_with_context, url_for
 from flask_socketio import SocketIO, emit, join_room, disconnect
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_migrate import Migrate
-from backend.models import db, User, Game
+from backend.models import db, User, Game, Tournament, UNUSABLE_PASSWORD
+from backend.game_context import load_game, load_game_context
+from backend.presence import Presence
+from backend.db_threads import EventScopes
+from backend.board_cache import BoardCache, ply
+from backend.reaper import (
+    expire_waiting_games, iter_abandoned_games, purge_expired_tokens, side_to_move,
+    WAITING_GAME_TTL, REAPER_BATCH_SIZE, REAPER_MAX_BATCHES
+)
 from backend.elo import calculate_elo
+from backend.history import (
+    fetch_history_page, iter_finished_games, serialize_game, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, COLORS, RESULT_FILTERS
+)
+from backend.position_index import PositionIndex, build_index
+from backend import eco, explorer
+from backend.pgn import export_user_pgn
+from backend.pgn_import import import_pgn, BATCH_SIZE
+from backend.archive import archive_finished_games, ensure_archive_schema, run_archiver
+from backend.assets import AssetStore, IMMUTABLE_CACHE_CONTROL, choose_encoding
+from backend.page_cache import PageShell
+from backend import outbox, replay
+from backend.fairplay import MIN_MOVES, timing_report
+from backend.tournament import (
+    create_tournament, join_tournament, start_tournament, withdraw_player, start_arena_games,
+    record_result as record_tournament_result, current_game as current_tournament_game, serialize_tournament,
+    advance_stalled_rounds
+)
+from backend.arena import load_event, reconcile
+from backend.clock import (
+    TIME_CONTROLS, DEFAULT_TIME_CONTROL, PREMOVE_TIME_MS, LagTracker, TurnTimer, append_move_time, charge_move,
+    increment_ms, parse_time_control, pgn_time_control, think_time_ms
+)
 from werkzeug.security import generate_password_hash, check_password_hash
 import chess
+import click
+import gevent
+import csv
+import hmac
 import logging
 import uuid
 from collections import defaultdict
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,9 +52,36 @@ load_dotenv()
 SECRET_KEY = os.getenv('SECRET_KEY', 'your_secret_key')
 SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///database.db')
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:5000')
-
-game_rooms = {}
-games = {}
+ARCHIVE_DATABASE_URI = os.getenv('ARCHIVE_DATABASE_URI', 'sqlite:///archive.db')
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '7'))  # возраст завершенной партии для архивации
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '3600'))  # пауза между проходами архивации, секунды
+RECONNECT_GRACE = int(os.getenv('RECONNECT_GRACE', '30'))  # время на переподключение игрока, секунды
+BOARD_CACHE_MB = int(os.getenv('BOARD_CACHE_MB', '64'))  # бюджет памяти досок идущих партий, мегабайты
+BOARD_IDLE_SECONDS = int(os.getenv('BOARD_IDLE_SECONDS', '3600'))  # доска без событий вытесняется из памяти, секунды
+BOARD_COMPACT_SECONDS = int(os.getenv('BOARD_COMPACT_SECONDS', '120'))  # доска без событий сжимается в снимок, секунды
+REAPER_INTERVAL = int(os.getenv('REAPER_INTERVAL', '10'))  # пауза между проходами фоновой очистки, секунды
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))  # постоянных соединений в пуле
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))  # временных соединений сверх пула при всплеске
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # ожидание свободного соединения, секунды
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # пересоздание соединений с сервером БД, секунды
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # ожидание блокировки SQLite, миллисекунды
+DB_THREADS = int(os.getenv('DB_THREADS', '8'))  # потоков для блокирующих вызовов драйвера БД; 0 — в цикле событий
+OUTBOX_SECRET = os.getenv('OUTBOX_SECRET')  # общий секрет бота для чтения уведомлений; без него outbox закрыт
+ARENA_PAIRING_INTERVAL = float(os.getenv('ARENA_PAIRING_INTERVAL', '2'))  # пауза между проходами жеребьевки арен, секунды
+
+presence = Presence(grace=RECONNECT_GRACE)
+game_contexts = {}  # комната -> GameContext активной партии (см. get_game_context)
+# Доски идущих партий (LRU с бюджетом памяти); вместе с вытесненной доской сбрасывается и контекст партии.
+games = BoardCache(BOARD_CACHE_MB * 1024 * 1024, BOARD_IDLE_SECONDS,
+                   on_evict=lambda room: game_contexts.pop(room, None), compact=BOARD_COMPACT_SECONDS)
+arena_events = {}  # id турнира -> ArenaEvent идущей арены (см. get_arena_event)
+turn_timer = TurnTimer()  # начало текущего хода в каждой комнате по монотонным часам
+lag = LagTracker()  # оценка сетевой задержки игроков (clock_ping / clock_pong)
+premoves = {}  # комната -> (цвет, chess.Move) предварительного хода игрока, ждущего хода соперника
+db_events = EventScopes(db.session)  # сессия на каждое событие Socket.IO, события одной партии — по очереди
+replays = {}  # sid -> номер текущего потокового просмотра партии (новый запрос или stop_replay его прерывает)
+position_indexes = {}
+position_merges = {}  # путь индекса позиций -> AsyncResult фонового слияния его дельты
 
 app = Flask(__name__,
             static_folder='static',
@@ -29,6 +90,15 @@ app = Flask(__name__,
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_BINDS'] = {'archive': ARCHIVE_DATABASE_URI}
+app.config['DB_POOL_SIZE'] = DB_POOL_SIZE
+app.config['DB_MAX_OVERFLOW'] = DB_MAX_OVERFLOW
+app.config['DB_POOL_TIMEOUT'] = DB_POOL_TIMEOUT
+app.config['DB_POOL_RECYCLE'] = DB_POOL_RECYCLE
+app.config['SQLITE_BUSY_TIMEOUT'] = SQLITE_BUSY_TIMEOUT
+app.config['DB_THREADS'] = DB_THREADS
+app.config['OUTBOX_SECRET'] = OUTBOX_SECRET
+app.config['POSITION_INDEX_PATH'] = os.getenv('POSITION_INDEX_PATH', os.path.join(app.root_path, 'positions.idx'))
 
 db.init_app(app)
 migrate = Migrate(app, db)
@@ -38,10 +108,131 @@ login_manager.init_app(app)
 
 logging.basicConfig(level=logging.INFO)
 
+assets = AssetStore(app.static_folder)
+play_shell = PageShell('chess_ui.html')
+
+def get_position_index():
+    """Возвращает индекс позиций для текущей конфигурации, открывая его при первом обращении."""
+    path = app.config['POSITION_INDEX_PATH']
+    if path not in position_indexes:
+        position_indexes[path] = PositionIndex(path)
+    return position_indexes[path]
+
+
+def merge_position_index(index):
+    """Сливает дельту индекса позиций (выполняется в пуле потоков gevent, см. schedule_position_merge)."""
+    try:
+        index.merge()
+    except OSError as e:
+        app.logger.error(f'Failed to merge position index {index.path}: {e}')
+
+
+def schedule_position_merge(index):
+    """
+    Запускает слияние дельты индекса позиций, если она выросла до порога.
+
+    Слияние переписывает весь основной файл индекса, поэтому идет в пуле потоков gevent: обработчик
+    хода, завершившего партию, его не ждет, и цикл событий продолжает обслуживать остальные
+    соединения. Пока идет одно слияние, новое не запускается.
+    """
+    running = position_merges.get(index.path)
+    if not index.merge_due() or (running is not None and not running.ready()):
+        return
+    position_merges[index.path] = gevent.get_hub().threadpool.spawn(merge_position_index, index)
+
+
+@app.template_global()
+def asset_url(path):
+    """
+    Возвращает адрес статического файла с отпечатком содержимого для шаблонов.
+
+    В режиме отладки отдается обычный адрес /static, чтобы правки файлов были видны без перезапуска.
+    """
+    if app.debug:
+        return url_for('static', filename=path)
+    return url_for('serve_asset', filename=assets.url_name(path))
+
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """
+    Отдает заранее сжатый статический файл по имени с отпечатком.
+
+    Ответ кэшируется клиентом без срока (immutable): адрес меняется вместе с содержимым.
+    Повторный запрос с If-None-Match получает 304 без тела.
+
+    Ошибки:
+        404 Not Found: Если имени с таким отпечатком нет (например, устаревший адрес после обновления).
+    """
+    asset = assets.lookup(filename)
+    if asset is None:
+        abort(404)
+    return asset_response(asset, IMMUTABLE_CACHE_CONTROL)
+
+
+def asset_response(asset, cache_control):
+    """
+    Отдает заранее подготовленное тело (Asset) в лучшей кодировке, которую принимает клиент.
+
+    Если ETag выбранного варианта совпадает с If-None-Match, возвращается 304 без тела.
+    """
+    encoding = choose_encoding(asset, request.accept_encodings)
+    etag = asset.etag(encoding)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def get_game_context(game_id):
+    """
+    Возвращает контекст партии из кэша, загружая его одним запросом при первом обращении.
+
+    Возвращает:
+        GameContext: Контекст партии или None, если партии нет.
+    """
+    room = str(game_id)
+    context = game_contexts.get(room)
+    if context is None:
+        context = load_game_context(game_id)
+        if context is not None:
+            game_contexts[room] = context
+    return context
+
+
+def invalidate_game_contexts(game_id=None, user_ids=()):
+    """Сбрасывает контекст партии и контексты всех партий указанных игроков (например, после смены рейтинга)."""
+    if game_id is not None:
+        game_contexts.pop(str(game_id), None)
+    user_ids = set(user_ids)
+    if user_ids:
+        for room, context in list(game_contexts.items()):
+            if context.player_white_id in user_ids or context.player_black_id in user_ids:
+                game_contexts.pop(room, None)
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
+@login_manager.request_loader
+def load_user_from_request(request):
+    """Авторизует запрос без cookie по токену сессии из заголовка "Authorization: Bearer <token>"."""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return User.by_session_token(header[len('Bearer '):])
+    return None
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    return jsonify({'error': 'Unauthorized'}), 401
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     app.logger.error(f'Unhandled exception: {e}', exc_info=True)
@@ -60,7 +251,7 @@ def auth_token():
     token = request.json.get('token')
     if not token:
         return jsonify({'error': 'No token provided'}), 400
-    user = User.query.filter_by(auth_token=token).first()
+    user = User.by_auth_token(token)
     if not user:
         return jsonify({'error': 'Invalid token'}), 400
     login_user(user)
@@ -91,6 +282,8 @@ def play():
         404 Not Found: Если игра с указанным "game_id" не найдена.
 
     Примечания:
+        - Шаблон рендерится один раз (см. backend.page_cache.PageShell), в ответ подставляются только
+          данные страницы (имя пользователя, идентификатор игры, режим).
         - Параметр `username` можно получить из запроса или сессии. Если он не предоставлен, используется значение по умолчанию "Local Player".
         - Параметр `local` указывает, является ли пользователь локальным игроком (без подключения к онлайн-игре). Если параметр "local=true", показывается интерфейс для локальной игры.
         - Для проверки подлинности используется токен, переданный в параметре запроса `token`, который сверяется с базой данных для нахождения пользователя.
@@ -100,13 +293,17 @@ def play():
     token = request.args.get('token')
     is_local = request.args.get('local') == 'true'
 
+    if app.debug:
+        play_shell.clear()  # в режиме отладки шаблон перечитывается на каждый запрос
+
     if is_local:
-        return render_template('chess_ui.html', local=True, username='Local Player')
+        # Страница локальной игры одинакова для всех: отдается готовыми байтами с ETag.
+        return asset_response(play_shell.static('local', username='Local Player', local=True), 'no-cache')
 
     if not game_id or not token:
         return jsonify({'error': 'Missing game_id or token'}), 400
 
-    user = User.query.filter_by(auth_token=token).first()
+    user = User.by_auth_token(token)
     if not user:
         return jsonify({'error': 'Invalid token'}), 400
 
@@ -118,7 +315,7 @@ def play():
     if user.id not in [game.player_white_id, game.player_black_id]:
         return jsonify({'error': 'You are not part of this game'}), 403
 
-    return render_template('chess_ui.html', game_id=game_id, username=user.username)
+    return Response(play_shell.render(username=user.username, game_id=game_id, local=False), mimetype='text/html')
 
 
 @app.route('/register', methods=['POST'])
@@ -145,11 +342,20 @@ def register():
     Примечания:
         - Пароль сохраняется в базе данных в зашифрованном виде с использованием метода "set_password".
         - После создания нового пользователя, изменения сохраняются в базе данных с помощью "db.session.commit".
+        - Имя игрока из импортированных партий PGN (пользователь без пароля, UNUSABLE_PASSWORD) можно
+          занять: пользователь получает пароль и сохраняет рейтинг и партии. Пароль ставится условным
+          UPDATE, поэтому из двух одновременных запросов имя получает только один.
     """
     username = request.form.get('username')
     password = request.form.get('password')
     if not username or not password:
         return jsonify({'message': 'Username and password are required.'}), 400
+    claimed = (User.query
+               .filter_by(username=username, password_hash=UNUSABLE_PASSWORD)
+               .update({'password_hash': generate_password_hash(password)}, synchronize_session=False))
+    if claimed:
+        db.session.commit()
+        return jsonify({'message': 'Registration successful'}), 200
     if User.query.filter_by(username=username).first():
         return jsonify({'message': 'Username already exists'}), 400
     user = User(username=username)
@@ -186,6 +392,9 @@ def login():
         - Для проверки пароля используется метод `check_password`, который сравнивает введенный пароль с 
           сохраненным в базе данных.
         - Если вход успешен, токен авторизации генерируется с помощью метода "generate_auth_token".
+        - Дополнительно возвращается "session_token" — подписанный токен долгой сессии для клиентов без
+          cookie (бот передает его в заголовке "Authorization: Bearer ...", см. load_user_from_request).
+        - Если бот передал "chat_id", чат запоминается для уведомлений (и снимается с других аккаунтов).
     """
     username = request.form.get('username')
     password = request.form.get('password')
@@ -194,8 +403,14 @@ def login():
     user = User.query.filter_by(username=username).first()
     if user and user.check_password(password):
         login_user(user)
+        chat_id = request.form.get('chat_id', type=int)
+        if chat_id is not None:
+            User.query.filter(User.telegram_chat_id == chat_id, User.id != user.id).update(
+                {'telegram_chat_id': None}, synchronize_session=False)
+            user.telegram_chat_id = chat_id
         token = user.generate_auth_token()
-        return jsonify({'message': 'Login successful', 'auth_token': token}), 200
+        return jsonify({'message': 'Login successful', 'auth_token': token,
+                        'user_id': user.id, 'session_token': user.generate_session_token()}), 200
     else:
         return jsonify({'message': 'Invalid credentials'}), 400
 
@@ -223,12 +438,15 @@ def logout():
         - Используется декоратор @login_required для обеспечения доступа только авторизованным пользователям.
         - Метод logout_user() из Flask-Login выполняет выход пользователя.
         - Если используется токен авторизации, он должен быть аннулирован или удален здесь.
+        - Токены сессий бота (generate_session_token) аннулируются все сразу, уведомления в чат прекращаются.
     """
     try:
         # Аннулируем токен авторизации, если используется
         if current_user.auth_token:
             current_user.revoke_auth_token()
             db.session.commit()
+        current_user.telegram_chat_id = None
+        current_user.revoke_session_tokens()
         
         # Выполняем выход пользователя
         logout_user()
@@ -262,6 +480,326 @@ def leaderboard():
     return jsonify(leaderboard), 200
 
 
+@app.route('/metrics/db')
+def db_metrics():
+    """
+    Возвращает состояние пулов соединений для мониторинга.
+
+    Для каждой базы (основной и архива) отдаются тип пула, число открытых соединений с момента
+    запуска, выдач и возвратов соединений, а для QueuePool — размер, занятые и свободные соединения
+    и переполнение. Рост "connects" при стабильной нагрузке означает, что пул не переиспользуется.
+    При DB_THREADS > 0 отдается и пул потоков драйвера: число потоков, незавершенные вызовы и всего вызовов.
+    """
+    threads = db.driver_threads.snapshot() if db.driver_threads else None
+    return jsonify({'engines': db.pool_status(), 'driver_threads': threads}), 200
+
+
+def outbox_authorized():
+    """Проверяет секрет бота в заголовке X-Outbox-Secret (без заданного OUTBOX_SECRET доступ закрыт)."""
+    secret = app.config.get('OUTBOX_SECRET')
+    return bool(secret) and hmac.compare_digest(request.headers.get('X-Outbox-Secret', ''), secret)
+
+
+@app.route('/outbox/claim', methods=['POST'])
+def outbox_claim():
+    """
+    Выдает боту пачку уведомлений для отправки в Telegram (см. backend.outbox.claim).
+
+    Тело запроса (JSON, необязательно): {"limit": <целое, приводится к 1..OUTBOX_BATCH_SIZE>}.
+
+    Возвращает:
+        JSON {"notifications": [...]} и статус 200; 403 без правильного секрета;
+        400, если limit не целое число.
+    """
+    if not outbox_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        limit = int((request.get_json(silent=True) or {}).get('limit', outbox.OUTBOX_BATCH_SIZE))
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, outbox.OUTBOX_BATCH_SIZE))
+    notifications = outbox.claim(limit=limit)
+    return jsonify({'notifications': [outbox.serialize_notification(n) for n in notifications]}), 200
+
+
+@app.route('/outbox/ack', methods=['POST'])
+def outbox_ack():
+    """
+    Удаляет уведомления, которые бот отправил или не может доставить. Тело: {"ids": [...]}.
+
+    Возвращает:
+        JSON {"deleted": <число>} и статус 200; 403 без правильного секрета; 400, если id не целые числа.
+    """
+    if not outbox_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        ids = [int(i) for i in (request.get_json(silent=True) or {}).get('ids', [])]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid ids'}), 400
+    return jsonify({'deleted': outbox.ack(ids)}), 200
+
+
+@app.route('/users/<username>/games')
+def game_history(username):
+    """
+    Возвращает страницу истории завершенных партий пользователя, от новых к старым.
+
+    Используется постраничный вывод по курсору (keyset): курсор следующей страницы кодирует время
+    окончания и id последней партии, поэтому тысячная страница выбирается так же быстро, как первая.
+
+    Аргументы:
+        username (str): Имя пользователя.
+
+    Параметры запроса:
+        cursor (str, необязательный): Значение "next_cursor" из предыдущего ответа.
+        limit (int, необязательный): Размер страницы (по умолчанию 20, не больше 100).
+        result (str, необязательный): 'win', 'loss' или 'draw' с точки зрения пользователя.
+        color (str, необязательный): 'white' или 'black'.
+
+    Возвращает:
+        - JSON-ответ со списком партий ("games") и курсором следующей страницы ("next_cursor"), статус 200.
+        - JSON-ответ с ошибкой и статус 400 при неверных параметрах.
+        - JSON-ответ с ошибкой и статус 404, если пользователь не найден.
+    """
+    result = request.args.get('result')
+    color = request.args.get('color')
+    if result and result not in RESULT_FILTERS:
+        return jsonify({'error': 'Invalid result filter'}), 400
+    if color and color not in COLORS:
+        return jsonify({'error': 'Invalid color filter'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    try:
+        page, next_cursor = fetch_history_page(user.id, cursor=request.args.get('cursor'),
+                                               limit=limit, result=result, color=color)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({
+        'games': [serialize_game(game, user.id) for game in page],
+        'next_cursor': next_cursor
+    }), 200
+
+
+@app.route('/users/<username>/games.pgn')
+def export_games_pgn(username):
+    """
+    Отдает все завершенные партии пользователя одним файлом PGN в потоковом режиме.
+
+    Партии выбираются постранично (keyset по времени окончания) и превращаются в PGN по одной, поэтому ответ
+    начинает отправляться сразу, а потребление памяти не зависит от количества партий.
+
+    Аргументы:
+        username (str): Имя пользователя, чьи партии экспортируются.
+
+    Возвращает:
+        - Поток с текстом PGN (application/x-chess-pgn) и статус 200.
+        - JSON-ответ с ошибкой и статус 404, если пользователь не найден.
+    """
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    return Response(
+        stream_with_context(export_user_pgn(user.id)),
+        mimetype='application/x-chess-pgn',
+        headers={'Content-Disposition': f'attachment; filename="{user.username}.pgn"'}
+    )
+
+
+@app.route('/search/position')
+def search_position():
+    """
+    Ищет партии, в которых встречалась заданная позиция.
+
+    Позиция переводится в 64-битный хеш Зобриста, который ищется двоичным поиском в отсортированном
+    файле индекса (через mmap), поэтому время ответа почти не зависит от количества партий.
+
+    Параметры запроса:
+        fen (str): Позиция в нотации FEN.
+        limit (int, необязательный): Максимальное количество id в ответе (по умолчанию 100, не больше 1000).
+
+    Возвращает:
+        - JSON-ответ с id партий от новых к старым ("game_ids") и общим количеством ("total"), статус 200.
+        - JSON-ответ с ошибкой и статус 400, если FEN не указан или некорректен.
+    """
+    fen = request.args.get('fen')
+    if not fen:
+        return jsonify({'error': 'Missing fen'}), 400
+    try:
+        board = chess.Board(fen)
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'Invalid fen or limit'}), 400
+    game_ids, total = get_position_index().lookup_board(board, limit)
+    return jsonify({'game_ids': game_ids, 'total': total}), 200
+
+
+def has_live_game(user_id):
+    """Идет ли у пользователя партия с соперником (ожидающие соперника партии не считаются)."""
+    return (db.session.query(Game.id)
+            .filter(Game.is_active.is_(True), Game.player_black_id.isnot(None),
+                    (Game.player_white_id == user_id) | (Game.player_black_id == user_id))
+            .first()) is not None
+
+
+@app.route('/explorer')
+@login_required
+def opening_explorer():
+    """
+    Возвращает дебютный справочник для позиции: ходы, сыгранные из нее, и результаты партий.
+
+    Статистика хранится заранее агрегированной по хешу позиции и обновляется при окончании каждой
+    партии, поэтому запрос читает только строки одной позиции и не обращается к таблице партий.
+
+    Во время партии справочник был бы подсказкой, поэтому он доступен только после входа (сессия
+    есть у каждого, кто открыл /play, бот передает токен сессии), а пользователю, который сейчас
+    играет, отвечается 403.
+
+    Параметры запроса:
+        fen (str, необязательный): Позиция в нотации FEN; по умолчанию начальная позиция.
+
+    Возвращает:
+        - JSON-ответ со списком ходов ("moves"), статус 200.
+        - JSON-ответ с ошибкой и статус 400, если FEN некорректен.
+        - JSON-ответ с ошибкой и статус 401 без входа, 403, если у пользователя идет партия.
+    """
+    if has_live_game(current_user.id):
+        return jsonify({'error': 'Explorer is unavailable during your game'}), 403
+    try:
+        board = chess.Board(request.args.get('fen') or chess.STARTING_FEN)
+    except ValueError:
+        return jsonify({'error': 'Invalid fen'}), 400
+    return jsonify({'fen': board.fen(), 'moves': explorer.explore(board)}), 200
+
+
+@app.route('/games/<int:game_id>/position')
+def game_position(game_id):
+    """
+    Возвращает позицию партии после заданного полухода.
+
+    Для завершенных партий доска берется из ближайшей сохраненной позиции (они хранятся через каждые
+    CHECKPOINT_INTERVAL полуходов), поэтому проигрывается не больше CHECKPOINT_INTERVAL - 1 ходов
+    независимо от длины партии. Партии из архива читаются так же.
+
+    Аргументы:
+        game_id (int): Идентификатор партии.
+
+    Параметры запроса:
+        ply (int, необязательный): Номер полухода, 0 — начальная позиция; по умолчанию последний.
+
+    Возвращает:
+        - JSON-ответ с позицией ("fen"), последним ходом ("move"), номером полухода ("ply"),
+          числом полуходов партии ("plies") и числом проигранных ходов ("replayed"), статус 200.
+        - JSON-ответ с ошибкой и статус 400, если ply некорректен.
+        - JSON-ответ с ошибкой и статус 404, если партия не найдена.
+    """
+    stored = replay.load_replay(game_id)
+    if stored is None:
+        return jsonify({'error': 'Game not found'}), 404
+    uci_moves, checkpoints, _ = stored
+    plies = len(uci_moves.split())
+    try:
+        target = int(request.args.get('ply', plies))
+        board, move, replayed = replay.position_at(uci_moves, checkpoints, target)
+    except ValueError:
+        return jsonify({'error': f'Invalid ply, expected 0..{plies}'}), 400
+    return jsonify({'fen': board.fen(), 'move': move, 'ply': target, 'plies': plies, 'replayed': replayed}), 200
+
+
+@app.route('/tournaments', methods=['POST'])
+@login_required
+def new_tournament():
+    """
+    Создает турнир; текущий пользователь становится организатором.
+
+    Параметры формы: name, kind ('swiss', 'round_robin' или 'arena'), rounds (необязательно, только для
+    швейцарки), duration (минуты, только для арены), time_control (необязательно: предустановка из
+    TIME_CONTROLS или формат PGN, по умолчанию '600+0').
+
+    Возвращает:
+        JSON {"tournament_id": ...} и статус 201; 400 при неверных параметрах.
+    """
+    name = request.form.get('name')
+    if not name:
+        return jsonify({'error': 'Tournament name is required'}), 400
+    try:
+        tournament = create_tournament(name, request.form.get('kind', 'swiss'), current_user,
+                                       request.form.get('rounds', type=int), request.form.get('time_control', '600+0'),
+                                       request.form.get('duration', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify({'tournament_id': tournament.id}), 201
+
+
+@app.route('/tournaments/<int:tournament_id>')
+def show_tournament(tournament_id):
+    """Возвращает турнир с таблицей (очки, коэффициент Бухгольца) и партиями текущего тура."""
+    tournament = db.session.get(Tournament, tournament_id) or abort(404)
+    return jsonify(serialize_tournament(tournament)), 200
+
+
+@app.route('/tournaments/<int:tournament_id>/join', methods=['POST'])
+@login_required
+def enter_tournament(tournament_id):
+    """Регистрирует текущего пользователя в турнире (до его начала; в идущую арену — в любой момент)."""
+    tournament = db.session.get(Tournament, tournament_id) or abort(404)
+    try:
+        player = join_tournament(tournament, current_user)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    event = arena_events.get(tournament.id)
+    if event is not None:
+        event.enqueue(current_user.id)
+        broadcast_standings(event, [(current_user.id, current_user.username, player.score)])
+    return jsonify({'message': 'Registered'}), 200
+
+
+@app.route('/tournaments/<int:tournament_id>/withdraw', methods=['POST'])
+@login_required
+def leave_arena(tournament_id):
+    """Выводит текущего пользователя из очереди арены (очки сохраняются, вернуться можно через /join)."""
+    tournament = db.session.get(Tournament, tournament_id) or abort(404)
+    try:
+        withdraw_player(tournament, current_user)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    event = arena_events.get(tournament.id)
+    if event is not None:
+        event.discard(current_user.id)
+    return jsonify({'message': 'Withdrawn'}), 200
+
+
+@app.route('/tournaments/<int:tournament_id>/start', methods=['POST'])
+@login_required
+def begin_tournament(tournament_id):
+    """
+    Закрывает регистрацию и создает партии первого тура (только организатор); арена начинается
+    с ближайшим проходом ее жеребьевки (pair_arenas).
+
+    Возвращает:
+        JSON с турниром и статус 200; 403 для других пользователей; 400, если турнир уже начат
+        или участников недостаточно.
+    """
+    tournament = db.session.get(Tournament, tournament_id) or abort(404)
+    if tournament.created_by != current_user.id:
+        return jsonify({'error': 'Only the organizer can start the tournament'}), 403
+    try:
+        start_tournament(tournament)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(serialize_tournament(tournament)), 200
+
+
 @app.route('/start_game')
 @login_required
 def start_game():
@@ -274,26 +812,53 @@ def start_game():
     возвращается информация о начале игры, включая идентификатор игры, цвет игрока и токен авторизации.
 
     Аргументы:
-        Нет.
+        time_control (str, необязательный параметр запроса): Контроль времени — предустановка из TIME_CONTROLS
+            ('1+0', '3+2', '15+10' ...) или формат PGN ('180+2'); по умолчанию DEFAULT_TIME_CONTROL.
 
     Возвращает:
-        - JSON-ответ с сообщением о подготовке игры, идентификатором игры, токеном авторизации и цветом игрока.
-        - статус 200.
+        - JSON-ответ с сообщением о подготовке игры, идентификатором игры, токеном авторизации, цветом игрока
+          и контролем времени в формате PGN.
+        - статус 200; 400 при неверном контроле времени.
 
     Примечания:
-        - Для времени игры устанавливается начальное значение в 10 минут (600 секунд) для обоих игроков.
+        - Соперник подбирается только среди ожидающих игр с тем же контролем времени.
+        - Часы обоих игроков устанавливаются на основное время контроля (в миллисекундах).
         - Время последнего хода обновляется на текущий момент времени.
         - В случае создания новой игры, используется начальная позиция с помощью библиотеки "chess".
         - Генерируется токен авторизации для текущего пользователя, который может быть использован для аутентификации в будущем.
+        - Если у пользователя идет турнирная партия, возвращается она, а подбор соперника не выполняется.
     """
-    pending_game = Game.query.filter_by(is_active=True, is_waiting=True).first()
+    tournament_game = current_tournament_game(current_user.id)
+    if tournament_game:
+        return jsonify({
+            'message': 'Tournament game ready',
+            'game_id': tournament_game.id,
+            'auth_token': current_user.generate_auth_token(),
+            'your_color': 'white' if tournament_game.player_white_id == current_user.id else 'black'
+        }), 200
+
+    try:
+        time_control = pgn_time_control(request.args.get('time_control', DEFAULT_TIME_CONTROL))
+    except ValueError:
+        return jsonify({'error': 'Invalid time control', 'presets': list(TIME_CONTROLS)}), 400
+    base_ms, _ = parse_time_control(time_control)
+
+    # Партии, ждущие дольше WAITING_GAME_TTL, считаются брошенными (их закрывает reap).
+    pending_game = (Game.query
+                    .filter_by(is_active=True, is_waiting=True, time_control=time_control)
+                    .filter(Game.last_move_time >= datetime.utcnow() - WAITING_GAME_TTL)
+                    .first())
     if pending_game:
         pending_game.player_black_id = current_user.id
         pending_game.is_waiting = False
-        pending_game.time_left_white = 600
-        pending_game.time_left_black = 600
+        pending_game.time_left_white_ms = base_ms
+        pending_game.time_left_black_ms = base_ms
         pending_game.last_move_time = datetime.utcnow()
+        pending_game.started_at = datetime.utcnow()
+        pending_game.black_elo = int(current_user.elorating)
+        outbox.notify_opponent_found(pending_game, current_user)
         db.session.commit()
+        invalidate_game_contexts(pending_game.id)
         game_id = pending_game.id
         your_color = 'black'
     else:
@@ -301,9 +866,11 @@ def start_game():
             player_white_id=current_user.id,
             is_waiting=True,
             fen=chess.Board().fen(),
-            time_left_white=600,
-            time_left_black=600,
-            last_move_time=datetime.utcnow()  # Добавлено поле
+            time_left_white_ms=base_ms,
+            time_left_black_ms=base_ms,
+            time_control=time_control,
+            last_move_time=datetime.utcnow(),  # Добавлено поле
+            white_elo=int(current_user.elorating)
         )
         db.session.add(new_game)
         db.session.commit()
@@ -316,11 +883,13 @@ def start_game():
         'message': 'Game ready',
         'game_id': game_id,
         'auth_token': token,
-        'your_color': your_color
+        'your_color': your_color,
+        'time_control': time_control
     }), 200
 
 
 @socketio.on('connect')
+@db_events.scoped
 def handle_connect():
     """
     Обрабатывает подключение пользователя к игре через WebSocket.
@@ -347,7 +916,7 @@ def handle_connect():
         emit('error', {'message': 'Authentication token and game_id required.'})
         disconnect()
         return
-    user = User.query.filter_by(auth_token=token).first()
+    user = User.by_auth_token(token)
     if not user:
         emit('error', {'message': 'Invalid authentication token.'})
         disconnect()
@@ -359,6 +928,7 @@ def handle_connect():
 
 
 @socketio.on('join_game')
+@db_events.scoped
 def handle_join_game(data):
     """
     Обрабатывает запрос пользователя на присоединение к игре.
@@ -386,51 +956,436 @@ def handle_join_game(data):
         emit('error', {'message': 'User not authenticated.'})
         return
 
-    user = db.session.get(User, user_id)
-    if not user:
-        emit('error', {'message': 'User not found.'})
-        return
-
-    game = db.session.get(Game, game_id)
+    game = get_game_context(game_id)
     if not game or not game.is_active:
         emit('error', {'message': 'Invalid game.'})
         return
 
-    if user.id not in [game.player_white_id, game.player_black_id]:
+    color = game.color_of(user_id)
+    if not color:
         emit('error', {'message': 'You are not part of this game.'})
         return
+    user = game.player_white if color == 'white' else game.player_black
 
     room = str(game_id)
     join_room(room)
-    if room not in game_rooms:
-        game_rooms[room] = set()
-    game_rooms[room].add(user.id)
+    joined = presence.join(request.sid, room, user.id)
     emit('status', {'message': f'Joined game {game_id}.'}, room=room)
-    logging.info(f'User {user.username} joined game {game_id}. Total players: {len(game_rooms[room])}')
+    logging.info(f'User {user.username} joined game {game_id}. Total players: {len(presence.rooms[room])}')
 
-    if room not in games:
-        games[room] = chess.Board()
+    board = games.load(room, game.moves)
 
-    if len(game_rooms[room]) == 2:
-        player_white = db.session.get(User, game.player_white_id)
-        player_black = db.session.get(User, game.player_black_id)
-        emit('game_info', {
-            'player_white': {'username': player_white.username, 'elorating': player_white.elorating},
-            'player_black': {'username': player_black.username, 'elorating': player_black.elorating}
-        }, room=room)
-        emit('game_started', {
+    if joined.reconnected:
+        emit('opponent_reconnected', {'username': user.username}, room=room, include_self=False)
+
+    if joined.both_present:
+        if joined.first_start and not game.moves:
+            # Часы белых идут с момента, когда оба игрока открыли партию, а не с подбора соперника.
+            game.save(last_move_time=datetime.utcnow())
+            db.session.commit()
+            turn_timer.start(room)
+        info = game_info_payload(game)
+        started = {
             'message': 'Both players have joined. Let\'s start the game!',
-            'current_turn': 'white',
-            'time_left_white': game.time_left_white,
-            'time_left_black': game.time_left_black,
-            'fen': games[room].fen(),
-            'player_white': {'username': player_white.username, 'elorating': player_white.elorating},
-            'player_black': {'username': player_black.username, 'elorating': player_black.elorating}
-        }, room=room)
-        logging.info(f'Game {game_id} started.')
+            'current_turn': 'white' if board.turn == chess.WHITE else 'black',
+            **clock_state(game, board),
+            'time_control': game.time_control,
+            'fen': board.fen(),
+            'player_white': info['player_white'],
+            'player_black': info['player_black']
+        }
+        lag.ping(room)
+        if joined.first_start:
+            emit('game_info', info, room=room)
+            emit('game_started', started, room=room)
+            emit('clock_ping', {}, room=room)
+            logging.info(f'Game {game_id} started.')
+        else:
+            # Повторное подключение: состояние партии получает только вернувшийся игрок.
+            emit('game_info', info)
+            emit('game_started', started)
+            emit('clock_ping', {})
+
+
+@socketio.on('disconnect')
+@db_events.scoped
+def handle_disconnect():
+    """
+    Обрабатывает отключение клиента.
+
+    Соединение снимается с учета присутствия. Если у игрока не осталось других соединений,
+    сопернику отправляется `opponent_disconnected` со временем, отведенным на переподключение.
+    Комната и доска не освобождаются сразу: это делает фоновая проверка (sweep_presence),
+    если игрок не вернулся вовремя.
+    """
+    replays.pop(request.sid, None)
+    left = presence.leave(request.sid)
+    if left is None:
+        return
+    room, user_id, gone = left
+    if gone and room in presence.rooms:
+        emit('opponent_disconnected', {'grace': presence.grace}, room=room, include_self=False)
+        logging.info(f'User {user_id} disconnected from game {room}.')
+
+
+def release_game(game_id):
+    """
+    Освобождает состояние партии в памяти процесса: доску, контекст, сведения о присутствии
+    и комнату Socket.IO. Вызывается при окончании партии и при брошенной партии.
+    """
+    room = str(game_id)
+    games.pop(room)
+    game_contexts.pop(room, None)
+    premoves.pop(room, None)
+    turn_timer.discard(room)
+    lag.discard(room)
+    presence.release(room)
+    socketio.close_room(room)
+
+
+def sweep_presence():
+    """
+    Освобождает комнаты, все игроки которых отключились и не вернулись за отведенное время, сжимает
+    в снимки доски партий без событий дольше BOARD_COMPACT_SECONDS и вытесняет из памяти доски
+    без событий дольше BOARD_IDLE_SECONDS.
+
+    Партия в базе остается активной: доска будет восстановлена по ходам, если игроки вернутся позже.
+
+    Возвращает:
+        int: Количество освобожденных комнат.
+    """
+    rooms = presence.expired_rooms()
+    for room in rooms:
+        release_game(room)
+    if rooms:
+        logging.info(f'Released {len(rooms)} abandoned game rooms.')
+    idle = games.evict_idle()
+    compacted = games.compact_idle()
+    if idle or compacted:
+        logging.info(f'Evicted {idle} and compacted {compacted} idle boards '
+                     f'({games.bytes // 1024} KiB of boards kept).')
+    return len(rooms)
+
+
+def end_abandoned_game(game):
+    """
+    Завершает брошенную партию поражением по времени игрока, чей ход, и оповещает комнату.
+
+    Аргументы:
+        game (Game): Партия, загруженная вместе с игроками.
+    """
+    loser = side_to_move(game)
+    winner = 'black' if loser == 'white' else 'white'
+    if loser == 'white':
+        game.time_left_white_ms = 0
+    else:
+        game.time_left_black_ms = 0
+    update_ratings_on_win(game, winner, loser)
+    mark_game_finished(game)
+    db.session.commit()
+    invalidate_game_contexts(game.id, (game.player_white_id, game.player_black_id))
+    socketio.emit('game_over', {'result': f'{winner.capitalize()} wins on time'}, room=str(game.id))
+    release_game(game.id)
+    logging.info(f'Abandoned game {game.id} ended with result: {winner}')
+
+
+def reap(sleep=None, batch_size=REAPER_BATCH_SIZE, max_batches=REAPER_MAX_BATCHES):
+    """
+    Один проход фоновой очистки.
+
+    1. Освобождает в памяти комнаты, игроки которых не вернулись (sweep_presence).
+    2. Закрывает партии, слишком долго ожидающие соперника, чтобы к ним не подключали новых игроков.
+    3. Завершает идущие партии, в которых игрок, чей ход, давно просрочил время.
+    4. Удаляет просроченные токены авторизации.
+    5. Начинает следующий тур турниров, тур которых сыгран, но жеребьевка не прошла
+       (tournament.advance_stalled_rounds).
+
+    Каждый шаг работает пачками по batch_size строк, каждая пачка — отдельная короткая транзакция,
+    и не более max_batches пачек за проход; между пачками управление отдается другим гринлетам.
+
+    Аргументы:
+        sleep (callable, необязательный): Функция ожидания (socketio.sleep), вызывается с 0 между пачками.
+        batch_size (int, необязательный): Размер пачки.
+        max_batches (int, необязательный): Ограничение числа пачек каждого вида за проход.
+
+    Возвращает:
+        dict: Количество освобожденных комнат, закрытых ожидающих партий, завершенных брошенных партий,
+              удаленных токенов и продолженных турниров.
+    """
+    pause = sleep or (lambda seconds: None)
+    counts = {'rooms': sweep_presence(), 'waiting': 0, 'abandoned': 0, 'tokens': 0, 'rounds': 0}
+    now = datetime.utcnow()
+
+    for _ in range(max_batches):
+        expired = expire_waiting_games(now, batch_size=batch_size)
+        for game_id in expired:
+            release_game(game_id)
+        counts['waiting'] += len(expired)
+        pause(0)
+        if len(expired) < batch_size:
+            break
+
+    for batch in iter_abandoned_games(now, batch_size=batch_size, max_batches=max_batches):
+        for game in batch:
+            end_abandoned_game(game)
+        counts['abandoned'] += len(batch)
+        pause(0)
+
+    for _ in range(max_batches):
+        purged = purge_expired_tokens(now, batch_size=batch_size)
+        counts['tokens'] += purged
+        pause(0)
+        if purged < batch_size:
+            break
+
+    counts['rounds'] = advance_stalled_rounds(now)
+    db.session.commit()
+
+    if any(counts.values()):
+        logging.info(f'Reaper pass: {counts}')
+    return counts
+
+
+def run_reaper(sleep, interval):
+    """Фоновый цикл reap для запуска через socketio.start_background_task."""
+    while True:
+        try:
+            with app.app_context():
+                reap(sleep)
+        except Exception as e:
+            logging.error(f'Reaper pass failed: {e}', exc_info=True)
+        sleep(interval)
+
+
+def tournament_room(tournament_id):
+    return f'tournament:{tournament_id}'
+
+
+def get_arena_event(tournament):
+    """Возвращает состояние идущей арены, загружая его из базы при первом обращении процесса."""
+    event = arena_events.get(tournament.id)
+    if event is None:
+        event = arena_events[tournament.id] = load_event(tournament)
+    return event
+
+
+def broadcast_standings(event, changes):
+    """Применяет изменения очков к таблице арены и рассылает дельту всем, кто следит за турниром."""
+    if changes:
+        socketio.emit('standings_delta', event.standings.update(changes), room=tournament_room(event.tournament_id))
+
+
+def arena_game_finished(game, players):
+    """
+    Возвращает игроков завершенной партии арены в очередь и рассылает изменения таблицы.
+
+    Если арену ведет другой процесс (ее нет в arena_events), игроков вернет его проход жеребьевки (reconcile).
+
+    Аргументы:
+        game (Game): Завершенная партия арены.
+        players (list): Участники TournamentPlayer с уже начисленными очками.
+    """
+    event = arena_events.get(game.tournament_id)
+    if event is None:
+        return
+    for player in players:
+        if player.withdrawn:
+            event.playing.discard(player.user_id)
+        else:
+            event.enqueue(player.user_id)
+    broadcast_standings(event, [(p.user_id, event.standings.rows[p.user_id][1], p.score) for p in players])
+    if event.closed and not event.playing:
+        arena_events.pop(game.tournament_id, None)
+
+
+def pair_arenas(now=None):
+    """
+    Один проход жеребьевки всех идущих арен: сводит ожидающих участников и создает их партии.
+
+    Арены, время которых вышло, завершаются: новые партии не начинаются, а идущие доигрываются
+    и засчитываются. Состояние арен хранится в памяти процесса, поэтому проходы должен выполнять
+    один процесс (как и фоновую очистку).
+
+    Возвращает:
+        int: Количество созданных партий.
+    """
+    now = now or datetime.utcnow()
+    started = 0
+    for tournament in Tournament.query.filter_by(kind='arena', status='running').all():
+        event = get_arena_event(tournament)
+        broadcast_standings(event, reconcile(event))
+        if tournament.ends_at <= now:
+            tournament.status = 'finished'
+            tournament.finished_at = now
+            event.closed = True
+            event.waiting.clear()
+            socketio.emit('tournament_over', {'tournament_id': tournament.id}, room=tournament_room(tournament.id))
+            if not event.playing:
+                arena_events.pop(tournament.id, None)
+            continue
+        pairs = event.pair()
+        if pairs:
+            start_arena_games(tournament, pairs, now)
+            started += len(pairs)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        arena_events.clear()  # очереди в памяти уже изменены: состояние будет загружено из базы заново
+        raise
+    return started
+
+
+def run_arena_pairing(sleep, interval):
+    """Фоновый цикл pair_arenas для запуска через socketio.start_background_task."""
+    while True:
+        try:
+            with app.app_context():
+                pair_arenas()
+        except Exception as e:
+            logging.error(f'Arena pairing pass failed: {e}', exc_info=True)
+        sleep(interval)
+
+
+@socketio.on('watch_tournament')
+@db_events.scoped
+def handle_watch_tournament(data):
+    """
+    Подписывает соединение на изменения таблицы турнира.
+
+    В ответ отправляется событие `standings` с таблицей целиком; для идущей арены дальше приходят
+    события `standings_delta` с изменившимися строками и номером версии таблицы (см. ArenaStandings).
+    """
+    if not session.get('user_id'):
+        emit('error', {'message': 'User not authenticated.'})
+        return
+    tournament = db.session.get(Tournament, data.get('tournament_id'))
+    if tournament is None:
+        emit('error', {'message': 'Tournament not found.'})
+        return
+    join_room(tournament_room(tournament.id))
+    if tournament.kind == 'arena' and tournament.status == 'running':
+        emit('standings', get_arena_event(tournament).standings.snapshot())
+    else:
+        emit('standings', {'version': None, 'rows': serialize_tournament(tournament)['standings']})
+
+
+@socketio.on('replay_game')
+@db_events.scoped
+def handle_replay_game(data):
+    """
+    Запускает потоковый просмотр завершенной партии для этого соединения.
+
+    Ходы отправляются событиями `replay_move` ({'ply', 'move', 'san', 'fen'}) с заданной скоростью,
+    в конце приходит `replay_end`. Новый запрос просмотра или `stop_replay` прерывает предыдущий.
+
+    Аргументы:
+        data (dict): `game_id`; `speed` — полуходов в секунду (по умолчанию REPLAY_SPEED, не больше
+            MAX_REPLAY_SPEED); `from_ply` — полуход, с которого начинается просмотр (по умолчанию 0).
+    """
+    if not session.get('user_id'):
+        emit('error', {'message': 'User not authenticated.'})
+        return
+    stored = replay.load_replay(data.get('game_id'))
+    if stored is None or stored[2]:
+        emit('error', {'message': 'Finished game not found.'})
+        return
+    try:
+        speed = float(data.get('speed', replay.REPLAY_SPEED))
+        start = int(data.get('from_ply', 0))
+    except (TypeError, ValueError):
+        emit('error', {'message': 'Invalid speed or from_ply.'})
+        return
+    plies = len(stored[0].split())
+    if not 0 < speed <= replay.MAX_REPLAY_SPEED or not 0 <= start <= plies:
+        emit('error', {'message': f'Speed must be in (0, {replay.MAX_REPLAY_SPEED}], from_ply in 0..{plies}.'})
+        return
+    token = replays[request.sid] = replays.get(request.sid, 0) + 1
+    emit('replay_started', {'game_id': data.get('game_id'), 'plies': plies, 'from_ply': start, 'speed': speed})
+    socketio.start_background_task(stream_replay, request.sid, token, stored[0], start, speed, socketio.sleep)
+
+
+def stream_replay(sid, token, uci_moves, start, speed, sleep):
+    """
+    Отправляет соединению sid ходы партии по одному с паузой 1 / speed секунд.
+
+    Останавливается, как только номер просмотра соединения в replays перестает совпадать с token
+    (новый просмотр, stop_replay или отключение).
+    """
+    for frame in replay.replay_frames(uci_moves, start):
+        if replays.get(sid) != token:
+            return
+        socketio.emit('replay_move', frame, to=sid)
+        sleep(1 / speed)
+    if replays.get(sid) == token:
+        socketio.emit('replay_end', {'plies': len(uci_moves.split())}, to=sid)
+
+
+@socketio.on('stop_replay')
+@db_events.scoped
+def handle_stop_replay():
+    """Прерывает потоковый просмотр партии этого соединения."""
+    if request.sid in replays:
+        replays[request.sid] += 1
+
+
+def game_info_payload(game):
+    """Формирует данные события `game_info`: игроки с рейтингами и дебют партии."""
+    return {
+        'player_white': {'username': game.player_white.username, 'elorating': game.player_white.elorating},
+        'player_black': {'username': game.player_black.username, 'elorating': game.player_black.elorating},
+        'eco': game.eco,
+        'opening': game.opening
+    }
+
+
+def clock_state(game, board):
+    """
+    Время на часах обоих игроков в миллисекундах для отправки клиентам.
+
+    У игрока, чей ход в идущей партии, вычитается время, прошедшее с начала хода (по монотонным часам).
+    """
+    white, black = game.time_left_white_ms, game.time_left_black_ms
+    if game.is_active and not board.is_game_over():
+        elapsed = turn_timer.elapsed_ms(str(game.id), game.last_move_time)
+        if board.turn == chess.WHITE:
+            white = max(0, white - elapsed)
+        else:
+            black = max(0, black - elapsed)
+    return {'time_left_white_ms': white, 'time_left_black_ms': black}
+
+
+@socketio.on('clock_pong')
+@db_events.scoped
+def handle_clock_pong():
+    """Ответ клиента на clock_ping: по времени ответа уточняется задержка сети игрока (LagTracker)."""
+    joined = presence.sids.get(request.sid)
+    if joined:
+        lag.pong(*joined)
+
+
+def update_opening(game, board):
+    """
+    Уточняет дебют партии после очередного хода.
+
+    Классификация выполняется только пока партия не вышла за глубину дерева дебютов; если дебют
+    изменился, игрокам повторно отправляется `game_info`. Изменения не сохраняются — коммит
+    выполняет вызывающая функция.
+
+    Возвращает:
+        bool: True, если дебют партии изменился.
+    """
+    if ply(board) > eco.MAX_DEPTH:
+        return False
+    code, name = eco.classify(game.moves)
+    if code is None or (code, name) == (game.eco, game.opening):
+        return False
+    game.eco, game.opening = code, name
+    return True
 
 
 @socketio.on('move')
+@db_events.scoped
 def handle_move(data):
     """
     Обрабатывает ход в игре и обновляет состояние игры, включая время, позицию и результат.
@@ -447,8 +1402,17 @@ def handle_move(data):
 
     Возвращает:
         - В случае ошибки отправляется "error" с соответствующим сообщением.
-        - В случае успешного хода отправляется событие `move` с информацией о новом состоянии игры.
+        - В случае успешного хода отправляется событие `move` с информацией о новом состоянии игры, а в комнату —
+          `clock` (время обоих игроков в миллисекундах) и `clock_ping` для замера задержки сети.
+        - Ход игрока не в свою очередь запоминается как предварительный (premove), отправителю приходит
+          `premove_set`. После хода соперника он применяется сразу, если допустим, и оба хода уходят всей
+          комнате одним событием `move` (поле `premove`); иначе автору отправляется `premove_cancelled`.
         - Если игра завершена (мат, ничья или по времени), отправляется событие `game_over` с результатом игры.
+
+    Примечания:
+        - Время списывается только за допустимый ход: из времени, прошедшего с начала хода по монотонным
+          часам (TurnTimer), вычитается задержка сети игрока (LagTracker), затем добавляется добавление
+          контроля времени.
     """
     game_id = data.get('game_id')
     move = data.get('move')
@@ -457,71 +1421,71 @@ def handle_move(data):
         return
 
     room = str(game_id)
-    if room not in games:
+    if room not in presence.rooms:
         emit('error', {'message': 'Invalid game.'})
         return
 
-    game = db.session.get(Game, game_id)
+    game = get_game_context(game_id)
     if not game or not game.is_active:
         emit('error', {'message': 'Invalid game.'})
         return
 
-    board = games[room]
+    # Вытесненная из памяти доска восстанавливается по ходам партии.
+    board = games.load(room, game.moves)
+    color = 'white' if board.turn == chess.WHITE else 'black'
 
-    current_time = datetime.utcnow()
-    elapsed = (current_time - game.last_move_time).total_seconds()
-    game.last_move_time = current_time
-
-    current_turn_color = 'white' if board.turn == chess.WHITE else 'black'
-    if current_turn_color == 'white':
-        game.time_left_white -= int(elapsed)
-        if game.time_left_white <= 0:
-            game.time_left_white = 0
-            game.is_active = False
-            game.result = 'black'
-            db.session.commit()
-            emit('move', {
-                'move': move,
-                'current_turn': 'none',
-                'time_left_white': game.time_left_white,
-                'time_left_black': game.time_left_black,
-                'fen': board.fen()
-            }, room=room, include_self=False)
-            emit('game_over', {'result': 'Black wins on time'}, room=room)
-            update_game_over(game, board)
-            return
-    else:
-        game.time_left_black -= int(elapsed)
-        if game.time_left_black <= 0:
-            game.time_left_black = 0
-            game.is_active = False
-            game.result = 'white'
-            db.session.commit()
-            emit('move', {
-                'move': move,
-                'current_turn': 'none',
-                'time_left_white': game.time_left_white,
-                'time_left_black': game.time_left_black,
-                'fen': board.fen()
-            }, room=room, include_self=False)
-            emit('game_over', {'result': 'White wins on time'}, room=room)
-            update_game_over(game, board)
-            return
-
-    uci_move = move['from'] + move['to']
     try:
-        chess_move = chess.Move.from_uci(uci_move)
+        chess_move = chess.Move.from_uci(move['from'] + move['to'])
     except ValueError:
         emit('error', {'message': 'Invalid move format.'})
         return
 
+    sender = presence.sids.get(request.sid)
+    sender_color = game.color_of(sender[1]) if sender and sender[0] == room else None
+    if sender_color and sender_color != color:
+        # Ход не в свою очередь запоминается как предварительный и применяется после хода соперника.
+        premoves[room] = (sender_color, chess_move)
+        emit('premove_set', {'move': move})
+        return
+
     if chess_move not in board.legal_moves:
         emit('error', {'message': 'Illegal move.'})
         return
 
-    board.push(chess_move)
-    game.fen = board.fen()
+    # Время хода — по монотонным часам процесса, за вычетом задержки сети игрока, который ходит.
+    player_id = game.player_white_id if color == 'white' else game.player_black_id
+    san, opening_changed = play_move(game, board, chess_move, turn_timer.elapsed_ms(room, game.last_move_time),
+                                     lag.lag_ms(room, player_id))
+    current_time = datetime.utcnow()
+    if san is None:
+        winner = 'black' if color == 'white' else 'white'
+        game.save(last_move_time=current_time, is_active=False, result=winner, **{f'time_left_{color}_ms': 0})
+        db.session.commit()
+        emit('clock', {'current_turn': 'none', **clock_state(game, board)}, room=room)
+        emit('game_over', {'result': f'{winner.capitalize()} wins on time'}, room=room)
+        finish_game(game_id, board)
+        return
+
+    premove = apply_premove(game, board, room)
+    if premove:
+        san, premove_opening = premove
+        opening_changed = opening_changed or premove_opening
+    turn_timer.start(room)
+    games.resize(room)
+    game.save(fen=board.fen(), moves=game.moves, move_times=game.move_times, eco=game.eco, opening=game.opening,
+              last_move_time=current_time, time_left_white_ms=game.time_left_white_ms,
+              time_left_black_ms=game.time_left_black_ms)
+    if not board.is_game_over():
+        notify_move(game, board, san)
     db.session.commit()
+    if opening_changed:
+        emit('game_info', game_info_payload(game), room=room)
+
+    # С предварительным ходом оба хода уходят одним событием всей комнате: доску обновляют оба игрока.
+    payload = {'move': move, 'fen': board.fen()}
+    if premove:
+        last = board.peek()
+        payload['premove'] = {'from': chess.square_name(last.from_square), 'to': chess.square_name(last.to_square)}
 
     if board.is_game_over():
         if board.is_checkmate():
@@ -539,27 +1503,114 @@ def handle_move(data):
             result_message = 'Game over.'
 
         emit('move', {
-            'move': move,
+            **payload,
             'current_turn': 'none',
-            'time_left_white': game.time_left_white,
-            'time_left_black': game.time_left_black,
-            'fen': board.fen()
-        }, room=room, include_self=False)
+            **clock_state(game, board)
+        }, room=room, include_self=bool(premove))
         emit('game_over', {
             'result': result_message
         }, room=room)
 
-        update_game_over(game, board)
+        finish_game(game_id, board)
     else:
         next_turn = 'black' if board.turn == chess.BLACK else 'white'
-        db.session.commit()
         emit('move', {
-            'move': move,
+            **payload,
             'current_turn': next_turn,
-            'time_left_white': game.time_left_white,
-            'time_left_black': game.time_left_black,
-            'fen': board.fen()
-        }, room=room, include_self=False)
+            **clock_state(game, board)
+        }, room=room, include_self=bool(premove))
+        # Часы обоих игроков сверяются с сервером после каждого хода; по ответу на clock_ping
+        # уточняется задержка сети.
+        emit('clock', {'current_turn': next_turn, **clock_state(game, board)}, room=room)
+        lag.ping(room)
+        emit('clock_ping', {}, room=room)
+
+
+def play_move(game, board, chess_move, elapsed_ms, lag_ms, premove=False):
+    """
+    Списывает время хода с часов игрока, чей ход, и делает ход на доске и в контексте партии;
+    время обдумывания хода добавляется к временам ходов партии (move_times). Для предварительного хода
+    (premove=True) вместо времени записывается метка clock.PREMOVE_MARK.
+
+    Изменения не сохраняются — это делает вызывающая функция.
+
+    Возвращает:
+        tuple: (ход в SAN, изменился ли дебют); (None, False), если у игрока упал флажок — тогда ход
+        не делается и часы не меняются.
+    """
+    field = 'time_left_white_ms' if board.turn == chess.WHITE else 'time_left_black_ms'
+    time_left, flagged = charge_move(getattr(game, field), elapsed_ms, lag_ms, increment_ms(game.time_control))
+    if flagged:
+        return None, False
+    setattr(game, field, time_left)
+    san = board.san(chess_move)
+    board.push(chess_move)
+    uci_move = chess_move.uci()
+    game.moves = f'{game.moves} {uci_move}' if game.moves else uci_move
+    game.move_times = append_move_time(game.move_times, None if premove else think_time_ms(elapsed_ms, lag_ms))
+    return san, update_opening(game, board)
+
+
+def apply_premove(game, board, room):
+    """
+    Применяет предварительный ход игрока, чья теперь очередь, если он допустим в новой позиции.
+
+    Предварительный ход стоит PREMOVE_TIME_MS. Недопустимый ход (или ход, на который не хватает
+    времени) отменяется, и его автору отправляется `premove_cancelled`.
+
+    Возвращает:
+        tuple: (ход в SAN, изменился ли дебют) или None, если предварительного хода нет или он отменен.
+    """
+    premove = premoves.pop(room, None)
+    if premove is None or board.is_game_over():
+        return None
+    color, chess_move = premove
+    if color == ('white' if board.turn == chess.WHITE else 'black') and chess_move in board.legal_moves:
+        san, opening_changed = play_move(game, board, chess_move, PREMOVE_TIME_MS, 0, premove=True)
+        if san is not None:
+            return san, opening_changed
+    user_id = game.player_white_id if color == 'white' else game.player_black_id
+    for sid in presence.rooms.get(room, {}).get(user_id, ()):
+        emit('premove_cancelled', {'move': chess_move.uci()}, to=sid)
+    return None
+
+
+@socketio.on('cancel_premove')
+@db_events.scoped
+def handle_cancel_premove(data):
+    """Отменяет предварительный ход отправителя в партии data['game_id']."""
+    room = str(data.get('game_id'))
+    sender = presence.sids.get(request.sid)
+    game = get_game_context(data.get('game_id')) if room in premoves else None
+    premove = premoves.get(room)
+    if sender and game and premove and game.color_of(sender[1]) == premove[0]:
+        del premoves[room]
+        emit('premove_cancelled', {'move': premove[1].uci()})
+
+
+def notify_move(game, board, san):
+    """
+    Ставит в outbox уведомление о ходе сопернику, если у него не открыта страница партии.
+
+    Игрок с открытым мини-приложением видит ход сразу, поэтому сообщение в чат ему не нужно.
+    """
+    if board.turn == chess.WHITE:
+        player, opponent = game.player_white, game.player_black
+    else:
+        player, opponent = game.player_black, game.player_white
+    if player and opponent and not presence.is_connected(str(game.id), player.id):
+        outbox.notify_your_move(game.id, player, opponent, san)
+
+
+def finish_game(game_id, board):
+    """
+    Завершает партию, которую обработчик вел через контекст: загружает ее вместе с игроками одним
+    запросом, обновляет рейтинги и результат (update_game_over) и сбрасывает контексты игроков.
+    """
+    game = load_game(game_id)
+    update_game_over(game, board)
+    invalidate_game_contexts(game_id, (game.player_white_id, game.player_black_id))
+    release_game(game_id)
 
 
 def update_game_over(game, board):
@@ -605,11 +1656,42 @@ def update_game_over(game, board):
         elif game.result == 'draw':
             update_ratings_on_draw(game)
 
-    game.is_active = False
+    mark_game_finished(game)
     db.session.commit()
     logging.info(f'Game {game.id} ended with result: {game.result}')
 
 
+def mark_game_finished(game):
+    """
+    Помечает партию как завершенную и фиксирует время окончания.
+
+    Вызывается из всех мест, где партия заканчивается (мат, ничья, время, сдача), чтобы завершенные
+    партии одинаково попадали в историю, экспорт PGN, индекс позиций и дебютный справочник.
+    Здесь же в outbox ставятся уведомления игрокам об итоге партии, поэтому рейтинги к этому
+    моменту уже должны быть пересчитаны, и засчитывается результат турнирной партии (последняя
+    партия тура начинает следующий тур). Сохраняются позиции для просмотра партии с любого хода
+    (replay.build_checkpoints). Изменения не сохраняются — коммит выполняет вызывающая функция.
+
+    Аргументы:
+        game (Game): Объект завершаемой партии.
+    """
+    game.is_active = False
+    if game.finished_at is None:
+        game.finished_at = datetime.utcnow()
+        game.checkpoints = replay.build_checkpoints(game.moves)
+        try:
+            index = get_position_index()
+            index.add_game(game.id, game.moves or '')
+            schedule_position_merge(index)
+        except (OSError, ValueError) as e:
+            app.logger.error(f'Failed to index positions of game {game.id}: {e}')
+        explorer.record_game(game)
+        outbox.notify_game_over(game)
+        arena_players = record_tournament_result(game)
+        if arena_players:
+            arena_game_finished(game, arena_players)
+
+
 def update_ratings_on_win(game, winner_color, loser_color):
     """
     Обновляет рейтинги игроков (ELO) после победы одного из участников игры.
@@ -689,6 +1771,7 @@ def update_ratings_on_draw(game):
 
 
 @socketio.on('offer_draw')
+@db_events.scoped
 def handle_offer_draw(data):
     """
     Обрабатывает предложение ничьей от одного из игроков в игре.
@@ -720,16 +1803,13 @@ def handle_offer_draw(data):
         emit('error', {'message': 'User not authenticated.'})
         return
 
-    game = db.session.get(Game, game_id)
+    game = get_game_context(game_id)
     if not game or not game.is_active:
         emit('error', {'message': 'Invalid game'})
         return
 
-    if user_id == game.player_white_id:
-        from_player = 'white'
-    elif user_id == game.player_black_id:
-        from_player = 'black'
-    else:
+    from_player = game.color_of(user_id)
+    if not from_player:
         emit('error', {'message': 'You are not part of this game.'})
         return
 
@@ -737,6 +1817,7 @@ def handle_offer_draw(data):
 
 
 @socketio.on('draw_response')
+@db_events.scoped
 def handle_draw_response(data):
     """
     Обрабатывает ответ на предложение ничьей от одного из игроков в игре.
@@ -765,8 +1846,8 @@ def handle_draw_response(data):
         emit('error', {'message': 'Missing game_id or accept flag.'})
         return
 
-    game = db.session.get(Game, game_id)
-    if not game or not game.is_active:
+    context = get_game_context(game_id)
+    if not context or not context.is_active:
         emit('error', {'message': 'Invalid game'})
         return
 
@@ -777,23 +1858,27 @@ def handle_draw_response(data):
 
     # Обработка ответа на предложение ничьей
     if accept:
-        game.is_active = False
+        game = load_game(game_id)
         game.result = 'draw'
         
-        player_white = db.session.get(User, game.player_white_id)
-        player_black = db.session.get(User, game.player_black_id)
+        player_white = game.player_white
+        player_black = game.player_black
         new_white_elo, new_black_elo = calculate_elo(player_white.elorating, player_black.elorating, draw=True)
         player_white.elorating = new_white_elo
         player_black.elorating = new_black_elo
+        mark_game_finished(game)
         
         db.session.commit()
+        invalidate_game_contexts(game_id, (player_white.id, player_black.id))
         
         emit('game_over', {'result': 'draw'}, room=str(game_id))
+        release_game(game_id)
     else:
         emit('draw_response', {'accept': False}, room=str(game_id))
 
 
 @socketio.on('resign')
+@db_events.scoped
 def handle_resign(data):
     """
     Обрабатывает процесс сдачи игроком в игре.
@@ -815,8 +1900,8 @@ def handle_resign(data):
         emit('error', {'message': 'No game_id provided.'})
         return
 
-    game = db.session.get(Game, game_id)
-    if not game or not game.is_active:
+    context = get_game_context(game_id)
+    if not context or not context.is_active:
         emit('error', {'message': 'Invalid game'})
         return
 
@@ -825,8 +1910,13 @@ def handle_resign(data):
         emit('error', {'message': 'User not authenticated.'})
         return
 
-    player_white = db.session.get(User, game.player_white_id)
-    player_black = db.session.get(User, game.player_black_id)
+    if not context.color_of(user_id):
+        emit('error', {'message': 'You are not part of this game.'})
+        return
+
+    game = load_game(game_id)
+    player_white = game.player_white
+    player_black = game.player_black
    
     if user_id == player_white.id:
         game.result = 'black'  
@@ -846,12 +1936,149 @@ def handle_resign(data):
         emit('error', {'message': 'You are not part of this game.'})
         return
 
-    game.is_active = False
+    mark_game_finished(game)
     db.session.commit()
+    invalidate_game_contexts(game_id, (player_white.id, player_black.id))
     emit('game_over', {'result': game.result}, room=str(game_id))
+    release_game(game_id)
+
+
+@app.cli.command('import-pgn')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Games per transaction.')
+@click.option('--workers', type=int, default=None, help='Parser processes (default: CPU count, 0: in-process).')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and import from the beginning.')
+def import_pgn_command(path, batch_size, workers, restart):
+    """
+    Импортирует партии из файла PGN в базу, указанную в SQLALCHEMY_DATABASE_URI.
+
+    Пример:
+        FLASK_APP=backend.main flask import-pgn club.pgn --batch-size 10000
+    """
+    checkpoint_path = f'{path}.checkpoint'
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    total = import_pgn(path, batch_size=batch_size, workers=workers, checkpoint_path=checkpoint_path)
+    click.echo(f'{total} games imported from {path}.')
+
+
+@app.cli.command('build-position-index')
+def build_position_index_command():
+    """Перестраивает индекс позиций по всем завершенным партиям (включая архив)."""
+    path = app.config['POSITION_INDEX_PATH']
+    position_indexes.pop(path, None)
+    count = build_index(path, ((game.id, game.moves or '') for game in iter_finished_games()))
+    click.echo(f'Position index rebuilt: {count} records in {path}.')
+
+
+@app.cli.command('build-explorer')
+def build_explorer_command():
+    """Заново заполняет дебютный справочник по всем завершенным партиям (включая архив)."""
+    processed = explorer.rebuild(iter_finished_games())
+    click.echo(f'Opening explorer rebuilt from {processed} games.')
+
+
+@app.cli.command('build-checkpoints')
+def build_checkpoints_command():
+    """Сохраняет позиции для просмотра партии с любого хода в завершенных партиях, где их еще нет."""
+    count = 0
+    last_id = 0
+    while True:
+        batch = (Game.query.filter(Game.is_active.is_(False), Game.checkpoints.is_(None), Game.id > last_id)
+                 .order_by(Game.id).limit(1000).all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for game in batch:
+            game.checkpoints = replay.build_checkpoints(game.moves)
+        count += len(batch)
+        db.session.commit()
+    click.echo(f'Checkpoints built for {count} games.')
+
+
+@app.cli.command('fairplay-report')
+@click.option('--min-moves', default=MIN_MOVES, show_default=True, help='Skip players with fewer timed moves.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Also write all players as CSV.')
+@click.option('--workers', type=int, default=None, help='Replay processes (default: CPU count, 0: in-process).')
+def fairplay_report_command(min_moves, output, workers):
+    """
+    Отчет о времени ходов игроков по всем завершенным партиям (включая архив): печатает отмеченные
+    аккаунты и при необходимости сохраняет статистику всех игроков в CSV. Нужен numpy.
+
+    Пример:
+        FLASK_APP=backend.main flask fairplay-report --output fairplay.csv
+    """
+    try:
+        rows, stats = timing_report(iter_finished_games(), min_moves, workers=workers)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    usernames = {}
+    ids = [row['user_id'] for row in rows]
+    for start in range(0, len(ids), 500):
+        usernames.update(db.session.query(User.id, User.username).filter(User.id.in_(ids[start:start + 500])))
+    if output:
+        with open(output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['username', *rows[0]] if rows else ['username'])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({'username': usernames.get(row['user_id']), **row})
+    flagged = [row for row in rows if row['flagged']]
+    for row in flagged:
+        click.echo(f"{usernames.get(row['user_id'])}: {row['moves']} moves, cv {row['cv']:.2f}, "
+                   f"complexity correlation {row['complexity_correlation']:.2f}")
+    click.echo(f'{stats.games} games analysed ({stats.skipped} without move times), '
+               f'{len(flagged)} of {len(rows)} players flagged.')
+
+
+@app.cli.command('build-eco')
+@click.option('--source', 'sources', multiple=True, type=click.Path(exists=True),
+              help='Opening table (.tsv) or a directory of them, e.g. the full chess-openings set; '
+                   'repeatable. Default: the bundled backend/data/eco.tsv.')
+@click.option('--classify', is_flag=True, help='Also classify stored games that have no opening yet.')
+def build_eco_command(sources, classify):
+    """Собирает дерево дебютов (по умолчанию из backend/data/eco.tsv) и при необходимости размечает старые партии."""
+    count = eco.build_trie(sources or (eco.ECO_SOURCE_PATH,))
+    eco.load_trie.cache_clear()
+    click.echo(f'{count} openings written to {eco.ECO_TRIE_PATH}.')
+    if not classify:
+        return
+    classified = 0
+    last_id = 0
+    while True:
+        batch = (Game.query.filter(Game.eco.is_(None), Game.id > last_id)
+                 .order_by(Game.id).limit(1000).all())
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for game in batch:
+            game.eco, game.opening = eco.classify(game.moves or '')
+            classified += game.eco is not None
+        db.session.commit()
+    click.echo(f'{classified} games classified.')
+
+
+@app.cli.command('reap')
+def reap_command():
+    """Однократно выполняет проход фоновой очистки (ожидающие и брошенные партии, просроченные токены)."""
+    counts = reap()
+    click.echo(', '.join(f'{name}: {count}' for name, count in counts.items()))
+
+
+@app.cli.command('archive-games')
+@click.option('--older-than-days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive finished games older than this many days.')
+def archive_games_command(older_than_days):
+    """Однократно переносит старые завершенные партии в архивную базу (ARCHIVE_DATABASE_URI)."""
+    ensure_archive_schema()
+    moved = archive_finished_games(timedelta(days=older_than_days))
+    click.echo(f'{moved} games archived.')
 
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+    socketio.start_background_task(run_archiver, app, socketio.sleep, ARCHIVE_INTERVAL,
+                                   timedelta(days=ARCHIVE_AFTER_DAYS))
+    socketio.start_background_task(run_reaper, socketio.sleep, REAPER_INTERVAL)
+    socketio.start_background_task(run_arena_pairing, socketio.sleep, ARENA_PAIRING_INTERVAL)
     socketio.run(app, debug=True, port=5000)
\ No newline at end of file
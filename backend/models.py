@@ -1,12 +1,28 @@
 # models.py
 
-from flask_sqlalchemy import SQLAlchemy
+from flask import current_app
 from flask_login import UserMixin
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.security import generate_password_hash, check_password_hash
+import base64
 import chess
-from datetime import datetime
+import json
+import zlib
+from datetime import datetime, timedelta
+from backend.db_profile import ProfiledSQLAlchemy
+
+db = ProfiledSQLAlchemy()
+
+AUTH_TOKEN_TTL = timedelta(hours=24)  # срок действия токена из generate_auth_token
+SESSION_TOKEN_TTL = timedelta(days=30)  # срок действия токена сессии бота из generate_session_token
+SESSION_TOKEN_SALT = 'bot-session'
+UNUSABLE_PASSWORD = '!'  # хеш пользователя, созданного импортом PGN: check_password_hash всегда вернет False
+
+
+def session_serializer():
+    """Подписывает токены сессий ключом приложения (SECRET_KEY)."""
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=SESSION_TOKEN_SALT)
 
-db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,6 +32,9 @@ class User(UserMixin, db.Model):
     wins = db.Column(db.Integer, default=0)
     losses = db.Column(db.Integer, default=0)
     auth_token = db.Column(db.String(36), unique=True, nullable=True)
+    auth_token_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    session_epoch = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    telegram_chat_id = db.Column(db.BigInteger, nullable=True)  # чат для уведомлений (задается при входе через бота)
     
     # Другие поля и методы
 
@@ -28,29 +47,248 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     def generate_auth_token(self):
-        """Генерирует уникальный аутентификационный токен."""
+        """Генерирует уникальный аутентификационный токен, действующий AUTH_TOKEN_TTL."""
         import uuid
         self.auth_token = str(uuid.uuid4())
+        self.auth_token_expires_at = datetime.utcnow() + AUTH_TOKEN_TTL
         db.session.commit()
         return self.auth_token
     
     def revoke_auth_token(self):
         """Аннулирует текущий аутентификационный токен."""
         self.auth_token = None
+        self.auth_token_expires_at = None
         db.session.commit()
 
+    @classmethod
+    def by_auth_token(cls, token):
+        """Находит пользователя по действующему (не просроченному) токену."""
+        return cls.query.filter(cls.auth_token == token, cls.auth_token_expires_at > datetime.utcnow()).first()
+
+    def generate_session_token(self):
+        """
+        Выдает подписанный токен долгой сессии (для бота), действующий SESSION_TOKEN_TTL.
+
+        Токен содержит только id пользователя и номер поколения сессий и не хранится в базе,
+        поэтому одноразовый auth_token мини-приложения он не затрагивает.
+        """
+        return session_serializer().dumps([self.id, self.session_epoch or 0])
+
+    def revoke_session_tokens(self):
+        """Аннулирует все выданные токены сессий пользователя (новое поколение сессий)."""
+        self.session_epoch = (self.session_epoch or 0) + 1
+        db.session.commit()
+
+    @classmethod
+    def by_session_token(cls, token, max_age=SESSION_TOKEN_TTL):
+        """Находит пользователя по действующему токену сессии; для поддельного, просроченного или отозванного — None."""
+        try:
+            user_id, epoch = session_serializer().loads(token, max_age=int(max_age.total_seconds()))
+        except (BadSignature, TypeError, ValueError):
+            return None
+        user = db.session.get(cls, user_id)
+        return user if user and (user.session_epoch or 0) == epoch else None
+
 class Game(db.Model):
+    # Составные индексы для истории партий: выборка по игроку упорядочена по времени окончания,
+    # поэтому постраничный вывод (keyset) читает индекс последовательно без сортировки и OFFSET.
+    __table_args__ = (
+        db.Index('ix_game_white_finished', 'player_white_id', 'finished_at'),
+        db.Index('ix_game_black_finished', 'player_black_id', 'finished_at'),
+        # Для фоновой очистки: ожидающие и идущие партии по времени последнего хода.
+        db.Index('ix_game_active_waiting', 'is_active', 'is_waiting', 'last_move_time'),
+        # Партии тура: проверка окончания тура и вывод пар.
+        db.Index('ix_game_tournament_round', 'tournament_id', 'tournament_round'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     player_white_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     player_black_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     fen = db.Column(db.String, nullable=False, default=chess.Board().fen())
     is_active = db.Column(db.Boolean, default=True)
     is_waiting = db.Column(db.Boolean, default=True)
-    time_left_white = db.Column(db.Integer, default=600)  # 10 минут в секундах
-    time_left_black = db.Column(db.Integer, default=600)  # 10 минут в секундах
+    time_left_white_ms = db.Column(db.Integer, default=600000)  # время на часах белых, миллисекунды
+    time_left_black_ms = db.Column(db.Integer, default=600000)  # время на часах черных, миллисекунды
     last_move_time = db.Column(db.DateTime, default=datetime.utcnow)  # Добавлено поле
     result = db.Column(db.String, nullable=True)
+    moves = db.Column(db.Text, nullable=False, default='', server_default='')  # ходы в формате UCI через пробел
+    move_times = db.Column(db.LargeBinary, nullable=True)  # время каждого полухода, мс (clock.append_move_time)
+    checkpoints = db.Column(db.Text, nullable=True)  # FEN через каждые CHECKPOINT_INTERVAL полуходов (см. replay)
+    white_elo = db.Column(db.Integer, nullable=True)  # рейтинг белых на момент начала партии
+    black_elo = db.Column(db.Integer, nullable=True)  # рейтинг черных на момент начала партии
+    time_control = db.Column(db.String(16), default='600+0')  # контроль времени в формате PGN
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    eco = db.Column(db.String(3), nullable=True)  # код дебюта по классификации ECO
+    opening = db.Column(db.String(128), nullable=True)  # название дебюта
+    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'), nullable=True)
+    tournament_round = db.Column(db.Integer, nullable=True)
     
     # Определение отношений
     player_white = db.relationship('User', foreign_keys=[player_white_id], backref='white_games')
-    player_black = db.relationship('User', foreign_keys=[player_black_id], backref='black_games')
\ No newline at end of file
+    player_black = db.relationship('User', foreign_keys=[player_black_id], backref='black_games')
+
+
+class Tournament(db.Model):
+    """
+    Турнир по швейцарской или круговой системе (см. backend.tournament).
+
+    Статус: 'registering' (идет регистрация), 'running', 'finished'. Партии тура — обычные записи game
+    с tournament_id и tournament_round; следующий тур начинается, когда завершена последняя партия текущего.
+    Арена (kind='arena') идет duration минут без туров: номер тура у ее партий — номер прохода жеребьевки.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # swiss, round_robin, arena
+    status = db.Column(db.String(16), nullable=False, default='registering')
+    rounds = db.Column(db.Integer, nullable=True)  # задается при старте, если не указан
+    current_round = db.Column(db.Integer, nullable=False, default=0)
+    time_control = db.Column(db.String(16), nullable=False, default='600+0')
+    duration = db.Column(db.Integer, nullable=True)  # продолжительность арены, минуты
+    ends_at = db.Column(db.DateTime, nullable=True)  # окончание арены (задается при старте)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class TournamentPlayer(db.Model):
+    """
+    Участник турнира: очки, рейтинг на момент регистрации и история цветов по турам ('w', 'b', '-').
+    Для арены — также серия побед подряд и признак выхода из очереди.
+    """
+    __tablename__ = 'tournament_player'
+
+    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    rating = db.Column(db.Integer, nullable=False)
+    colors = db.Column(db.Text, nullable=False, default='')
+    streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    withdrawn = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+
+class ArchivedGame(db.Model):
+    """
+    Завершенная партия, перенесенная из таблицы game в архивную базу (SQLALCHEMY_BINDS['archive']).
+
+    Поля, по которым ищется история, хранятся отдельными колонками с теми же индексами, что и в game,
+    а ходы, времена ходов, итоговая позиция и позиции для просмотра — одним сжатым zlib блоком.
+    Идентификатор партии сохраняется, поэтому ссылки на партию продолжают работать после архивации.
+    """
+    __bind_key__ = 'archive'
+    __tablename__ = 'archived_game'
+    __table_args__ = (
+        db.Index('ix_archived_game_white_finished', 'player_white_id', 'finished_at'),
+        db.Index('ix_archived_game_black_finished', 'player_black_id', 'finished_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    player_white_id = db.Column(db.Integer, nullable=False)
+    player_black_id = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.String, nullable=True)
+    white_elo = db.Column(db.Integer, nullable=True)
+    black_elo = db.Column(db.Integer, nullable=True)
+    time_control = db.Column(db.String(16), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib(JSON) с ходами, позицией и дебютом
+
+    # Игроки хранятся в основной базе, поэтому связи заполняются при чтении (см. history.attach_players).
+    player_white = None
+    player_black = None
+
+    @classmethod
+    def from_game(cls, game):
+        """Создает архивную запись из завершенной партии."""
+        move_times = base64.b64encode(game.move_times).decode() if game.move_times is not None else None
+        payload = json.dumps({'moves': game.moves or '', 'fen': game.fen, 'checkpoints': game.checkpoints,
+                              'move_times': move_times, 'eco': game.eco, 'opening': game.opening}).encode()
+        return cls(
+            id=game.id,
+            player_white_id=game.player_white_id,
+            player_black_id=game.player_black_id,
+            result=game.result,
+            white_elo=game.white_elo,
+            black_elo=game.black_elo,
+            time_control=game.time_control,
+            started_at=game.started_at,
+            finished_at=game.finished_at,
+            payload=zlib.compress(payload, 9)
+        )
+
+    def _unpacked(self):
+        """Распаковывает сжатый блок (один раз на объект)."""
+        if '_payload_cache' not in self.__dict__:
+            self.__dict__['_payload_cache'] = json.loads(zlib.decompress(self.payload))
+        return self.__dict__['_payload_cache']
+
+    @property
+    def moves(self):
+        return self._unpacked()['moves']
+
+    @property
+    def fen(self):
+        return self._unpacked()['fen']
+
+    @property
+    def move_times(self):
+        move_times = self._unpacked().get('move_times')
+        return base64.b64decode(move_times) if move_times is not None else None
+
+    @property
+    def checkpoints(self):
+        return self._unpacked().get('checkpoints')
+
+    @property
+    def eco(self):
+        return self._unpacked().get('eco')
+
+    @property
+    def opening(self):
+        return self._unpacked().get('opening')
+
+    @property
+    def is_active(self):
+        return False
+
+
+class OpeningStat(db.Model):
+    """
+    Агрегированная статистика дебютного справочника: ход из позиции и результаты партий с ним.
+
+    Ключ — знаковый 64-битный хеш Зобриста позиции и ход в UCI, поэтому запрос справочника читает
+    только строки одной позиции по первичному ключу и никогда не обращается к таблице партий.
+    """
+    __tablename__ = 'opening_stat'
+
+    position_hash = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    move = db.Column(db.String(5), primary_key=True)
+    white_wins = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
+    black_wins = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.BigInteger, nullable=False, default=0)  # сумма средних рейтингов партий
+    rated_games = db.Column(db.Integer, nullable=False, default=0)  # партии, где известны оба рейтинга
+
+
+class Notification(db.Model):
+    """
+    Исходящее уведомление в чат Telegram (outbox).
+
+    Записывается в той же транзакции, что и событие партии, поэтому уведомление не теряется и не
+    отправляется о несостоявшемся событии. Бот забирает записи с арендой (leased_until) и удаляет
+    их подтверждением после отправки; записи с истекшей арендой выдаются повторно.
+    """
+    __tablename__ = 'notification'
+    __table_args__ = (
+        db.Index('ix_notification_chat_kind_game', 'chat_id', 'kind', 'game_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.BigInteger, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # opponent_found, your_move, game_over
+    game_id = db.Column(db.Integer, nullable=True)
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    leased_until = db.Column(db.DateTime, nullable=True, index=True)  # занято ботом до этого момента
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
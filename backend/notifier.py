@@ -0,0 +1,200 @@
+# backend/notifier.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+GLOBAL_RATE = 25  # сообщений в секунду на весь бот (лимит Telegram — около 30)
+GLOBAL_BURST = 5  # запас + частота за секунду не превышают лимит Telegram
+CHAT_RATE = 1  # сообщений в секунду в один чат
+CHAT_BURST = 1
+POLL_INTERVAL = 1.0  # секунд между запросами уведомлений при пустой очереди
+MAX_BUFFERED = 1000  # уведомлений, забранных с бэкенда и ожидающих отправки
+MAX_MESSAGE_LENGTH = 4096  # ограничение Telegram на длину сообщения
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate токенов в секунду, не больше capacity в запасе.
+
+    Отрицательный запас — долг: так учитывается пауза retry_after, которую потребовал Telegram.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Секунд до появления токена (0 — токен есть)."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds, now):
+        """Запрещает отправку на seconds секунд."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboxSender:
+    """
+    Отправляет уведомления из outbox бэкенда в чаты Telegram с учетом ограничений частоты.
+
+    Общий TokenBucket ограничивает частоту сообщений бота, отдельный TokenBucket на чат — частоту
+    сообщений в один чат. Уведомления, накопившиеся для чата, пока его лимит исчерпан, отправляются
+    одним сообщением (в пределах MAX_MESSAGE_LENGTH). Уведомления подтверждаются на бэкенде только
+    после отправки; при ошибке сети или RetryAfter они остаются в очереди, а недоставляемые
+    (бот заблокирован, чат не найден) подтверждаются и отбрасываются.
+
+    Аргументы:
+        bot (telegram.Bot): Бот для отправки сообщений.
+        source: Объект с блокирующими методами claim_notifications(limit) -> list[dict] и
+            ack_notifications(ids) (см. BackendClient); вызываются в отдельном потоке.
+        clock (callable): Источник монотонного времени в секундах.
+    """
+
+    def __init__(self, bot, source, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, chat_rate=CHAT_RATE,
+                 chat_burst=CHAT_BURST, poll_interval=POLL_INTERVAL, max_buffered=MAX_BUFFERED, clock=time.monotonic):
+        self.bot = bot
+        self.source = source
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.poll_interval = poll_interval
+        self.max_buffered = max_buffered
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock())
+        self.chat_buckets = {}  # chat_id -> TokenBucket (только для чатов с недавними сообщениями)
+        self.pending = OrderedDict()  # chat_id -> уведомления в порядке создания
+        self.known = set()  # id уведомлений в очереди (повторная выдача после истечения аренды)
+        self.sent_messages = 0
+        self._task = None
+
+    @property
+    def buffered(self):
+        return len(self.known)
+
+    def add(self, notifications):
+        """Добавляет забранные с бэкенда уведомления в очереди чатов."""
+        for notification in notifications:
+            if notification['id'] in self.known:
+                continue
+            self.known.add(notification['id'])
+            self.pending.setdefault(notification['chat_id'], []).append(notification)
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    @staticmethod
+    def _coalesce(items):
+        """Делит уведомления чата на часть, помещающуюся в одно сообщение, и остаток."""
+        length = 0
+        for count, item in enumerate(items):
+            length += len(item['text']) + (1 if count else 0)
+            if count and length > MAX_MESSAGE_LENGTH:
+                return items[:count], items[count:]
+        return items, []
+
+    async def _send(self, chat_id, items):
+        """Отправляет одно сообщение; возвращает id уведомлений, которые можно подтвердить."""
+        text = '\n'.join(item['text'] for item in items)[:MAX_MESSAGE_LENGTH]
+        ids = [item['id'] for item in items]
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self._chat_bucket(chat_id, self.clock()).pause(float(retry_after), self.clock())
+        except (Forbidden, BadRequest) as e:
+            logging.warning(f'Dropping {len(ids)} notifications for chat {chat_id}: {e}')
+            return ids
+        except TelegramError as e:
+            logging.warning(f'Failed to send notifications to chat {chat_id}: {e}')
+        else:
+            self.sent_messages += 1
+            return ids
+        self.pending[chat_id] = items + self.pending.get(chat_id, [])
+        self.pending.move_to_end(chat_id, last=False)
+        return []
+
+    async def tick(self):
+        """
+        Один проход: забирает новые уведомления, отправляет все, что позволяют лимиты, и подтверждает отправленные.
+
+        Возвращает:
+            float: Секунд до следующего прохода.
+        """
+        if self.buffered < self.max_buffered:
+            self.add(await asyncio.to_thread(self.source.claim_notifications, self.max_buffered - self.buffered))
+
+        now = self.clock()
+        batch = []
+        for chat_id in list(self.pending):
+            if self.global_bucket.wait_time(now) > 0:
+                break
+            bucket = self._chat_bucket(chat_id, now)
+            if bucket.wait_time(now) > 0:
+                continue
+            bucket.take(now)
+            self.global_bucket.take(now)
+            items, rest = self._coalesce(self.pending.pop(chat_id))
+            if rest:
+                self.pending[chat_id] = rest
+            batch.append((chat_id, items))
+
+        done = [i for ids in await asyncio.gather(*(self._send(chat_id, items) for chat_id, items in batch))
+                for i in ids]
+        if done:
+            self.known.difference_update(done)
+            await asyncio.to_thread(self.source.ack_notifications, done)
+
+        now = self.clock()
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items()
+                        if chat_id not in self.pending and bucket.is_full(now)]:
+            del self.chat_buckets[chat_id]
+        if not self.pending:
+            return self.poll_interval
+        waits = [self._chat_bucket(chat_id, now).wait_time(now) for chat_id in self.pending]
+        return min(self.poll_interval, max(self.global_bucket.wait_time(now), min(waits)))
+
+    async def run(self):
+        """Отправляет уведомления, пока задача не будет отменена."""
+        while True:
+            try:
+                delay = await self.tick()
+            except Exception as e:  # бэкенд недоступен — повторить позже, не останавливая отправку
+                logging.error(f'Outbox sender error: {e}')
+                delay = self.poll_interval
+            await asyncio.sleep(delay)
+
+    def start(self):
+        """Запускает отправку в фоновой задаче текущего цикла событий."""
+        self._task = asyncio.get_running_loop().create_task(self.run(), name='outbox-sender')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
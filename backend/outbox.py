@@ -0,0 +1,138 @@
+# backend/outbox.py
+
+from datetime import datetime, timedelta
+from sqlalchemy import delete, or_, update
+from backend.models import db, Notification
+
+OUTBOX_LEASE = timedelta(seconds=30)  # время на отправку выданных боту уведомлений до повторной выдачи
+OUTBOX_BATCH_SIZE = 100  # уведомлений за один запрос бота
+OUTBOX_MAX_ATTEMPTS = 5  # выдач одного уведомления, после которых оно удаляется
+
+RESULT_TEXT = {'white': 'White wins', 'black': 'Black wins', 'draw': 'Draw'}
+
+
+def enqueue(chat_id, kind, text, game_id=None):
+    """
+    Добавляет уведомление в outbox в текущей транзакции (коммит выполняет вызывающая функция).
+
+    Еще не выданное боту уведомление того же вида о той же партии заменяется новым текстом, поэтому
+    серия событий (например, несколько ходов подряд) дает одно сообщение с последним состоянием.
+
+    Аргументы:
+        chat_id (int): Чат Telegram; для пользователей без чата (не входили через бота) уведомление не создается.
+        kind (str): Вид уведомления (opponent_found, your_move, game_over).
+        text (str): Текст сообщения.
+        game_id (int, необязательный): Партия, к которой относится уведомление.
+
+    Возвращает:
+        Notification: Созданное или обновленное уведомление либо None.
+    """
+    if chat_id is None:
+        return None
+    pending = (Notification.query
+               .filter_by(chat_id=chat_id, kind=kind, game_id=game_id)
+               .filter(Notification.leased_until.is_(None))
+               .first())
+    if pending:
+        pending.text = text
+        pending.created_at = datetime.utcnow()
+        return pending
+    notification = Notification(chat_id=chat_id, kind=kind, game_id=game_id, text=text)
+    db.session.add(notification)
+    return notification
+
+
+def notify_opponent_found(game, opponent):
+    """Сообщает ожидавшему игроку (белые), что соперник найден и партия началась."""
+    enqueue(game.player_white.telegram_chat_id, 'opponent_found',
+            f'Opponent found: {opponent.username} ({int(opponent.elorating)}). '
+            f'Game #{game.id} has started, you play white.', game.id)
+
+
+def notify_your_move(game_id, player, opponent, san):
+    """
+    Сообщает игроку, что соперник сделал ход и теперь его очередь.
+
+    Аргументы:
+        game_id (int): Идентификатор партии.
+        player (PlayerInfo): Игрок, чей ход.
+        opponent (PlayerInfo): Соперник, сделавший ход.
+        san (str): Ход соперника в нотации SAN.
+    """
+    enqueue(player.telegram_chat_id, 'your_move',
+            f'Your move in game #{game_id}: {opponent.username} played {san}.', game_id)
+
+
+def notify_game_over(game):
+    """Сообщает обоим игрокам результат партии и изменение их рейтинга."""
+    if game.result not in RESULT_TEXT or not game.player_black:
+        return
+    for player, opponent, start_elo in ((game.player_white, game.player_black, game.white_elo),
+                                        (game.player_black, game.player_white, game.black_elo)):
+        rating = int(player.elorating)
+        change = f' ({rating - start_elo:+d})' if start_elo is not None else ''
+        enqueue(player.telegram_chat_id, 'game_over',
+                f'Game #{game.id} vs {opponent.username} is over: {RESULT_TEXT[game.result]}. '
+                f'Your rating: {rating}{change}.', game.id)
+
+
+def claim(now=None, limit=OUTBOX_BATCH_SIZE, lease=OUTBOX_LEASE):
+    """
+    Выдает боту пачку уведомлений в порядке создания и закрепляет их за ним на время lease.
+
+    Уведомления, выданные OUTBOX_MAX_ATTEMPTS раз и так и не подтвержденные, удаляются.
+
+    Возвращает:
+        list: Уведомления Notification.
+    """
+    now = now or datetime.utcnow()
+    available = or_(Notification.leased_until.is_(None), Notification.leased_until < now)
+    db.session.execute(delete(Notification)
+                       .where(available, Notification.attempts >= OUTBOX_MAX_ATTEMPTS)
+                       .execution_options(synchronize_session=False))
+    ids = [row.id for row in (db.session.query(Notification.id)
+                              .filter(available)
+                              .order_by(Notification.id)
+                              .limit(limit))]
+    if not ids:
+        db.session.commit()
+        return []
+    leased_until = now + lease
+    db.session.execute(update(Notification)
+                       .where(Notification.id.in_(ids), available)
+                       .values(leased_until=leased_until, attempts=Notification.attempts + 1)
+                       .execution_options(synchronize_session=False))
+    # Уведомления, которые между выборкой и обновлением забрал другой процесс бота, отбрасываются.
+    notifications = (Notification.query
+                     .populate_existing()
+                     .filter(Notification.id.in_(ids), Notification.leased_until == leased_until)
+                     .order_by(Notification.id)
+                     .all())
+    db.session.commit()
+    return notifications
+
+
+def ack(ids):
+    """
+    Удаляет отправленные (или недоставляемые) уведомления.
+
+    Возвращает:
+        int: Количество удаленных уведомлений.
+    """
+    if not ids:
+        return 0
+    deleted = db.session.execute(delete(Notification)
+                                 .where(Notification.id.in_(ids))
+                                 .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'chat_id': notification.chat_id,
+        'kind': notification.kind,
+        'game_id': notification.game_id,
+        'text': notification.text,
+    }
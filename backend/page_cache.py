@@ -0,0 +1,74 @@
+# backend/page_cache.py
+
+import json
+
+from flask import render_template
+
+from backend.assets import Asset
+
+CONFIG_PLACEHOLDER = '__APP_CONFIG__'  # метка в шаблоне, вместо которой подставляются данные страницы
+
+
+def config_blob(data):
+    """
+    Сериализует данные страницы в JSON, безопасный для вставки внутрь <script>.
+
+    Символы "<", ">" и "&" экранируются, поэтому значение (например, имя пользователя) не может
+    закрыть тег script или начать HTML-комментарий.
+    """
+    text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+
+class PageShell:
+    """
+    Заранее отрисованный шаблон, в котором меняется только блок данных страницы.
+
+    Шаблон рендерится один раз с меткой CONFIG_PLACEHOLDER вместо данных и делится по ней на две
+    байтовые части. Ответ собирается склейкой частей с JSON конкретного запроса, без Jinja.
+    Для страницы с постоянными данными (локальная игра) готовый ответ хранится целиком
+    вместе со сжатыми вариантами (см. backend.assets.Asset).
+    """
+
+    def __init__(self, template_name):
+        self.template_name = template_name
+        self._parts = None
+        self._static = {}
+
+    def _split(self):
+        """Рендерит шаблон с меткой и делит результат на части до и после нее (при первом обращении)."""
+        if self._parts is None:
+            html = render_template(self.template_name, app_config=CONFIG_PLACEHOLDER)
+            head, tail = html.encode('utf-8').split(CONFIG_PLACEHOLDER.encode(), 1)
+            self._parts = (head, tail)
+        return self._parts
+
+    def render(self, **data):
+        """
+        Собирает страницу с данными конкретного запроса.
+
+        Возвращает:
+            bytes: HTML страницы в UTF-8.
+        """
+        head, tail = self._split()
+        return b''.join((head, config_blob(data).encode('utf-8'), tail))
+
+    def static(self, key, **data):
+        """
+        Возвращает заранее собранную страницу с постоянными данными.
+
+        Аргументы:
+            key (str): Имя варианта страницы (например, 'local').
+            **data: Данные страницы; используются только при первой сборке варианта.
+
+        Возвращает:
+            Asset: Готовое тело страницы, его ETag и сжатые варианты.
+        """
+        if key not in self._static:
+            self._static[key] = Asset(f'{key}.html', self.render(**data))
+        return self._static[key]
+
+    def clear(self):
+        """Сбрасывает кэш (например, после изменения шаблона или статических файлов)."""
+        self._parts = None
+        self._static = {}
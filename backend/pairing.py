@@ -0,0 +1,277 @@
+# backend/pairing.py
+
+WHITE, BLACK, BYE = 'w', 'b', '-'
+COLOR_CANDIDATES = 8  # соперников, среди которых ищется подходящий по цвету, прежде чем уступить цвет
+
+
+class Entrant:
+    """
+    Участник турнира с данными, нужными для жеребьевки.
+
+    Атрибуты:
+        id (int): Идентификатор пользователя.
+        score (float): Набранные очки.
+        rating (int): Рейтинг для упорядочивания внутри группы очков.
+        colors (str): История цветов по турам: 'w', 'b' или '-' (пропуск тура).
+        opponents (set): Идентификаторы уже встречавшихся соперников.
+        preferred, required: Желательный и обязательный цвет (см. prepare); на время жеребьевки
+            вычисляются один раз, так как проверяются для каждой возможной пары.
+    """
+
+    __slots__ = ('id', 'score', 'rating', 'colors', 'opponents', 'preferred', 'required')
+
+    def __init__(self, id, score=0.0, rating=0, colors='', opponents=()):
+        self.id = id
+        self.score = score
+        self.rating = rating
+        self.colors = colors
+        self.opponents = set(opponents)
+        self.preferred = self.required = None
+
+    @property
+    def had_bye(self):
+        return BYE in self.colors
+
+    def color_balance(self):
+        """Разница между числом партий белыми и черными."""
+        return self.colors.count(WHITE) - self.colors.count(BLACK)
+
+    def color_preference(self):
+        """Желательный цвет в следующем туре ('w', 'b') или None, если цвета сбалансированы и чередуются."""
+        balance = self.color_balance()
+        if balance:
+            return BLACK if balance > 0 else WHITE
+        played = self.colors.replace(BYE, '')
+        if played:
+            return BLACK if played[-1] == WHITE else WHITE
+        return None
+
+    def absolute_preference(self):
+        """
+        Цвет, который участник обязан получить: при дисбалансе в две партии или после двух партий
+        одним цветом подряд. Иначе None.
+        """
+        balance = self.color_balance()
+        if abs(balance) >= 2:
+            return BLACK if balance > 0 else WHITE
+        played = self.colors.replace(BYE, '')
+        if len(played) >= 2 and played[-1] == played[-2]:
+            return BLACK if played[-1] == WHITE else WHITE
+        return None
+
+    def prepare(self):
+        self.preferred = self.color_preference()
+        self.required = self.absolute_preference()
+
+
+def assign_colors(first, second):
+    """
+    Распределяет цвета между двумя участниками; first — более высокий в порядке жеребьевки.
+
+    Сначала удовлетворяется больший дисбаланс цветов, при равных требованиях предпочтение
+    получает first.
+
+    Возвращает:
+        tuple: (белые, черные).
+    """
+    first_abs, second_abs = first.absolute_preference(), second.absolute_preference()
+    if first_abs and first_abs != second_abs:
+        return (first, second) if first_abs == WHITE else (second, first)
+    if second_abs and second_abs != first_abs:
+        return (second, first) if second_abs == WHITE else (first, second)
+    first_pref, second_pref = first.color_preference(), second.color_preference()
+    if first_pref != second_pref:
+        if first_pref == WHITE or second_pref == BLACK:
+            return first, second
+        if first_pref == BLACK or second_pref == WHITE:
+            return second, first
+    if first_pref is None:
+        return first, second
+    # Оба хотят один цвет: его получает тот, у кого дисбаланс больше.
+    if abs(second.color_balance()) > abs(first.color_balance()):
+        return (second, first) if first_pref == WHITE else (first, second)
+    return (first, second) if first_pref == WHITE else (second, first)
+
+
+def colors_compatible(a, b):
+    """Участники не требуют один и тот же цвет."""
+    return a.preferred is None or a.preferred != b.preferred
+
+
+def can_meet(a, b):
+    """Участники еще не играли друг с другом и не обязаны получить один и тот же цвет."""
+    if b.id in a.opponents:
+        return False
+    return a.required is None or a.required != b.required
+
+
+def not_met(a, b):
+    return b.id not in a.opponents
+
+
+def _pick_opponent(player, candidates, meet=can_meet):
+    """
+    Первый кандидат, с которым возможна встреча (meet), по возможности с совместимым цветом
+    (среди первых COLOR_CANDIDATES таких кандидатов).
+    """
+    fallback = None
+    checked = 0
+    for index, candidate in enumerate(candidates):
+        if not meet(player, candidate):
+            continue
+        if colors_compatible(player, candidate):
+            return index
+        if fallback is None:
+            fallback = index
+        checked += 1
+        if checked >= COLOR_CANDIDATES:
+            break
+    return fallback
+
+
+def _pair_bracket(pool):
+    """
+    Жеребьевка одной группы очков: верхняя половина против нижней.
+
+    Возвращает:
+        tuple: (список пар, участники без пары — опускаются в следующую группу).
+    """
+    half = len(pool) // 2
+    upper, lower = pool[:half], pool[half:]
+    pairs, left = [], []
+    for player in upper:
+        index = _pick_opponent(player, lower)
+        if index is None:
+            left.append(player)
+        else:
+            pairs.append((player, lower.pop(index)))
+    # Оставшиеся (из-за повторных встреч или цвета) пробуют сыграть между собой.
+    rest = left + lower
+    left = []
+    while rest:
+        player = rest.pop(0)
+        index = _pick_opponent(player, rest)
+        if index is None:
+            left.append(player)
+        else:
+            pairs.append((player, rest.pop(index)))
+    return pairs, left
+
+
+def _repair(pairs, left, meet):
+    """
+    Допаривает участников, которым не нашлось соперника, перестановкой с уже составленными парами
+    (начиная с нижних). Возвращает тех, кого не удалось допарить с условием meet.
+    """
+    rest = []
+    while left:
+        player = left.pop(0)
+        index = _pick_opponent(player, left, meet)
+        if index is not None:
+            pairs.append((player, left.pop(index)))
+            continue
+        for pair_index in range(len(pairs) - 1, -1, -1):
+            a, b = pairs[pair_index]
+            for stay, moved in ((a, b), (b, a)):
+                if not meet(player, stay):
+                    continue
+                other = next((o for o in left if meet(o, moved)), None)
+                if other is not None:
+                    pairs[pair_index] = (stay, player)
+                    left.remove(other)
+                    pairs.append((moved, other))
+                    break
+            else:
+                continue
+            break
+        else:
+            rest.append(player)
+    return rest
+
+
+def swiss_pairings(entrants):
+    """
+    Жеребьевка очередного тура швейцарской системы.
+
+    Участники упорядочиваются по очкам и рейтингу и делятся на группы с равными очками. В каждой группе
+    верхняя половина играет с нижней; кто не может получить нового соперника, опускается в следующую
+    группу. Повторные встречи и встречи участников, обязанных получить один цвет, исключаются, а цвета
+    выравниваются (см. assign_colors). При нечетном числе участников пропуск тура (bye) получает самый
+    низкий в порядке участник, еще не пропускавший.
+
+    Обычно число проверок пар близко к n * COLOR_CANDIDATES; допаривание перестановками в последней
+    группе в худшем случае квадратично по числу участников.
+
+    Аргументы:
+        entrants (list): Участники Entrant.
+
+    Возвращает:
+        tuple: (список пар (id белых, id черных), id участника с пропуском тура или None).
+    """
+    ordered = sorted(entrants, key=lambda e: (-e.score, -e.rating, e.id))
+    for entrant in ordered:
+        entrant.prepare()
+    bye = None
+    if len(ordered) % 2:
+        bye = next((e for e in reversed(ordered) if not e.had_bye), ordered[-1])
+        ordered.remove(bye)
+
+    pairs, floaters = [], []
+    start = 0
+    while start < len(ordered):
+        end = start
+        while end < len(ordered) and ordered[end].score == ordered[start].score:
+            end += 1
+        bracket_pairs, floaters = _pair_bracket(floaters + ordered[start:end])
+        pairs.extend(bracket_pairs)
+        start = end
+    # Оставшиеся допариваются перестановками: сначала со всеми условиями, затем без требования цвета
+    # и, только если иначе нельзя, с повторной встречей.
+    left = _repair(pairs, floaters, can_meet)
+    left = _repair(pairs, left, not_met)
+    _repair(pairs, left, lambda a, b: True)
+
+    result = []
+    for a, b in pairs:
+        white, black = assign_colors(a, b)
+        result.append((white.id, black.id))
+    return result, bye.id if bye else None
+
+
+def round_robin_rounds(count):
+    """Число туров круговой системы для count участников."""
+    return count - 1 if count % 2 == 0 else count
+
+
+def round_robin_pairings(ids, round_number):
+    """
+    Пары тура круговой системы (метод вращения, таблицы Бергера).
+
+    Первый участник неподвижен, остальные сдвигаются на одну позицию каждый тур, поэтому за
+    round_robin_rounds туров каждый встречается с каждым ровно один раз. Цвета чередуются по турам
+    и доскам. При нечетном числе участников один из них в каждом туре пропускает.
+
+    Аргументы:
+        ids (list): Идентификаторы участников в постоянном порядке (номера по жеребьевке).
+        round_number (int): Номер тура, начиная с 1.
+
+    Возвращает:
+        tuple: (список пар (id белых, id черных), id участника с пропуском тура или None).
+    """
+    players = list(ids)
+    if len(players) % 2:
+        players.append(None)
+    n = len(players)
+    shift = (round_number - 1) % (n - 1)
+    rest = players[1:]
+    rotated = [players[0]] + rest[len(rest) - shift:] + rest[:len(rest) - shift]
+    pairs, bye = [], None
+    for board in range(n // 2):
+        a, b = rotated[board], rotated[n - 1 - board]
+        if a is None or b is None:
+            bye = a if b is None else b
+            continue
+        if (board == 0 and round_number % 2 == 0) or (board > 0 and board % 2 == 1):
+            a, b = b, a
+        pairs.append((a, b))
+    return pairs, bye
@@ -0,0 +1,95 @@
+# backend/pgn.py
+
+import chess
+from backend.history import iter_history
+
+PGN_RESULTS = {'white': '1-0', 'black': '0-1', 'draw': '1/2-1/2'}
+PGN_LINE_WIDTH = 80
+
+
+def pgn_result(result):
+    """Переводит результат партии из базы ('white', 'black', 'draw') в обозначение PGN."""
+    return PGN_RESULTS.get(result, '*')
+
+
+def iter_san_moves(uci_moves):
+    """
+    Лениво переводит последовательность ходов UCI в нотацию SAN.
+
+    Доска обновляется по одному ходу, поэтому для партии любой длины в памяти хранится только
+    текущая позиция, а не весь список ходов в SAN.
+
+    Аргументы:
+        uci_moves (str): Ходы в формате UCI через пробел (поле "Game.moves").
+
+    Возвращает:
+        generator: Пары (номер хода или None, ход в SAN). Номер хода отдается только для ходов белых.
+    """
+    board = chess.Board()
+    for uci in uci_moves.split():
+        move = chess.Move.from_uci(uci)
+        number = board.fullmove_number if board.turn == chess.WHITE else None
+        yield number, board.san(move)
+        board.push(move)
+
+
+def pgn_headers(game):
+    """Возвращает заголовки PGN (семь обязательных тегов, рейтинги, контроль времени и дебют) для партии."""
+    date = game.finished_at or game.started_at
+    white = game.player_white.username if game.player_white else '?'
+    black = game.player_black.username if game.player_black else '?'
+    headers = [
+        ('Event', 'Telegram Chess Bot game'),
+        ('Site', 'Telegram'),
+        ('Date', date.strftime('%Y.%m.%d') if date else '????.??.??'),
+        ('Round', '-'),
+        ('White', white),
+        ('Black', black),
+        ('Result', pgn_result(game.result)),
+    ]
+    if game.white_elo is not None:
+        headers.append(('WhiteElo', str(game.white_elo)))
+    if game.black_elo is not None:
+        headers.append(('BlackElo', str(game.black_elo)))
+    headers.append(('TimeControl', game.time_control or '-'))
+    if game.eco:
+        headers.append(('ECO', game.eco))
+        headers.append(('Opening', game.opening))
+    return headers
+
+
+def game_to_pgn(game):
+    """
+    Формирует текст одной партии в формате PGN.
+
+    Аргументы:
+        game (Game): Завершенная партия с заполненным полем "moves".
+
+    Возвращает:
+        str: Партия в формате PGN, завершенная пустой строкой.
+    """
+    lines = []
+    for name, value in pgn_headers(game):
+        value = value.replace('\\', '\\\\').replace('"', '\\"')
+        lines.append(f'[{name} "{value}"]')
+    lines.append('')
+
+    current = ''
+    tokens = []
+    for number, san in iter_san_moves(game.moves or ''):
+        tokens.append(f'{number}. {san}' if number else san)
+    tokens.append(pgn_result(game.result))
+    for token in tokens:
+        if current and len(current) + 1 + len(token) > PGN_LINE_WIDTH:
+            lines.append(current)
+            current = token
+        else:
+            current = f'{current} {token}' if current else token
+    lines.append(current)
+    return '\n'.join(lines) + '\n\n'
+
+
+def export_user_pgn(user_id):
+    """Генератор PGN всех завершенных партий пользователя: отдает по одной партии за раз, от новых к старым."""
+    for game in iter_history(user_id):
+        yield game_to_pgn(game)
@@ -0,0 +1,317 @@
+# backend/pgn_import.py
+
+import io
+import json
+import logging
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import chess.pgn
+from sqlalchemy import update
+
+from backend.models import db, User, Game, UNUSABLE_PASSWORD
+from backend.eco import classify
+from backend.pgn import PGN_RESULTS
+from backend.replay import CHECKPOINT_INTERVAL
+
+CHUNK_SIZE = 4 * 1024 * 1024  # байт PGN на одну задачу для процесса-обработчика
+BATCH_SIZE = 5000  # партий в одной транзакции
+GAME_START = b'\n[Event '
+RESULTS_FROM_PGN = {tag: result for result, tag in PGN_RESULTS.items()}
+LOOKUP_SLICE = 500  # имен в одном запросе IN (старые SQLite ограничены 999 параметрами)
+
+
+def iter_chunks(mm, start=0, chunk_size=CHUNK_SIZE):
+    """
+    Делит отображенный в память файл PGN на куски, не разрезая партии.
+
+    Граница куска сдвигается вперед до начала следующей партии (строка, начинающаяся с "[Event "),
+    поэтому каждый кусок содержит только целые партии. Файл не читается целиком: поиск границы
+    затрагивает лишь несколько страниц вокруг нее.
+
+    Аргументы:
+        mm (mmap.mmap): Файл PGN, отображенный в память.
+        start (int, необязательный): Смещение, с которого начинается разбиение (для продолжения импорта).
+        chunk_size (int, необязательный): Примерный размер куска в байтах.
+
+    Возвращает:
+        generator: Пары (начало, конец) в байтах.
+    """
+    size = len(mm)
+    pos = start
+    while pos < size:
+        target = pos + chunk_size
+        if target >= size:
+            end = size
+        else:
+            idx = mm.find(GAME_START, target)
+            end = size if idx == -1 else idx + 1
+        yield pos, end
+        pos = end
+
+
+def parse_date(value):
+    """Разбирает дату из тега PGN "Date" (ГГГГ.ММ.ДД); неизвестные части даты дают None."""
+    try:
+        return datetime.strptime(value, '%Y.%m.%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_elo(value):
+    """Разбирает рейтинг из тегов "WhiteElo"/"BlackElo"; отсутствующий рейтинг дает None."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_chunk(path, start, end):
+    """
+    Разбирает партии из куска файла PGN. Выполняется в процессе-обработчике.
+
+    Обработчик получает только путь и смещения, а сам текст читает через mmap, поэтому между
+    процессами не пересылаются большие объемы данных. Партии с ошибками, без результата или
+    без имен игроков пропускаются, как и партии из заданной позиции (теги SetUp/FEN) и партии
+    вариантов шахмат (тег Variant): в базе хранятся только ходы, а все, кто их читает (экспорт,
+    восстановление доски, индекс позиций, дебютный справочник), проигрывают их от начальной позиции.
+
+    Аргументы:
+        path (str): Путь к файлу PGN.
+        start (int): Начало куска в байтах.
+        end (int): Конец куска в байтах.
+
+    Возвращает:
+        tuple: (конец куска, список словарей с данными партий).
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode('utf-8', errors='replace')
+
+    records = []
+    stream = io.StringIO(text)
+    while True:
+        game = chess.pgn.read_game(stream)
+        if game is None:
+            break
+        headers = game.headers
+        result = RESULTS_FROM_PGN.get(headers.get('Result'))
+        white, black = headers.get('White'), headers.get('Black')
+        if game.errors or not result or not white or not black or white == black:
+            continue
+        board = game.board()
+        if type(board) is not chess.Board or board.chess960 or board.fen() != chess.STARTING_FEN:
+            continue
+        moves = []
+        checkpoints = []
+        for move in game.mainline_moves():
+            moves.append(move.uci())
+            board.push(move)
+            if len(moves) % CHECKPOINT_INTERVAL == 0:
+                checkpoints.append(board.fen())
+        uci_moves = ' '.join(moves)
+        eco, opening = classify(uci_moves)
+        records.append({
+            'white': white[:80],
+            'black': black[:80],
+            'white_elo': parse_elo(headers.get('WhiteElo')),
+            'black_elo': parse_elo(headers.get('BlackElo')),
+            'result': result,
+            'moves': uci_moves,
+            'fen': board.fen(),
+            'checkpoints': '\n'.join(checkpoints),
+            'eco': eco,
+            'opening': opening,
+            'time_control': headers.get('TimeControl', '-')[:16],
+            'date': parse_date(headers.get('Date')),
+        })
+    return end, records
+
+
+def map_chunks(path, chunks, workers):
+    """
+    Разбирает куски в пуле процессов, сохраняя порядок результатов.
+
+    В работе одновременно находится не больше 2 * workers кусков, так что память основного процесса
+    не растет с размером файла. Порядок нужен для контрольных точек: смещение можно сохранить,
+    только когда все предыдущие куски уже записаны. При workers == 0 разбор идет в текущем процессе.
+    """
+    if workers == 0:
+        for start, end in chunks:
+            yield parse_chunk(path, start, end)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in chunks:
+            pending.append(executor.submit(parse_chunk, path, start, end))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_checkpoint(checkpoint_path):
+    """Читает контрольную точку импорта; при ее отсутствии импорт начинается с начала файла."""
+    if not os.path.exists(checkpoint_path):
+        return {'offset': 0, 'games': 0}
+    with open(checkpoint_path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_path, offset, games):
+    """Атомарно записывает контрольную точку (через временный файл и os.replace)."""
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'offset': offset, 'games': games}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def resolve_users(records):
+    """
+    Возвращает словарь "имя -> id" для всех игроков пачки, создавая недостающих пользователей.
+
+    Существующие пользователи находятся одним запросом, новые добавляются одной массовой вставкой.
+    Новым пользователям рейтинг берется из последней партии пачки, а пароль недоступен для входа
+    (UNUSABLE_PASSWORD): войти под таким именем нельзя, пока владелец не займет его через /register,
+    сохранив рейтинг и партии.
+    """
+    seeded_elo = {}
+    for record in records:
+        for color in ('white', 'black'):
+            elo = record[f'{color}_elo']
+            if elo is not None or record[color] not in seeded_elo:
+                seeded_elo[record[color]] = elo
+
+    ids = lookup_user_ids(list(seeded_elo))
+    missing = [name for name in seeded_elo if name not in ids]
+    if missing:
+        db.session.execute(User.__table__.insert(), [
+            {'username': name, 'password_hash': UNUSABLE_PASSWORD,
+             'elorating': seeded_elo[name] or 1000, 'wins': 0, 'losses': 0}
+            for name in missing
+        ])
+        ids.update(lookup_user_ids(missing))
+    return ids
+
+
+def lookup_user_ids(usernames):
+    """Находит id пользователей по именам; запросы делятся на части из-за лимита параметров SQLite."""
+    ids = {}
+    for i in range(0, len(usernames), LOOKUP_SLICE):
+        names = usernames[i:i + LOOKUP_SLICE]
+        ids.update(db.session.query(User.username, User.id).filter(User.username.in_(names)).all())
+    return ids
+
+
+def insert_batch(records):
+    """
+    Записывает пачку партий и обновляет счетчики побед и поражений игроков.
+
+    Вставка выполняется одним многострочным INSERT через SQLAlchemy Core, поэтому работает одинаково
+    с SQLite и с серверными СУБД (PostgreSQL и совместимыми). Коммит выполняет вызывающая функция.
+    """
+    ids = resolve_users(records)
+    now = datetime.utcnow()
+    wins, losses = {}, {}
+    rows = []
+    for record in records:
+        white_id, black_id = ids[record['white']], ids[record['black']]
+        played_at = record['date'] or now
+        rows.append({
+            'player_white_id': white_id,
+            'player_black_id': black_id,
+            'fen': record['fen'],
+            'is_active': False,
+            'is_waiting': False,
+            'time_left_white_ms': 0,
+            'time_left_black_ms': 0,
+            'last_move_time': played_at,
+            'result': record['result'],
+            'moves': record['moves'],
+            'checkpoints': record['checkpoints'],
+            'white_elo': record['white_elo'],
+            'black_elo': record['black_elo'],
+            'time_control': record['time_control'],
+            'eco': record['eco'],
+            'opening': record['opening'],
+            'started_at': played_at,
+            'finished_at': played_at,
+        })
+        if record['result'] == 'white':
+            wins[white_id] = wins.get(white_id, 0) + 1
+            losses[black_id] = losses.get(black_id, 0) + 1
+        elif record['result'] == 'black':
+            wins[black_id] = wins.get(black_id, 0) + 1
+            losses[white_id] = losses.get(white_id, 0) + 1
+    db.session.execute(Game.__table__.insert(), rows)
+    for user_id, count in wins.items():
+        db.session.execute(update(User).where(User.id == user_id).values(wins=User.wins + count))
+    for user_id, count in losses.items():
+        db.session.execute(update(User).where(User.id == user_id).values(losses=User.losses + count))
+
+
+def import_pgn(path, batch_size=BATCH_SIZE, workers=None, checkpoint_path=None, chunk_size=CHUNK_SIZE):
+    """
+    Импортирует партии из файла PGN любого размера в базу данных.
+
+    Файл читается через mmap и делится на куски по границам партий, куски разбираются в пуле процессов,
+    а партии записываются пачками по "batch_size" в отдельных транзакциях. После каждой транзакции
+    сохраняется контрольная точка, поэтому прерванный импорт продолжается с последней записанной пачки.
+    Скорость (партий в секунду) пишется в лог после каждой пачки.
+
+    Аргументы:
+        path (str): Путь к файлу PGN.
+        batch_size (int, необязательный): Количество партий в одной транзакции.
+        workers (int, необязательный): Число процессов-обработчиков; по умолчанию os.cpu_count(),
+                                       0 — разбор в текущем процессе.
+        checkpoint_path (str, необязательный): Файл контрольной точки; по умолчанию "<path>.checkpoint".
+        chunk_size (int, необязательный): Примерный размер куска файла для одного обработчика.
+
+    Возвращает:
+        int: Общее количество импортированных партий (с учетом предыдущих запусков).
+
+    Примечания:
+        - Должна вызываться внутри контекста приложения Flask.
+        - После успешного завершения контрольная точка остается и указывает на конец файла,
+          поэтому повторный запуск ничего не импортирует.
+    """
+    checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path)
+    offset, total = checkpoint['offset'], checkpoint['games']
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if os.path.getsize(path) == 0:
+        return total
+
+    started = time.monotonic()
+    imported = 0
+    pending = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunks = iter_chunks(mm, offset, chunk_size)
+        for end, records in map_chunks(path, chunks, workers):
+            pending.extend(records)
+            offset = end
+            if len(pending) < batch_size:
+                continue
+            insert_batch(pending)
+            db.session.commit()
+            imported += len(pending)
+            total += len(pending)
+            pending = []
+            save_checkpoint(checkpoint_path, offset, total)
+            logging.info(f'Imported {total} games, {imported / (time.monotonic() - started):.0f} games/sec')
+
+    if pending:
+        insert_batch(pending)
+        db.session.commit()
+        imported += len(pending)
+        total += len(pending)
+    save_checkpoint(checkpoint_path, offset, total)
+    elapsed = time.monotonic() - started
+    logging.info(f'PGN import finished: {imported} games in {elapsed:.1f}s '
+                 f'({imported / elapsed if elapsed else 0:.0f} games/sec)')
+    return total
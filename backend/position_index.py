@@ -0,0 +1,342 @@
+# backend/position_index.py
+
+import fcntl
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+
+import chess
+import chess.polyglot
+
+RECORD = struct.Struct('<QI')  # 64-битный хеш Зобриста позиции и id партии — 12 байт на запись
+HASH = struct.Struct('<Q')
+MERGE_THRESHOLD = 100000  # записей в дельте, после которых она сливается с основным файлом
+SORT_RUN_SIZE = 5000000  # записей в одном отсортированном фрагменте при полной перестройке
+
+
+def position_hash(board):
+    """Возвращает 64-битный хеш Зобриста позиции (тот же, что в книгах Polyglot)."""
+    return chess.polyglot.zobrist_hash(board)
+
+
+def game_position_hashes(uci_moves):
+    """
+    Возвращает множество хешей всех позиций партии после каждого полухода.
+
+    Начальная позиция не включается (она есть в каждой партии), а повторы позиций внутри партии
+    схлопываются, чтобы партия попадала в результаты поиска один раз.
+    """
+    board = chess.Board()
+    hashes = set()
+    for uci in uci_moves.split():
+        board.push(chess.Move.from_uci(uci))
+        hashes.add(position_hash(board))
+    return hashes
+
+
+@contextmanager
+def locked(path, blocking=True):
+    """
+    Эксклюзивная блокировка файла path (flock) — между процессами и между потоками одного процесса.
+
+    Возвращает:
+        bool: Получена ли блокировка (при blocking=False занятая блокировка дает False).
+    """
+    with open(path, 'ab') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def file_inode(path):
+    """Номер inode файла или None, если файла нет (os.replace подменяет файл новым inode)."""
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+class PositionIndex:
+    """
+    Индекс "позиция -> партии" в виде отсортированного файла записей фиксированной длины.
+
+    Основной файл отсортирован по (хеш, id партии) и читается через mmap, поэтому поиск — это двоичный
+    поиск без загрузки файла в память. Новые партии сначала попадают в дельту — файл "<path>.delta",
+    куда записи только дописываются (так они переживают перезапуск), и ее копию в памяти (словарь).
+    Когда дельта вырастает до порога (merge_due), ее сливают с основным файлом (merge).
+
+    Файлы индекса общие для всех процессов сервера: запись в дельту и подмена файлов идут под
+    блокировкой "<path>.lock", а перед каждым обращением refresh подхватывает изменения, сделанные
+    другими процессами (дописанные записи, новый основной файл после слияния или перестройки).
+    """
+
+    def __init__(self, path, merge_threshold=MERGE_THRESHOLD):
+        self.path = path
+        self.delta_path = f'{path}.delta'
+        self.lock_path = f'{path}.lock'
+        self.merge_lock_path = f'{path}.merge.lock'
+        self.merge_threshold = merge_threshold
+        self._file = None
+        self._mm = None
+        self._count = 0
+        self._delta = None  # открытый файл дельты: пока он открыт, его inode не может достаться новому файлу
+        self._delta_offset = 0
+        self._pending = {}
+        self._pending_count = 0
+        self.refresh()
+
+    def _open(self):
+        """Отображает основной файл в память (пустой или отсутствующий файл — пустой индекс)."""
+        self.close()
+        if os.path.exists(self.path):
+            self._file = open(self.path, 'rb')
+            self._count = os.fstat(self._file.fileno()).st_size // RECORD.size
+            if self._count:
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _reset_delta(self):
+        if self._delta is not None:
+            self._delta.close()
+        self._delta = None
+        self._delta_offset = 0
+        self._pending = {}
+        self._pending_count = 0
+
+    def refresh(self):
+        """
+        Приводит индекс в памяти к файлам на диске: после подмены основного файла (слияние,
+        перестройка) он отображается заново вместе с дельтой, а из дельты дочитываются записи,
+        дописанные после прошлого обращения, в том числе другими процессами.
+        """
+        with locked(self.lock_path):
+            main_inode = file_inode(self.path)
+            if main_inode != (os.fstat(self._file.fileno()).st_ino if self._file is not None else None):
+                self._open()
+                self._reset_delta()
+            delta_inode = file_inode(self.delta_path)
+            if self._delta is not None and delta_inode != os.fstat(self._delta.fileno()).st_ino:
+                self._reset_delta()
+            if delta_inode is None:
+                return
+            if self._delta is None:
+                self._delta = open(self.delta_path, 'rb')
+            self._delta.seek(self._delta_offset)
+            data = self._delta.read()
+        usable = len(data) - len(data) % RECORD.size  # недописанная при сбое запись отбрасывается
+        for key, game_id in RECORD.iter_unpack(data[:usable]):
+            self._pending.setdefault(key, []).append(game_id)
+        self._pending_count += usable // RECORD.size
+        self._delta_offset += usable
+
+    def close(self):
+        """Освобождает mmap и файл основного индекса."""
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._mm = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count + self._pending_count
+
+    def add_game(self, game_id, uci_moves):
+        """
+        Добавляет в индекс все позиции завершенной партии.
+
+        Сливать дельту здесь нельзя: слияние переписывает весь основной файл. Вызывающий код
+        проверяет merge_due и запускает merge в фоне.
+
+        Аргументы:
+            game_id (int): Идентификатор партии.
+            uci_moves (str): Ходы партии в формате UCI через пробел.
+        """
+        hashes = game_position_hashes(uci_moves)
+        if not hashes:
+            return
+        with locked(self.lock_path), open(self.delta_path, 'ab') as f:
+            f.write(b''.join(RECORD.pack(key, game_id) for key in hashes))
+        self.refresh()
+
+    def merge_due(self):
+        """Выросла ли дельта на диске (со всеми записями других процессов) до порога слияния."""
+        try:
+            return os.path.getsize(self.delta_path) // RECORD.size >= self.merge_threshold
+        except FileNotFoundError:
+            return False
+
+    def merge(self):
+        """
+        Сливает дельту с основным файлом.
+
+        Обе последовательности отсортированы, поэтому слияние идет одним проходом с потоковой записью
+        во временный файл, который затем атомарно подменяет основной. Под блокировкой файлов индекса
+        выполняются только снимок дельты и подмена: записи, дописанные в дельту во время слияния
+        (в том числе другими процессами), остаются в ней. Одновременно идет не больше одного слияния.
+        Объект в памяти не меняется — новый файл подхватит refresh, — поэтому merge можно выполнять
+        в отдельном потоке.
+
+        Возвращает:
+            bool: False, если слияние уже выполняется или индекс перестроили во время слияния.
+        """
+        with locked(self.merge_lock_path, blocking=False) as acquired:
+            if not acquired:
+                return False
+            with locked(self.lock_path):
+                main = open(self.path, 'rb') if os.path.exists(self.path) else None
+                try:
+                    with open(self.delta_path, 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    data = b''
+            try:
+                merged = len(data) - len(data) % RECORD.size
+                if not merged:
+                    return True
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as out:
+                    write_records(out, heapq.merge(read_records(main), sorted(RECORD.iter_unpack(data[:merged]))))
+                    count = out.tell() // RECORD.size
+                with locked(self.lock_path):
+                    if file_inode(self.path) != (os.fstat(main.fileno()).st_ino if main is not None else None):
+                        os.remove(tmp_path)
+                        return False
+                    os.replace(tmp_path, self.path)
+                    with open(self.delta_path, 'rb') as f:
+                        f.seek(merged)
+                        tail = f.read()
+                    if tail:
+                        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                        with os.fdopen(fd, 'wb') as out:
+                            out.write(tail)
+                        os.replace(tmp_path, self.delta_path)
+                    else:
+                        os.remove(self.delta_path)
+            finally:
+                if main is not None:
+                    main.close()
+        logging.info(f'Position index merged: {count} records')
+        return True
+
+    def _bound(self, key, upper):
+        """Двоичный поиск по основному файлу: первая запись с хешем >= key (или > key при upper=True)."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = HASH.unpack_from(self._mm, mid * RECORD.size)[0]
+            if value < key or (upper and value == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, key, limit=100):
+        """
+        Возвращает id партий, в которых встречалась позиция с данным хешем, от новых к старым.
+
+        Аргументы:
+            key (int): Хеш позиции (position_hash).
+            limit (int, необязательный): Максимальное количество результатов.
+
+        Возвращает:
+            tuple: (список id партий, общее количество найденных партий).
+        """
+        self.refresh()
+        ids = list(self._pending.get(key, ()))
+        total = len(ids)
+        if self._mm is not None:
+            start = self._bound(key, upper=False)
+            end = self._bound(key, upper=True)
+            total += end - start
+            # Записи с одинаковым хешем отсортированы по id, поэтому самые новые партии — в конце диапазона.
+            for i in range(end - 1, max(start, end - limit) - 1, -1):
+                ids.append(RECORD.unpack_from(self._mm, i * RECORD.size)[1])
+        ids.sort(reverse=True)
+        return ids[:limit], total
+
+    def lookup_board(self, board, limit=100):
+        """То же, что lookup, но принимает доску вместо хеша."""
+        return self.lookup(position_hash(board), limit)
+
+
+def read_records(f):
+    """Последовательно читает записи (хеш, id партии) из открытого файла (None — пустой файл)."""
+    if f is None:
+        return
+    f.seek(0)
+    while True:
+        data = f.read(RECORD.size * 65536)
+        if not data:
+            return
+        yield from RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size])
+
+
+def write_records(out, records):
+    """Записывает последовательность (хеш, id партии) в файл пачками."""
+    buffer = []
+    for key, game_id in records:
+        buffer.append(RECORD.pack(key, game_id))
+        if len(buffer) >= 65536:
+            out.write(b''.join(buffer))
+            buffer = []
+    out.write(b''.join(buffer))
+
+
+def build_index(path, games, run_size=SORT_RUN_SIZE):
+    """
+    Строит индекс заново по всем партиям (внешняя сортировка).
+
+    Записи накапливаются фрагментами по run_size, каждый фрагмент сортируется и сбрасывается во
+    временный файл, затем фрагменты сливаются в итоговый файл. Память ограничена размером фрагмента,
+    сколько бы партий ни было в базе.
+
+    Аргументы:
+        path (str): Путь к файлу индекса.
+        games (iterable): Пары (id партии, ходы в формате UCI).
+        run_size (int, необязательный): Количество записей в одном фрагменте.
+
+    Возвращает:
+        int: Количество записей в индексе.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    runs = []
+    chunk = []
+
+    def flush():
+        chunk.sort()
+        run = tempfile.TemporaryFile(dir=directory)
+        write_records(run, chunk)
+        run.seek(0)
+        runs.append(run)
+        chunk.clear()
+
+    for game_id, uci_moves in games:
+        chunk.extend((key, game_id) for key in game_position_hashes(uci_moves))
+        if len(chunk) >= run_size:
+            flush()
+    if chunk:
+        flush()
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        write_records(out, heapq.merge(*(read_records(run) for run in runs)))
+        count = out.tell() // RECORD.size
+    for run in runs:
+        run.close()
+    with locked(f'{path}.lock'):
+        os.replace(tmp_path, path)
+        if os.path.exists(f'{path}.delta'):
+            os.remove(f'{path}.delta')
+    return count
@@ -0,0 +1,128 @@
+# backend/presence.py
+
+import time
+
+RECONNECT_GRACE = 30  # секунд, в течение которых отключившийся игрок считается присутствующим
+
+
+class JoinResult:
+    """Итог подключения игрока к комнате (см. Presence.join)."""
+
+    __slots__ = ('both_present', 'first_start', 'reconnected')
+
+    def __init__(self, both_present, first_start, reconnected):
+        self.both_present = both_present
+        self.first_start = first_start
+        self.reconnected = reconnected
+
+
+class Presence:
+    """
+    Присутствие игроков в комнатах партий по идентификаторам соединений Socket.IO (sid).
+
+    У одного игрока может быть несколько соединений (две вкладки, переподключение до обнаружения
+    разрыва старого), поэтому игрок присутствует, пока у него есть хотя бы одно соединение.
+    После потери последнего соединения игроку дается время на переподключение: в этот период он
+    не считается вернувшимся заново, и событие начала партии не повторяется.
+
+    Все структуры освобождаются при release (конец партии) или после истечения времени ожидания
+    всех игроков комнаты (см. expired_rooms), поэтому память не растет с числом сыгранных партий.
+    """
+
+    def __init__(self, grace=RECONNECT_GRACE, clock=time.monotonic):
+        self.grace = grace
+        self.clock = clock
+        self.sids = {}  # sid -> (комната, id пользователя)
+        self.rooms = {}  # комната -> {id пользователя: множество sid}
+        self.away = {}  # комната -> {id пользователя: момент потери последнего соединения}
+        self.started = set()  # комнаты, где событие начала партии уже отправлено
+
+    def join(self, sid, room, user_id):
+        """
+        Регистрирует соединение игрока в комнате.
+
+        Аргументы:
+            sid (str): Идентификатор соединения.
+            room (str): Комната партии.
+            user_id (int): Идентификатор игрока.
+
+        Возвращает:
+            JoinResult: both_present — в комнате оба игрока; first_start — партию нужно начать
+            (оба впервые собрались вместе); reconnected — игрок вернулся после разрыва.
+        """
+        previous = self.sids.get(sid)
+        if previous and previous != (room, user_id):
+            self.leave(sid)
+        self.sids[sid] = (room, user_id)
+        members = self.rooms.setdefault(room, {})
+        members.setdefault(user_id, set()).add(sid)
+        away = self.away.get(room, {})
+        reconnected = away.pop(user_id, None) is not None
+        if room in self.away and not away:
+            del self.away[room]
+        both_present = len(members) == 2
+        first_start = both_present and room not in self.started
+        if first_start:
+            self.started.add(room)
+        return JoinResult(both_present, first_start, reconnected)
+
+    def leave(self, sid):
+        """
+        Снимает соединение (при отключении клиента).
+
+        Возвращает:
+            tuple: (комната, id пользователя, True, если у игрока не осталось соединений)
+                   или None для неизвестного sid.
+        """
+        entry = self.sids.pop(sid, None)
+        if entry is None:
+            return None
+        room, user_id = entry
+        connections = self.rooms.get(room, {}).get(user_id)
+        if connections is None:
+            return room, user_id, True
+        connections.discard(sid)
+        if connections:
+            return room, user_id, False
+        self.away.setdefault(room, {})[user_id] = self.clock()
+        return room, user_id, True
+
+    def is_connected(self, room, user_id):
+        """Есть ли у игрока открытое соединение с комнатой (без учета времени на переподключение)."""
+        return bool(self.rooms.get(room, {}).get(user_id))
+
+    def is_present(self, room, user_id):
+        """Игрок присутствует, если у него есть соединение или не истекло время на переподключение."""
+        if self.rooms.get(room, {}).get(user_id):
+            return True
+        left_at = self.away.get(room, {}).get(user_id)
+        return left_at is not None and self.clock() - left_at < self.grace
+
+    def expired_players(self):
+        """Возвращает пары (комната, id пользователя), у которых истекло время на переподключение."""
+        now = self.clock()
+        return [(room, user_id) for room, away in self.away.items()
+                for user_id, left_at in away.items() if now - left_at >= self.grace]
+
+    def expired_rooms(self):
+        """Комнаты, все игроки которых отключились и не вернулись за отведенное время."""
+        now = self.clock()
+        rooms = []
+        for room, members in self.rooms.items():
+            if any(members.values()):
+                continue
+            away = self.away.get(room, {})
+            if all(now - away.get(user_id, now) >= self.grace for user_id in members):
+                rooms.append(room)
+        return rooms
+
+    def release(self, room):
+        """Удаляет все сведения о комнате (партия окончена или брошена)."""
+        for sids in self.rooms.pop(room, {}).values():
+            for sid in sids:
+                self.sids.pop(sid, None)
+        self.away.pop(room, None)
+        self.started.discard(room)
+
+    def __len__(self):
+        return len(self.rooms)
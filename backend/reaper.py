@@ -0,0 +1,96 @@
+# backend/reaper.py
+
+from datetime import timedelta
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import joinedload
+from backend.models import db, User, Game
+
+WAITING_GAME_TTL = timedelta(minutes=10)  # сколько партия может ждать соперника
+ABANDON_MARGIN = timedelta(seconds=30)  # запас сверх времени на часах перед признанием партии брошенной
+REAPER_BATCH_SIZE = 200  # строк в одной пачке (одна короткая транзакция)
+REAPER_MAX_BATCHES = 10  # пачек каждого вида за один проход
+
+
+def expire_waiting_games(now, ttl=WAITING_GAME_TTL, batch_size=REAPER_BATCH_SIZE):
+    """
+    Снимает одну пачку партий, слишком долго ожидающих соперника.
+
+    Такие партии закрываются без результата и без времени окончания, поэтому не попадают в историю.
+    Условие is_waiting повторяется в UPDATE: партия, к которой соперник присоединился между
+    выборкой и обновлением, не закрывается.
+
+    Возвращает:
+        list: Идентификаторы закрытых партий (пустой список — больше нечего закрывать).
+    """
+    cutoff = now - ttl
+    ids = [row.id for row in (db.session.query(Game.id)
+                              .filter(Game.is_active.is_(True), Game.is_waiting.is_(True),
+                                      Game.last_move_time < cutoff)
+                              .order_by(Game.last_move_time)
+                              .limit(batch_size))]
+    if ids:
+        db.session.execute(update(Game)
+                           .where(Game.id.in_(ids), Game.is_waiting.is_(True))
+                           .values(is_active=False, is_waiting=False)
+                           .execution_options(synchronize_session=False))
+    db.session.commit()
+    return ids
+
+
+def side_to_move(game):
+    """Цвет игрока, чей ход в партии, по числу сделанных полуходов."""
+    return 'white' if len((game.moves or '').split()) % 2 == 0 else 'black'
+
+
+def is_flagged(game, now, margin=ABANDON_MARGIN):
+    """Проверяет, истекло ли (с запасом margin) время на часах игрока, чей ход."""
+    time_left = game.time_left_white_ms if side_to_move(game) == 'white' else game.time_left_black_ms
+    return game.last_move_time + timedelta(milliseconds=time_left or 0) + margin < now
+
+
+def iter_abandoned_games(now, margin=ABANDON_MARGIN, batch_size=REAPER_BATCH_SIZE, max_batches=REAPER_MAX_BATCHES):
+    """
+    Находит идущие партии, в которых игрок, чей ход, давно просрочил время.
+
+    Кандидаты выбираются по индексу (is_active, is_waiting, last_move_time) от самых старых,
+    постранично по (last_move_time, id); окончательная проверка часов выполняется в Python.
+    Каждая пачка читается отдельным запросом вместе с игроками.
+
+    Возвращает:
+        generator: Пачки (списки) брошенных партий Game.
+    """
+    cutoff = now - margin
+    after = None
+    for _ in range(max_batches):
+        query = (Game.query
+                 .options(joinedload(Game.player_white), joinedload(Game.player_black))
+                 .filter(Game.is_active.is_(True), Game.is_waiting.is_(False), Game.last_move_time < cutoff))
+        if after:
+            query = query.filter(or_(Game.last_move_time > after[0],
+                                     and_(Game.last_move_time == after[0], Game.id > after[1])))
+        batch = query.order_by(Game.last_move_time, Game.id).limit(batch_size).all()
+        if not batch:
+            return
+        after = (batch[-1].last_move_time, batch[-1].id)
+        flagged = [game for game in batch if game.player_black_id and is_flagged(game, now, margin)]
+        if flagged:
+            yield flagged
+
+
+def purge_expired_tokens(now, batch_size=REAPER_BATCH_SIZE):
+    """
+    Удаляет одну пачку просроченных токенов авторизации.
+
+    Возвращает:
+        int: Количество удаленных токенов.
+    """
+    ids = [row.id for row in (db.session.query(User.id)
+                              .filter(User.auth_token_expires_at < now)
+                              .limit(batch_size))]
+    if ids:
+        db.session.execute(update(User)
+                           .where(User.id.in_(ids), User.auth_token_expires_at < now)
+                           .values(auth_token=None, auth_token_expires_at=None)
+                           .execution_options(synchronize_session=False))
+    db.session.commit()
+    return len(ids)
@@ -0,0 +1,99 @@
+# backend/replay.py
+
+import chess
+from backend.models import db, Game, ArchivedGame
+
+CHECKPOINT_INTERVAL = 16  # полуходов между сохраненными позициями партии
+REPLAY_SPEED = 2.0  # полуходов в секунду при потоковом просмотре по умолчанию
+MAX_REPLAY_SPEED = 20.0
+
+
+def build_checkpoints(uci_moves, interval=CHECKPOINT_INTERVAL):
+    """
+    Позиции партии через каждые interval полуходов.
+
+    Аргументы:
+        uci_moves (str): Ходы партии в UCI через пробел.
+
+    Возвращает:
+        str: FEN позиций после полуходов interval, 2 * interval, ... по одной в строке
+             (пустая строка для партии короче interval).
+    """
+    board = chess.Board()
+    checkpoints = []
+    for ply, uci in enumerate((uci_moves or '').split(), 1):
+        board.push(chess.Move.from_uci(uci))
+        if ply % interval == 0:
+            checkpoints.append(board.fen())
+    return '\n'.join(checkpoints)
+
+
+def position_at(uci_moves, checkpoints, ply, interval=CHECKPOINT_INTERVAL):
+    """
+    Позиция партии после ply полуходов.
+
+    Доска берется из ближайшей предыдущей сохраненной позиции, после чего доигрываются не больше
+    interval - 1 ходов. Без сохраненных позиций (checkpoints is None — партия еще идет или сохранена
+    до их появления) ходы проигрываются с начала.
+
+    Аргументы:
+        uci_moves (str): Ходы партии в UCI через пробел.
+        checkpoints (str): Сохраненные позиции (build_checkpoints) или None.
+        ply (int): Номер полухода, 0 — начальная позиция.
+
+    Возвращает:
+        tuple: (доска, последний ход в UCI или None, число проигранных ходов).
+
+    Ошибки:
+        ValueError: ply меньше 0 или больше числа ходов партии.
+    """
+    moves = (uci_moves or '').split()
+    if not 0 <= ply <= len(moves):
+        raise ValueError(f'Ply must be between 0 and {len(moves)}')
+    saved = checkpoints.split('\n') if checkpoints else []
+    index = min(ply // interval, len(saved)) if checkpoints is not None else 0
+    if index:
+        board = chess.Board(saved[index - 1])
+        start = index * interval
+    else:
+        board = chess.Board()
+        start = 0
+    for uci in moves[start:ply]:
+        board.push(chess.Move.from_uci(uci))
+    return board, moves[ply - 1] if ply else None, ply - start
+
+
+def load_replay(game_id):
+    """
+    Ходы и сохраненные позиции партии из основной базы или архива.
+
+    Возвращает:
+        tuple: (ходы в UCI, сохраненные позиции или None, идет ли партия) или None, если партии нет.
+    """
+    row = (db.session.query(Game.moves, Game.checkpoints, Game.is_active)
+           .filter(Game.id == game_id)
+           .first())
+    if row is not None:
+        return row.moves or '', row.checkpoints, bool(row.is_active)
+    archived = db.session.get(ArchivedGame, game_id)
+    if archived is not None:
+        return archived.moves, archived.checkpoints, False
+    return None
+
+
+def replay_frames(uci_moves, start=0):
+    """
+    Кадры потокового просмотра партии начиная с полухода start.
+
+    Возвращает:
+        generator: Словари {'ply', 'move', 'san', 'fen'} для каждого хода после start.
+    """
+    moves = (uci_moves or '').split()
+    board = chess.Board()
+    for uci in moves[:start]:
+        board.push(chess.Move.from_uci(uci))
+    for ply, uci in enumerate(moves[start:], start + 1):
+        move = chess.Move.from_uci(uci)
+        san = board.san(move)
+        board.push(move)
+        yield {'ply': ply, 'move': uci, 'san': san, 'fen': board.fen()}
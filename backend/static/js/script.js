@@ -17,22 +17,28 @@ const playerBlackElement = document.getElementById('player-black');
 const eloWhiteElement = document.getElementById('elo-white');
 const eloBlackElement = document.getElementById('elo-black');
 const currentTurnElement = document.getElementById('current-turn');
+const openingElement = document.getElementById('opening-info');
 const timerWhiteElement = document.getElementById('timer-white');
 const timerBlackElement = document.getElementById('timer-black');
 const resignButton = document.getElementById('resign-btn');
 const offerDrawButton = document.getElementById('offer-draw-btn');
+const explorerElement = document.getElementById('explorer');
+const explorerMovesElement = document.getElementById('explorer-moves');
 
 let gameStarted = false;
 let myColor = null; // 'white' or 'black'
 let chessGame = new Chess();
 let board = null;
-let timeLeftWhite = 600;
-let timeLeftBlack = 600;
+const LOCAL_TIME_MS = 600000;
+const TIMER_TICK_MS = 100;
+let timeLeftWhite = LOCAL_TIME_MS; // миллисекунды
+let timeLeftBlack = LOCAL_TIME_MS;
 let timerInterval = null;
 let isGameOver = false;
 let currentPlayerLocal = 'white';
 
-function formatTime(seconds) {
+function formatTime(milliseconds) {
+    const seconds = Math.ceil(Math.max(0, milliseconds) / 1000);
     const minutes = Math.floor(seconds / 60);
     const remainingSeconds = seconds % 60;
     return `${minutes}:${remainingSeconds < 10 ? '0' + remainingSeconds : remainingSeconds}`;
@@ -55,71 +61,50 @@ function startTimer() {
  * Эта функция управляет обратным отсчетом времени для обоих игроков в шахматной игре. Она обрабатывает как локальные,
  * так и онлайн-игры отдельно, проверяя, чей сейчас ход, и уменьшая оставшееся время для активного игрока.
  * Если у игрока заканчивается время, игра завершается, и победитель определяется. Функция также обновляет отображение
- * времени и отправляет обновленные данные на сервер для онлайн-игры.
- * 
- * Таймер останавливается, если игра завершена или если игра еще не началась. Таймер обновляется каждую секунду и
- * автоматически останавливается, когда у игрока заканчивается время.
+ * времени.
  * 
+ * Таймер останавливается, если игра завершена или если игра еще не началась. Время хранится в миллисекундах;
+ * на каждом срабатывании вычитается реально прошедшее время (performance.now), поэтому задержки setInterval
+ * не накапливаются.
+ *
  * Поведение таймера зависит от того, играется ли игра локально или онлайн:
- * - **Локальная игра**: Таймер отсчитывает время для каждого игрока локально. Обновления по сети не отправляются.
- * - **Онлайн-игра**: Таймер отсчитывает время для текущего игрока и отправляет обновленное время на сервер через событие сокета.
- * 
+ * - **Локальная игра**: Таймер отсчитывает время для каждого игрока локально и завершает игру по времени.
+ * - **Онлайн-игра**: Таймер только показывает время; часы ведет сервер, который присылает точное время
+ *   в событиях `game_started`, `move` и `clock` и сам завершает партию по времени.
+ *
  * Возвращает:
- *   Функция не возвращает значения. Она изменяет состояние игры, обновляет отображение и отправляет
- *   сообщения через сокет для онлайн-игры.
+ *   Функция не возвращает значения. Она изменяет состояние игры и обновляет отображение.
  */
     if (timerInterval) clearInterval(timerInterval);
+    let lastTick = performance.now();
     timerInterval = setInterval(() => {
         if (!gameStarted || isGameOver) {
             clearInterval(timerInterval);
             return;
         }
 
-        if (localGame) {
-            if (chessGame.turn() === 'w') {
-                if (timeLeftWhite > 0) {
-                    timeLeftWhite--;
-                    updateTimerDisplay();
-                } else {
-                    clearInterval(timerInterval);
-                    statusElement.textContent = "Белые проиграли по времени. Черные победили!";
-                    gameOver('black');
-                }
-            } else {
-                if (timeLeftBlack > 0) {
-                    timeLeftBlack--;
-                    updateTimerDisplay();
-                } else {
-                    clearInterval(timerInterval);
-                    statusElement.textContent = "Черные проиграли по времени. Белые победили!";
-                    gameOver('white');
-                }
-            }
+        const now = performance.now();
+        const elapsed = now - lastTick;
+        lastTick = now;
+        if (chessGame.turn() === 'w') {
+            timeLeftWhite = Math.max(0, timeLeftWhite - elapsed);
         } else {
-            const currentColor = chessGame.turn() === 'w' ? 'white' : 'black';
-            if (currentColor === 'white') {
-                if (timeLeftWhite > 0) {
-                    timeLeftWhite--;
-                    updateTimerDisplay();
-                    socket.emit('update_time', { game_id: gameId, color: 'white', time_left: timeLeftWhite });
-                } else {
-                    clearInterval(timerInterval);
-                    statusElement.textContent = "Белые проиграли по времени. Черные победили!";
-                    gameOver('black');
-                }
-            } else {
-                if (timeLeftBlack > 0) {
-                    timeLeftBlack--;
-                    updateTimerDisplay();
-                    socket.emit('update_time', { game_id: gameId, color: 'black', time_left: timeLeftBlack });
-                } else {
-                    clearInterval(timerInterval);
-                    statusElement.textContent = "Черные проиграли по времени. Белые победили!";
-                    gameOver('white');
-                }
+            timeLeftBlack = Math.max(0, timeLeftBlack - elapsed);
+        }
+        updateTimerDisplay();
+
+        if (localGame) {
+            if (timeLeftWhite === 0) {
+                clearInterval(timerInterval);
+                statusElement.textContent = "Белые проиграли по времени. Черные победили!";
+                gameOver('black');
+            } else if (timeLeftBlack === 0) {
+                clearInterval(timerInterval);
+                statusElement.textContent = "Черные проиграли по времени. Белые победили!";
+                gameOver('white');
             }
         }
-    }, 1000);
+    }, TIMER_TICK_MS);
 }
 
 function gameOver(winnerColor) {
@@ -152,6 +137,39 @@ function gameOver(winnerColor) {
     }
 }
 
+function updateExplorer(fen) {
+    /**
+ * Запрашивает дебютный справочник для позиции и выводит ходы в таблицу.
+ *
+ * Только для локальной игры и после окончания онлайн-партии: во время партии справочник
+ * был бы подсказкой игроку (сервер в этом случае отвечает 403). Без входа сервер отвечает 401,
+ * и таблица остается пустой.
+ *
+ * Аргументы:
+ *   - `fen` (string): Позиция в нотации FEN.
+ */
+    fetch(`/explorer?fen=${encodeURIComponent(fen)}`)
+        .then((response) => response.json())
+        .then((data) => {
+            explorerMovesElement.innerHTML = '';
+            (data.moves || []).slice(0, 8).forEach((move) => {
+                const row = document.createElement('tr');
+                [
+                    move.san,
+                    move.games,
+                    `${move.white_wins} / ${move.draws} / ${move.black_wins}`,
+                    move.average_rating === null ? '-' : move.average_rating
+                ].forEach((value) => {
+                    const cell = document.createElement('td');
+                    cell.textContent = value;
+                    row.appendChild(cell);
+                });
+                explorerMovesElement.appendChild(row);
+            });
+        })
+        .catch((error) => console.error('Explorer request failed:', error));
+}
+
 function capitalizeFirstLetter(string) {
     return string.charAt(0).toUpperCase() + string.slice(1);
 }
@@ -222,6 +240,7 @@ function onDropLocal(source, target) {
     currentTurnElement.textContent = `Current Turn: ${capitalizeFirstLetter(chessGame.turn() === 'w' ? 'white' : 'black')}`;
     statusElement.textContent = "Move made. Your turn again.";
     switchOrientationLocal();
+    updateExplorer(chessGame.fen());
     startTimer();
 }
 
@@ -242,18 +261,27 @@ if (localGame) {
     initializeLocalBoard();
     gameStarted = true;
     currentTurnElement.textContent = `Current Turn: White`;
-    timeLeftWhite = 600;
-    timeLeftBlack = 600;
+    timeLeftWhite = LOCAL_TIME_MS;
+    timeLeftBlack = LOCAL_TIME_MS;
     updateTimerDisplay();
     playerWhiteElement.textContent = "White: Local Player (You)";
     playerBlackElement.textContent = "Black: Local Player (You)";
     startTimer();
+    updateExplorer(chessGame.fen());
 } else {
     if (!gameId || !authToken) {
         statusElement.textContent = 'Missing game_id or token.';
         throw new Error('Missing game_id or token.');
     }
 
+    // Дебютный справочник во время онлайн-партии скрыт и показывается только после ее окончания.
+    explorerElement.hidden = true;
+
+    function showExplorerAfterGame() {
+        explorerElement.hidden = false;
+        updateExplorer(chessGame.fen());
+    }
+
     socket = io({
         query: {
             token: authToken,
@@ -283,6 +311,7 @@ if (localGame) {
         playerBlackElement.textContent = `Black: ${playerBlack.username}`;
         eloWhiteElement.textContent = `White ELO: ${playerWhite.elorating}`;
         eloBlackElement.textContent = `Black ELO: ${playerBlack.elorating}`;
+        openingElement.textContent = data.eco ? `Opening: ${data.eco} ${data.opening}` : '';
       
         // Определяем цвет игрока
         if (playerWhite.username === username) {
@@ -299,8 +328,8 @@ if (localGame) {
         statusElement.textContent = "Game started! You can make your move.";
         gameStarted = true;
         currentTurnElement.textContent = `Current Turn: ${capitalizeFirstLetter(data.current_turn)}`;
-        timeLeftWhite = data.time_left_white;
-        timeLeftBlack = data.time_left_black;
+        timeLeftWhite = data.time_left_white_ms;
+        timeLeftBlack = data.time_left_black_ms;
         updateTimerDisplay();
         chessGame.load(data.fen);
         initializeOnlineBoard(data.fen);
@@ -311,20 +340,42 @@ if (localGame) {
     socket.on('move', (data) => {
         chessGame.load(data.fen);
         board.position(data.fen);
-        statusElement.textContent = "Opponent moved. Your turn!";
+        statusElement.textContent = data.current_turn === myColor ? "Opponent moved. Your turn!"
+            : "Premove played. Waiting for opponent...";
         currentTurnElement.textContent = `Current Turn: ${capitalizeFirstLetter(data.current_turn)}`;
-        timeLeftWhite = data.time_left_white;
-        timeLeftBlack = data.time_left_black;
+        timeLeftWhite = data.time_left_white_ms;
+        timeLeftBlack = data.time_left_black_ms;
         updateTimerDisplay();
         startTimer();
     });
 
+    // Точное время с сервера после каждого хода (в том числе своего).
+    socket.on('clock', (data) => {
+        timeLeftWhite = data.time_left_white_ms;
+        timeLeftBlack = data.time_left_black_ms;
+        updateTimerDisplay();
+    });
+
+    // Замер задержки сети: сервер засчитывает ее игроку, чтобы она не съедала время на часах.
+    socket.on('clock_ping', () => {
+        socket.emit('clock_pong');
+    });
+
+    socket.on('premove_set', (data) => {
+        statusElement.textContent = `Premove ${data.move.from}-${data.move.to} queued.`;
+    });
+
+    socket.on('premove_cancelled', () => {
+        statusElement.textContent = "Premove cancelled.";
+    });
+
     socket.on('game_over', (data) => {
         statusElement.textContent = `Game over: ${data.result}`;
         gameStarted = false;
         isGameOver = true;
         clearInterval(timerInterval);
         board.destroy();
+        showExplorerAfterGame();
     });
 
     socket.on('draw_offer', (data) => {
@@ -347,6 +398,7 @@ if (localGame) {
         isGameOver = true;
         clearInterval(timerInterval);
         board.destroy();
+        showExplorerAfterGame();
     });
 
     socket.on('error', (data) => {
@@ -390,13 +442,16 @@ if (localGame) {
             (myColor === 'black' && piece.search(/^b/) === -1)) {
             return false;
         }
-        if ((myColor === 'white' && chessGame.turn() !== 'w') ||
-            (myColor === 'black' && chessGame.turn() !== 'b')) {
-            return false;
-        }
     }
 
     function onDropOnline(source, target) {
+        if (chessGame.turn() !== myColor[0]) {
+            // Ход не в свою очередь отправляется как предварительный: сервер применит его после хода соперника.
+            if (source === target) return 'snapback';
+            socket.emit('move', { 'game_id': gameId, 'move': { 'from': source, 'to': target } });
+            statusElement.textContent = `Premove ${source}-${target} queued.`;
+            return 'snapback';
+        }
         const move = chessGame.move({
             from: source,
             to: target,
@@ -0,0 +1,340 @@
+# backend/tournament.py
+
+import math
+from datetime import datetime, timedelta
+import chess
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import joinedload
+from backend.models import db, Game, Tournament, TournamentPlayer, User
+from backend.pairing import Entrant, BYE, BLACK, WHITE, round_robin_pairings, round_robin_rounds, swiss_pairings
+from backend import arena, outbox
+from backend.clock import parse_time_control, pgn_time_control
+
+KINDS = ('swiss', 'round_robin', 'arena')
+MIN_PLAYERS = 2
+BYE_POINTS = 1.0
+POINTS = {'white': (1.0, 0.0), 'black': (0.0, 1.0), 'draw': (0.5, 0.5)}
+
+
+def swiss_rounds(count):
+    """Число туров швейцарки по умолчанию: достаточно, чтобы выявить единственного лидера (log2 участников)."""
+    return max(1, math.ceil(math.log2(count)))
+
+
+def create_tournament(name, kind, creator, rounds=None, time_control='600+0', duration=None):
+    """
+    Создает турнир в статусе регистрации (коммит выполняет вызывающая функция).
+
+    Аргументы:
+        name (str): Название турнира.
+        kind (str): Система: 'swiss', 'round_robin' или 'arena'.
+        creator (User): Организатор (может начать турнир).
+        rounds (int, необязательный): Число туров швейцарки; без него определяется при старте по числу участников.
+            Для круговой системы не задается.
+        time_control (str): Контроль времени партий: предустановка ('3+2') или формат PGN ('180+2').
+        duration (int, необязательный): Продолжительность арены в минутах (обязательна для арены).
+
+    Ошибки:
+        ValueError: Неизвестная система, неверное число туров, продолжительность или контроль времени.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown tournament kind: {kind}')
+    if rounds is not None and (kind != 'swiss' or rounds < 1):
+        raise ValueError('Invalid number of rounds')
+    if (kind == 'arena') != (duration is not None) or (duration is not None and duration < 1):
+        raise ValueError('Arena tournaments require a duration in minutes')
+    tournament = Tournament(name=name, kind=kind, rounds=rounds, time_control=pgn_time_control(time_control), created_by=creator.id,
+                            duration=duration)
+    db.session.add(tournament)
+    return tournament
+
+
+def join_tournament(tournament, user):
+    """
+    Регистрирует пользователя в турнире; рейтинг фиксируется на момент регистрации.
+
+    В идущую арену можно войти в любой момент, в том числе вернуться после выхода (withdraw_player).
+
+    Ошибки:
+        ValueError: Регистрация закрыта или пользователь уже зарегистрирован.
+    """
+    open_arena = tournament.kind == 'arena' and tournament.status == 'running'
+    if tournament.status != 'registering' and not open_arena:
+        raise ValueError('Registration is closed')
+    player = db.session.get(TournamentPlayer, (tournament.id, user.id))
+    if player and player.withdrawn and open_arena:
+        player.withdrawn = False
+        return player
+    if player:
+        raise ValueError('Already registered')
+    player = TournamentPlayer(tournament_id=tournament.id, user_id=user.id, rating=int(user.elorating),
+                              score=0.0, colors='', streak=0, withdrawn=False)
+    db.session.add(player)
+    return player
+
+
+def withdraw_player(tournament, user):
+    """
+    Выводит участника из очереди арены: новых партий ему не назначается, очки сохраняются.
+
+    Ошибки:
+        ValueError: Турнир не арена или пользователь в нем не участвует.
+    """
+    player = db.session.get(TournamentPlayer, (tournament.id, user.id))
+    if tournament.kind != 'arena' or player is None:
+        raise ValueError('Not an arena participant')
+    player.withdrawn = True
+    return player
+
+
+def start_tournament(tournament, now=None):
+    """
+    Закрывает регистрацию и начинает первый тур. Арена только получает время окончания: партии
+    в ней создает цикл жеребьевки арены (см. backend.arena).
+
+    Ошибки:
+        ValueError: Турнир уже начат или участников меньше MIN_PLAYERS.
+    """
+    if tournament.status != 'registering':
+        raise ValueError('Tournament already started')
+    count = TournamentPlayer.query.filter_by(tournament_id=tournament.id).count()
+    if count < MIN_PLAYERS:
+        raise ValueError(f'At least {MIN_PLAYERS} players are required')
+    now = now or datetime.utcnow()
+    tournament.status = 'running'
+    tournament.started_at = now
+    if tournament.kind == 'arena':
+        tournament.ends_at = now + timedelta(minutes=tournament.duration)
+        return []
+    if tournament.kind == 'round_robin':
+        tournament.rounds = round_robin_rounds(count)
+    elif tournament.rounds is None:
+        tournament.rounds = swiss_rounds(count)
+    return start_round(tournament, now)
+
+
+def load_entrants(tournament):
+    """Участники турнира с очками, историей цветов и сыгранными соперниками (для жеребьевки)."""
+    players = TournamentPlayer.query.filter_by(tournament_id=tournament.id).all()
+    entrants = {p.user_id: Entrant(p.user_id, p.score, p.rating, p.colors) for p in players}
+    games = (db.session.query(Game.player_white_id, Game.player_black_id)
+             .filter(Game.tournament_id == tournament.id))
+    for white_id, black_id in games:
+        entrants[white_id].opponents.add(black_id)
+        entrants[black_id].opponents.add(white_id)
+    return players, entrants
+
+
+def start_round(tournament, now=None):
+    """
+    Проводит жеребьевку следующего тура и создает все его партии (create_games).
+
+    Участник без пары получает BYE_POINTS очков. Игрокам ставятся уведомления о паре.
+    Коммит выполняет вызывающая функция.
+
+    Возвращает:
+        list: Пары (id белых, id черных) тура.
+    """
+    now = now or datetime.utcnow()
+    round_number = tournament.current_round + 1
+    players, entrants = load_entrants(tournament)
+    if tournament.kind == 'swiss':
+        pairs, bye = swiss_pairings(entrants.values())
+    else:
+        order = [p.user_id for p in sorted(players, key=lambda p: (-p.rating, p.user_id))]
+        pairs, bye = round_robin_pairings(order, round_number)
+
+    by_id = {p.user_id: p for p in players}
+    for white_id, black_id in pairs:
+        by_id[white_id].colors += WHITE
+        by_id[black_id].colors += BLACK
+    if bye is not None:
+        by_id[bye].colors += BYE
+        by_id[bye].score += BYE_POINTS
+    create_games(tournament, pairs, by_id, round_number, now)
+    tournament.current_round = round_number
+    title = f'{tournament.name}, round {round_number}/{tournament.rounds}'
+    notify_games(tournament, round_number, title)
+    if bye is not None:
+        outbox.enqueue(db.session.get(User, bye).telegram_chat_id, 'round_start',
+                       f'{title}: you have a bye and receive {BYE_POINTS:g} point.')
+    return pairs
+
+
+def start_arena_games(tournament, pairs, now=None):
+    """
+    Создает партии арены для пар очередного прохода жеребьевки (номер прохода хранится как номер тура).
+
+    Коммит выполняет вызывающая функция.
+    """
+    now = now or datetime.utcnow()
+    tournament.current_round += 1
+    players = (TournamentPlayer.query
+               .filter(TournamentPlayer.tournament_id == tournament.id,
+                       TournamentPlayer.user_id.in_([user_id for pair in pairs for user_id in pair]))
+               .all())
+    create_games(tournament, pairs, {p.user_id: p for p in players}, tournament.current_round, now)
+    notify_games(tournament, tournament.current_round, tournament.name)
+
+
+def create_games(tournament, pairs, players, round_number, now):
+    """
+    Создает партии тура одним пакетным INSERT.
+
+    Партии создаются сразу начатыми (без ожидания соперника), с рейтингами игроков на момент
+    регистрации и контролем времени турнира; их открывает /start_game.
+
+    Аргументы:
+        pairs (list): Пары (id белых, id черных).
+        players (dict): user_id -> TournamentPlayer участников пар.
+    """
+    base_ms, _ = parse_time_control(tournament.time_control)
+    rows = [{
+        'player_white_id': white_id, 'player_black_id': black_id, 'fen': chess.STARTING_FEN,
+        'is_active': True, 'is_waiting': False, 'time_left_white_ms': base_ms, 'time_left_black_ms': base_ms,
+        'last_move_time': now, 'started_at': now, 'white_elo': players[white_id].rating,
+        'black_elo': players[black_id].rating, 'time_control': tournament.time_control,
+        'tournament_id': tournament.id, 'tournament_round': round_number,
+    } for white_id, black_id in pairs]
+    if rows:
+        db.session.execute(insert(Game), rows)
+
+
+def notify_games(tournament, round_number, title):
+    """Ставит в outbox уведомления игрокам партий тура (прохода арены) о сопернике и цвете."""
+    games = (Game.query
+             .options(joinedload(Game.player_white), joinedload(Game.player_black))
+             .filter_by(tournament_id=tournament.id, tournament_round=round_number))
+    for game in games:
+        white, black = game.player_white, game.player_black
+        for player, opponent, color in ((white, black, 'white'), (black, white, 'black')):
+            outbox.enqueue(player.telegram_chat_id, 'round_start',
+                           f'{title}: you play {color} against {opponent.username} in game #{game.id}. '
+                           f'Use /startgame to open it.', game.id)
+
+
+def record_result(game, now=None):
+    """
+    Засчитывает результат завершенной турнирной партии и, если тур сыгран, начинает следующий или
+    завершает турнир. Для партий вне турнира ничего не делает. Коммит выполняет вызывающая функция.
+
+    Партии одного тура заканчиваются в разных комнатах, и их события обрабатываются параллельно.
+    Чтобы две последние партии тура не сочли друг друга еще идущими, строка турнира блокируется
+    (SELECT ... FOR UPDATE) до подсчета оставшихся партий: вторая транзакция ждет коммита первой и
+    видит ее партию завершенной. SQLite блокировку строки не поддерживает, но там транзакции
+    с записью и так выполняются по одной. Если тур все же остался без партий, его продолжит
+    advance_stalled_rounds.
+
+    Возвращает:
+        list: Для арены — участники TournamentPlayer с обновленными очками (для таблицы в памяти), иначе None.
+    """
+    if game.tournament_id is None or game.result not in POINTS:
+        return None
+    tournament = db.session.get(Tournament, game.tournament_id, with_for_update=True, populate_existing=True)
+    if tournament.kind == 'arena':
+        return arena.record_result(game)
+    white_points, black_points = POINTS[game.result]
+    for user_id, points in ((game.player_white_id, white_points), (game.player_black_id, black_points)):
+        if points:
+            db.session.get(TournamentPlayer, (game.tournament_id, user_id)).score += points
+    if tournament.current_round == game.tournament_round:
+        finish_round(tournament, exclude=game.id, now=now)
+    return None
+
+
+def finish_round(tournament, exclude=None, now=None):
+    """
+    Начинает следующий тур или завершает турнир, если в текущем туре не осталось идущих партий.
+
+    Аргументы:
+        exclude (int, необязательный): Партия, которая только что завершилась и еще не сохранена.
+
+    Возвращает:
+        bool: True, если тур был сыгран.
+    """
+    unfinished = Game.query.filter_by(tournament_id=tournament.id, tournament_round=tournament.current_round,
+                                      is_active=True)
+    if exclude is not None:
+        unfinished = unfinished.filter(Game.id != exclude)
+    if unfinished.count():
+        return False
+    if tournament.current_round >= tournament.rounds:
+        tournament.status = 'finished'
+        tournament.finished_at = now or datetime.utcnow()
+    else:
+        start_round(tournament, now)
+    return True
+
+
+def advance_stalled_rounds(now=None):
+    """
+    Продолжает турниры, тур которых сыгран, но следующий не начат (страховка для record_result,
+    например если процесс остановился между коммитом партии и жеребьевкой). Коммит выполняет
+    вызывающая функция.
+
+    Возвращает:
+        int: Количество продолженных турниров.
+    """
+    running = (Tournament.query
+               .filter(Tournament.status == 'running', Tournament.kind != 'arena', Tournament.current_round > 0)
+               .all())
+    advanced = 0
+    for tournament in running:
+        tournament = db.session.get(Tournament, tournament.id, with_for_update=True, populate_existing=True)
+        if tournament.status == 'running' and finish_round(tournament, now=now):
+            advanced += 1
+    return advanced
+
+
+def current_game(user_id):
+    """Идущая турнирная партия пользователя или None."""
+    return (Game.query
+            .filter(Game.tournament_id.isnot(None), Game.is_active.is_(True),
+                    or_(Game.player_white_id == user_id, Game.player_black_id == user_id))
+            .order_by(Game.id.desc())
+            .first())
+
+
+def standings(tournament):
+    """
+    Турнирная таблица: по очкам, затем по коэффициенту Бухгольца (сумма очков соперников) и рейтингу.
+
+    Возвращает:
+        list: Словари с ключами rank, user_id, username, score, buchholz, rating, colors.
+    """
+    rows = (db.session.query(TournamentPlayer, User.username)
+            .join(User, User.id == TournamentPlayer.user_id)
+            .filter(TournamentPlayer.tournament_id == tournament.id)
+            .all())
+    scores = {player.user_id: player.score for player, _ in rows}
+    buchholz = dict.fromkeys(scores, 0.0)
+    games = (db.session.query(Game.player_white_id, Game.player_black_id)
+             .filter(Game.tournament_id == tournament.id))
+    for white_id, black_id in games:
+        buchholz[white_id] += scores[black_id]
+        buchholz[black_id] += scores[white_id]
+    table = sorted(rows, key=lambda row: (-row[0].score, -buchholz[row[0].user_id], -row[0].rating, row[0].user_id))
+    return [{'rank': rank, 'user_id': player.user_id, 'username': username, 'score': player.score,
+             'buchholz': buchholz[player.user_id], 'rating': player.rating, 'colors': player.colors}
+            for rank, (player, username) in enumerate(table, 1)]
+
+
+def serialize_tournament(tournament):
+    """Турнир с таблицей и партиями текущего тура для ответа API."""
+    games = (Game.query
+             .filter_by(tournament_id=tournament.id, tournament_round=tournament.current_round)
+             .order_by(Game.id)
+             .all()) if tournament.current_round else []
+    return {
+        'id': tournament.id,
+        'name': tournament.name,
+        'kind': tournament.kind,
+        'status': tournament.status,
+        'time_control': tournament.time_control,
+        'round': tournament.current_round,
+        'rounds': tournament.rounds,
+        'ends_at': tournament.ends_at.isoformat() if tournament.ends_at else None,
+        'standings': standings(tournament),
+        'games': [{'game_id': g.id, 'white_id': g.player_white_id, 'black_id': g.player_black_id,
+                   'result': g.result} for g in games],
+    }
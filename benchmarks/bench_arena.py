@@ -0,0 +1,104 @@
+# benchmarks/bench_arena.py
+"""
+Пропускная способность арены на одном рабочем процессе.
+
+В арену с --players участниками (временная база SQLite) раз за проходом завершается доля
+--finish идущих партий (тем же путем, что и в игре: рейтинги, mark_game_finished, коммит), после
+чего выполняется проход жеребьевки pair_arenas. Печатаются число начатых партий в минуту рабочего
+времени процесса (время завершения партий и жеребьевки, без ожидания между проходами), время
+прохода жеребьевки и средний размер дельты таблицы (перемещений в ней).
+
+Запуск:
+    python -m benchmarks.bench_arena --players 1000 --passes 30
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+workdir = tempfile.mkdtemp(prefix='bench_arena_')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(workdir, "arena.db")}'
+os.environ['ARCHIVE_DATABASE_URI'] = f'sqlite:///{os.path.join(workdir, "archive.db")}'
+os.environ['POSITION_INDEX_PATH'] = os.path.join(workdir, 'positions.idx')
+
+from sqlalchemy import insert  # noqa: E402
+
+from backend import main  # noqa: E402
+from backend.models import db, Game, User, Tournament, TournamentPlayer  # noqa: E402
+from backend.tournament import create_tournament, start_tournament  # noqa: E402
+
+
+def setup(players):
+    db.create_all()
+    db.session.execute(insert(User), [{'username': f'arena{i}', 'password_hash': '-', 'elorating': 1500,
+                                       'wins': 0, 'losses': 0} for i in range(players)])
+    creator = User.query.first()
+    tournament = create_tournament('Bench arena', 'arena', creator, duration=600)
+    db.session.flush()
+    db.session.execute(insert(TournamentPlayer), [{'tournament_id': tournament.id, 'user_id': user_id,
+                                                   'rating': 1500, 'score': 0.0, 'colors': ''}
+                                                  for (user_id,) in db.session.query(User.id)])
+    start_tournament(tournament)
+    db.session.commit()
+    return tournament.id
+
+
+def run(args):
+    rng = random.Random(1)
+    deltas = []
+    original_emit = main.socketio.emit
+
+    def counting_emit(event, data=None, **kwargs):
+        if event == 'standings_delta':
+            deltas.append(len(data['moves']))
+
+    main.socketio.emit = counting_emit
+    with main.app.app_context():
+        tournament_id = setup(args.players)
+        started_games, pair_times, busy = 0, [], 0.0
+        for _ in range(args.passes):
+            began = time.perf_counter()
+            active = [game_id for (game_id,) in db.session.query(Game.id)
+                      .filter(Game.tournament_id == tournament_id, Game.is_active.is_(True))]
+            for game_id in rng.sample(active, int(len(active) * args.finish)):
+                game = db.session.get(Game, game_id)
+                winner = rng.choice(['white', 'black', 'draw'])
+                if winner == 'draw':
+                    main.update_ratings_on_draw(game)
+                else:
+                    main.update_ratings_on_win(game, winner, 'black' if winner == 'white' else 'white')
+                main.mark_game_finished(game)
+                db.session.commit()
+            paired = time.perf_counter()
+            started_games += main.pair_arenas(datetime.utcnow())
+            pair_times.append(time.perf_counter() - paired)
+            busy += time.perf_counter() - began
+            db.session.remove()
+        standings = main.arena_events[tournament_id].standings.snapshot(limit=3)
+        assert db.session.get(Tournament, tournament_id).status == 'running'
+    main.socketio.emit = original_emit
+
+    print(f'{started_games} games started in {busy:.1f}s of worker time: '
+          f'{started_games / busy * 60:.0f} games/min')
+    print(f'pairing pass: median {statistics.median(pair_times) * 1000:.1f} ms, '
+          f'max {max(pair_times) * 1000:.1f} ms')
+    print(f'standings deltas: {len(deltas)}, mean {statistics.mean(deltas):.1f} moves '
+          f'for {args.players} players; leaders: {[(r["username"], r["score"]) for r in standings["rows"]]}')
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--passes', type=int, default=30)
+    parser.add_argument('--finish', type=float, default=0.2, help='доля идущих партий, завершаемых за проход')
+    args = parser.parse_args()
+    main.logging.disable(main.logging.INFO)
+    run(args)
+
+
+if __name__ == '__main__':
+    main_()
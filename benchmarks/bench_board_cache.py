@@ -0,0 +1,109 @@
+# benchmarks/bench_board_cache.py
+"""
+Память досок идущих партий: неограниченный словарь против BoardCache.
+
+Открывается --games партий по --moves полуходов (случайные допустимые ходы), затем выполняется
+--events событий: с вероятностью --hot событие приходит в одну из --hot-games активных партий,
+иначе — в случайную (долгие партии по переписке). Каждое событие добавляет ход. Печатаются пиковая
+и итоговая память досок (tracemalloc), сумма оценок board_bytes, доля событий, для которых доска
+была в памяти, число восстановлений вытесненных досок и время одного восстановления по ходам.
+
+Запуск:
+    python -m benchmarks.bench_board_cache --games 5000 --moves 60 --budget-mb 16
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+import chess
+
+from backend.board_cache import BoardCache, board_bytes, restore_board
+
+
+def random_moves(rng, count):
+    board = chess.Board()
+    for _ in range(count):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(rng.choice(moves))
+    return [move.uci() for move in board.move_stack]
+
+
+def extend(board, rng, moves):
+    """Делает случайный ход, если партия не окончена, и сохраняет его в moves."""
+    legal = list(board.legal_moves)
+    if legal:
+        move = rng.choice(legal)
+        board.push(move)
+        moves.append(move.uci())
+
+
+def run(args, bounded):
+    rng = random.Random(args.seed)
+    stored = {str(i): random_moves(rng, args.moves) for i in range(args.games)}
+    rooms = list(stored)
+    hot = rooms[:args.hot_games]
+
+    tracemalloc.start()
+    if bounded:
+        cache = BoardCache(max_bytes=args.budget_mb * 1024 * 1024)
+        for room in rooms:
+            cache.load(room, ' '.join(stored[room]))
+    else:
+        boards = {}
+        for room in rooms:
+            board = chess.Board()
+            for uci in stored[room]:
+                board.push_uci(uci)
+            boards[room] = board
+
+    hits = 0
+    for _ in range(args.events):
+        room = rng.choice(hot) if rng.random() < args.hot else rng.choice(rooms)
+        if bounded:
+            hits += room in cache
+            board = cache.load(room, ' '.join(stored[room]))
+            extend(board, rng, stored[room])
+            cache.resize(room)
+        else:
+            hits += 1
+            extend(boards[room], rng, stored[room])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Время восстановления доски по ходам — без tracemalloc, который замедляет выделение памяти.
+    sample = rng.sample(rooms, min(200, len(rooms)))
+    started = time.perf_counter()
+    for room in sample:
+        restore_board(' '.join(stored[room]))
+    reload_ms = (time.perf_counter() - started) / len(sample) * 1000
+
+    if bounded:
+        estimate, count, loads = cache.bytes, len(cache), cache.loads - args.games
+    else:
+        estimate, count, loads = sum(board_bytes(board) for board in boards.values()), len(boards), 0
+    name = f'BoardCache {args.budget_mb} MiB' if bounded else 'dict'
+    print(f'{name}: {count} boards in memory, traced {current / 2 ** 20:.1f} MiB (peak {peak / 2 ** 20:.1f} MiB), '
+          f'estimate {estimate / 2 ** 20:.1f} MiB, hit rate {hits / args.events:.1%}'
+          + (f', {loads} reloads, {reload_ms:.2f} ms per reload' if bounded else ''))
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=5000)
+    parser.add_argument('--moves', type=int, default=60)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--hot-games', type=int, default=300)
+    parser.add_argument('--hot', type=float, default=0.95)
+    parser.add_argument('--budget-mb', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run(args, bounded=False)
+    run(args, bounded=True)
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,89 @@
+# benchmarks/bench_board_snapshot.py
+"""
+Память простаивающих партий: полные доски chess.Board против снимков BoardSnapshot.
+
+Разыгрывается --distinct случайных партий длиной от --min-moves до --max-moves полуходов. Из них
+строится --games снимков (каждый снимок — отдельные объекты, как у независимых партий) и
+--boards полных досок, восстановленных по ходам; память измеряется tracemalloc. Печатаются байты
+на партию в обоих представлениях, оценка для --games партий полными досками, а также время сжатия
+и разворачивания одной доски.
+
+Запуск:
+    python -m benchmarks.bench_board_snapshot --games 100000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+import chess
+
+from backend.board_cache import BoardSnapshot, restore_board
+
+
+def random_game(rng, length):
+    board = chess.Board()
+    for _ in range(length):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(rng.choice(moves))
+    return board
+
+
+def traced(build):
+    """Память (байты), которую занимает результат build, и сам результат."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--boards', type=int, default=2000)
+    parser.add_argument('--distinct', type=int, default=500)
+    parser.add_argument('--min-moves', type=int, default=30)
+    parser.add_argument('--max-moves', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    boards = [random_game(rng, rng.randint(args.min_moves, args.max_moves)) for _ in range(args.distinct)]
+    moves = [' '.join(move.uci() for move in board.move_stack) for board in boards]
+    plies = sum(len(board.move_stack) for board in boards) / len(boards)
+
+    snapshot_bytes, snapshots = traced(lambda: [BoardSnapshot.from_board(boards[i % len(boards)])
+                                                for i in range(args.games)])
+    board_bytes_, full = traced(lambda: [restore_board(moves[i % len(moves)]) for i in range(args.boards)])
+    per_snapshot = snapshot_bytes / args.games
+    per_board = board_bytes_ / args.boards
+
+    started = time.perf_counter()
+    for board in boards:
+        BoardSnapshot.from_board(board)
+    compact_ms = (time.perf_counter() - started) / len(boards) * 1000
+    started = time.perf_counter()
+    for snapshot in snapshots[:len(boards)]:
+        snapshot.inflate()
+    inflate_ms = (time.perf_counter() - started) / len(boards) * 1000
+    started = time.perf_counter()
+    for uci_moves in moves:
+        restore_board(uci_moves)
+    replay_ms = (time.perf_counter() - started) / len(moves) * 1000
+
+    print(f'{args.games} idle games, {plies:.0f} plies on average')
+    print(f'chess.Board:   {per_board:8.0f} bytes per game, {per_board * args.games / 2 ** 20:7.1f} MiB for '
+          f'{args.games} games (measured on {len(full)} boards)')
+    print(f'BoardSnapshot: {per_snapshot:8.0f} bytes per game, {snapshot_bytes / 2 ** 20:7.1f} MiB for '
+          f'{len(snapshots)} games ({per_board / per_snapshot:.0f}x smaller)')
+    print(f'compact {compact_ms:.3f} ms, inflate {inflate_ms:.3f} ms, full replay from moves {replay_ms:.3f} ms '
+          f'per game')
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,134 @@
+# benchmarks/bench_bot_updates.py
+"""
+Пропускная способность бота (обновлений в секунду) при одновременной работе многих пользователей.
+
+Каждый из --users пользователей проходит сценарий /start, /leaderboard и регистрацию
+(/register, имя, пароль — шаги ConversationHandler). Все обновления ставятся в очередь
+приложения сразу, как при пачке запросов на webhook. Бэкенд и Bot API заменены локальными
+заглушками с задержками --backend-latency и --api-latency (мс). Сравниваются последовательная
+обработка (как раньше, на --sequential-users пользователях) и ChatOrderedUpdateProcessor.
+Для каждого пользователя проверяется, что диалог регистрации прошел по шагам по порядку.
+
+С --webhook-url скрипт работает как поддельный Telegram: отправляет те же обновления POST-запросами
+на запущенный бот в режиме webhook (BOT_WEBHOOK_URL) и измеряет скорость их приема.
+
+Запуск:
+    python -m benchmarks.bench_bot_updates --users 1000
+    python -m benchmarks.bench_bot_updates --users 1000 --webhook-url http://127.0.0.1:8443/telegram --secret s3cret
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+os.environ.setdefault('BOT_TOKEN', '123456:bench')
+os.environ.setdefault('FRONTEND_URL', 'http://localhost:5000')
+
+from telegram import Update
+from telegram.ext import Application, SimpleUpdateProcessor
+
+from backend import bot
+from backend.bot_updates import ChatOrderedUpdateProcessor
+from benchmarks.fake_telegram import FakeBotAPI, make_update
+
+SCRIPT = ('/start', '/leaderboard', '/register', 'name', 'password')
+EXPECTED_REPLIES = ['Welcome to Chess Bot!', 'Leaderboard:', 'Enter your desired username:',
+                    'Enter your desired password:', 'Registration successful!']
+
+
+def updates_for(users):
+    """JSON обновлений: пользователи отправляют шаги сценария вперемешку, каждый — по порядку."""
+    update_id = 0
+    for text in SCRIPT:
+        for user_id in range(1, users + 1):
+            update_id += 1
+            yield make_update(update_id, user_id, text)
+
+
+def fake_backend(latency):
+    """Ответы бэкенда для /leaderboard и /register с задержкой (блокирующий вызов, как у BackendClient)."""
+    def call(url, *args, **kwargs):
+        time.sleep(latency)
+        response = MagicMock(status_code=200)
+        response.json.return_value = [{'username': 'alice', 'elorating': 1500}] if url.endswith('/leaderboard') else {}
+        return response
+    return call
+
+
+async def run_in_process(users, processor, api_latency, backend_latency):
+    api = FakeBotAPI(latency=api_latency)
+    builder = Application.builder().token(os.environ['BOT_TOKEN']).request(api).get_updates_request(FakeBotAPI())
+    application = bot.build_application(builder, processor)
+    backend = fake_backend(backend_latency)
+    with patch.object(bot.backend, 'get', backend), patch.object(bot.backend, 'post', backend):
+        async with application:
+            await application.start()
+            payloads = list(updates_for(users))
+            started = time.perf_counter()
+            for payload in payloads:
+                application.update_queue.put_nowait(Update.de_json(payload, application.bot))
+            await application.update_queue.join()
+            elapsed = time.perf_counter() - started
+            await application.stop()
+
+    broken = sum(1 for user_id in range(1, users + 1)
+                 if [text.split('\n')[0].split(' You')[0] for text in api.sent[user_id]] != EXPECTED_REPLIES)
+    return len(payloads), elapsed, broken
+
+
+async def run_webhook_sender(users, url, secret, concurrency):
+    import httpx
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    payloads = list(updates_for(users))
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    failed = 0
+
+    async def sender(client):
+        nonlocal failed
+        while not queue.empty():
+            response = await client.post(url, json=queue.get_nowait(), headers=headers)
+            failed += response.status_code != 200
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return len(payloads), elapsed, failed
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--api-latency', type=float, default=20, help='задержка Bot API, мс')
+    parser.add_argument('--backend-latency', type=float, default=10, help='задержка бэкенда, мс')
+    parser.add_argument('--sequential-users', type=int, default=100,
+                        help='пользователей для последовательной обработки (ее скорость не зависит от их числа)')
+    parser.add_argument('--webhook-url', help='адрес webhook запущенного бота (режим поддельного Telegram)')
+    parser.add_argument('--secret', help='BOT_WEBHOOK_SECRET запущенного бота')
+    parser.add_argument('--concurrency', type=int, default=100, help='одновременных запросов на webhook')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.webhook_url:
+        total, elapsed, failed = asyncio.run(
+            run_webhook_sender(args.users, args.webhook_url, args.secret, args.concurrency))
+        print(f'webhook: {total} updates in {elapsed:.2f}s, {total / elapsed:.0f} updates/s, {failed} rejected')
+        return
+
+    modes = [('sequential', SimpleUpdateProcessor(1), min(args.users, args.sequential_users)),
+             ('chat-ordered', ChatOrderedUpdateProcessor(bot.BOT_MAX_RUNNING_UPDATES), args.users)]
+    for name, processor, users in modes:
+        total, elapsed, broken = asyncio.run(
+            run_in_process(users, processor, args.api_latency / 1000, args.backend_latency / 1000))
+        print(f'{name:>12}: {total} updates in {elapsed:.2f}s, {total / elapsed:.0f} updates/s, '
+              f'{broken} conversations out of order')
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,108 @@
+# benchmarks/bench_db_concurrency.py
+"""
+Нагрузочный тест записи в файл SQLite: прежние настройки против профиля из backend.db_profile.
+
+Потоки-писатели повторяют типичную транзакцию хода: прочитать партию, дописать ход, закоммитить.
+Потоки-читатели держат открытыми длинные читающие транзакции (как выгрузка истории или PGN).
+В режиме журнала отката читатели не дают писателю закоммитить, и при постоянном потоке чтения
+писатель получает "database is locked"; в WAL чтение и запись не блокируют друг друга.
+"До" — настройки Flask-SQLAlchemy по умолчанию (NullPool, журнал отката), "после" — пул соединений,
+WAL и synchronous=NORMAL. Время ожидания блокировки в обоих случаях одинаковое (--busy-timeout):
+под gevent ожидание внутри драйвера SQLite блокирует весь цикл событий, поэтому на практике
+бюджет ожидания короткий.
+
+Запуск:
+    python -m benchmarks.bench_db_concurrency --threads 16 --readers 4 --seconds 10
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from backend.db_profile import engine_options, install_sqlite_pragmas
+
+GAMES = 50
+
+
+def prepare(engine):
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE game (id INTEGER PRIMARY KEY, moves TEXT NOT NULL)'))
+        connection.execute(text('INSERT INTO game (id, moves) VALUES (:id, \'\')'),
+                           [{'id': i} for i in range(1, GAMES + 1)])
+
+
+def worker(engine, index, deadline, counters, lock):
+    commits = locked = 0
+    game_id = index % GAMES + 1
+    while time.perf_counter() < deadline:
+        try:
+            with engine.begin() as connection:
+                moves = connection.execute(text('SELECT moves FROM game WHERE id = :id'), {'id': game_id}).scalar()
+                connection.execute(text('UPDATE game SET moves = :moves WHERE id = :id'),
+                                   {'moves': (moves + ' e2e4')[-200:], 'id': game_id})
+            commits += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    with lock:
+        counters['commits'] += commits
+        counters['locked'] += locked
+
+
+def reader(engine, deadline, hold):
+    while time.perf_counter() < deadline:
+        try:
+            with engine.connect() as connection:
+                connection.exec_driver_sql('BEGIN')
+                connection.exec_driver_sql('SELECT count(*) FROM game').scalar()
+                time.sleep(hold)
+                connection.exec_driver_sql('COMMIT')
+        except OperationalError:
+            pass
+
+
+def run(label, engine, threads, readers, seconds):
+    prepare(engine)
+    counters = {'commits': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(engine, i, deadline, counters, lock)) for i in range(threads)]
+    pool += [threading.Thread(target=reader, args=(engine, deadline, 0.05)) for _ in range(readers)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    engine.dispose()
+    print(f'{label:8} {counters["commits"] / seconds:9.0f} commits/s  {counters["locked"]:6} "database is locked" errors')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--busy-timeout', type=int, default=100, help='Lock wait budget, milliseconds.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = make_url(f'sqlite:///{os.path.join(directory, "before.db")}')
+        engine = create_engine(url, poolclass=NullPool, connect_args={'timeout': args.busy_timeout / 1000})
+        run('before', engine, args.threads, args.readers, args.seconds)
+
+        url = make_url(f'sqlite:///{os.path.join(directory, "after.db")}')
+        config = {'DB_POOL_SIZE': args.threads + args.readers, 'SQLITE_BUSY_TIMEOUT': args.busy_timeout}
+        engine = create_engine(url, **engine_options(url, config))
+        install_sqlite_pragmas(engine, args.busy_timeout)
+        run('after', engine, args.threads, args.readers, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
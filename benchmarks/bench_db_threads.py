@@ -0,0 +1,132 @@
+# benchmarks/bench_db_threads.py
+"""
+Задержка хода под нагрузкой на базу: вызовы драйвера в цикле событий gevent против пула потоков.
+
+В файле SQLite создается --history завершенных партий. Затем на --seconds секунд запускаются
+--players гринлетов, которые ходят в своих партиях (UPDATE строки партии и коммит, как handle_move)
+с паузой --think мс, а рядом — нагрузка: --readers гринлетов с тяжелыми запросами по истории
+(агрегаты по всем партиям, как отчеты и экспорт) и --writers гринлетов со вставкой пачек по --batch
+партий (как импорт PGN и архивация); между запросами нагрузки — пауза --pause мс. Задержка хода
+считается от момента, когда ход должен был начаться, до конца коммита, поэтому в нее входит и время,
+пока цикл событий был занят чужим запросом.
+Печатаются перцентили задержки хода для DB_THREADS=0 и DB_THREADS=--threads.
+
+Запуск:
+    python -m benchmarks.bench_db_threads --seconds 10 --threads 8
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import gevent
+from sqlalchemy import create_engine, func, select, update
+from sqlalchemy.engine import make_url
+
+from backend.db_profile import engine_options, install_engine_profile
+from backend.db_threads import DriverThreadPool
+from backend.models import db, Game, Tournament, User
+
+
+def game_row(rng, user_id):
+    return {'player_white_id': user_id, 'player_black_id': user_id + 1, 'is_active': False, 'is_waiting': False,
+            'result': rng.choice(['white', 'black', 'draw']), 'moves': 'e2e4 e7e5 ' * rng.randint(10, 60),
+            'finished_at': datetime.utcnow()}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(args, path, threads):
+    url = make_url(f'sqlite:///{path}')
+    options = engine_options(url, {'DB_THREADS': threads, 'DB_POOL_SIZE': 10, 'DB_MAX_OVERFLOW': 20})
+    engine = create_engine(url, **options)
+    install_engine_profile(engine, url, options, DriverThreadPool(threads) if threads else None)
+    with engine.connect() as connection:
+        live = [row.id for row in connection.execute(
+            select(Game.id).where(Game.is_active.is_(True)).order_by(Game.id).limit(args.players))]
+
+    rng = random.Random(args.seed)
+    deadline = time.perf_counter() + args.seconds
+    latencies, loads = [], {'reads': 0, 'writes': 0}
+
+    def player(game_id):
+        moves = ''
+        due = time.perf_counter()
+        while True:
+            due += rng.uniform(0.5, 1.5) * args.think / 1000
+            gevent.sleep(max(0, due - time.perf_counter()))
+            if time.perf_counter() > deadline:
+                return
+            moves += ' e2e4'
+            with engine.begin() as connection:
+                connection.execute(update(Game).where(Game.id == game_id)
+                                   .values(moves=moves, last_move_time=datetime.utcnow()))
+            latencies.append(time.perf_counter() - due)
+            due = max(due, time.perf_counter())
+
+    def reader():
+        while time.perf_counter() < deadline:
+            with engine.connect() as connection:
+                connection.execute(select(Game.player_white_id, func.count(), func.avg(func.length(Game.moves)))
+                                   .where(Game.is_active.is_(False))
+                                   .group_by(Game.player_white_id)).all()
+            loads['reads'] += 1
+            gevent.sleep(args.pause / 1000)
+
+    def writer():
+        while time.perf_counter() < deadline:
+            with engine.begin() as connection:
+                connection.execute(Game.__table__.insert(), [game_row(rng, 1) for _ in range(args.batch)])
+            loads['writes'] += 1
+            gevent.sleep(args.pause / 1000)
+
+    workers = [gevent.spawn(player, game_id) for game_id in live]
+    workers += [gevent.spawn(reader) for _ in range(args.readers)]
+    workers += [gevent.spawn(writer) for _ in range(args.writers)]
+    gevent.joinall(workers, raise_error=True)
+    engine.dispose()
+
+    ms = [latency * 1000 for latency in latencies]
+    print(f'DB_THREADS={threads}: {len(ms)} moves, p50 {percentile(ms, 0.5):7.1f} ms, '
+          f'p99 {percentile(ms, 0.99):7.1f} ms, p99.9 {percentile(ms, 0.999):7.1f} ms, max {max(ms):7.1f} ms; '
+          f'{loads["reads"]} history queries, {loads["writes"]} batch inserts')
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--think', type=float, default=500, help='Pause between moves of one player, ms.')
+    parser.add_argument('--history', type=int, default=200000)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=20, help='Pause between load queries of one greenlet, ms.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        engine = create_engine(f'sqlite:///{path}')
+        db.metadata.create_all(engine, tables=[User.__table__, Tournament.__table__, Game.__table__])
+        with engine.begin() as connection:
+            for start in range(0, args.history, 10000):
+                connection.execute(Game.__table__.insert(), [game_row(rng, rng.randint(1, 5000))
+                                                             for _ in range(min(10000, args.history - start))])
+            connection.execute(Game.__table__.insert(), [{'player_white_id': 1, 'player_black_id': 2, 'moves': ''}
+                                                         for _ in range(args.players)])
+        engine.dispose()
+        for threads in (0, args.threads):
+            run(args, path, threads)
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,98 @@
+# benchmarks/bench_fairplay.py
+"""
+Время отчета о времени ходов (fairplay-report) на миллионах ходов.
+
+Сначала свертка: --moves синтетических ходов (случайные игроки из --players, время и сложность)
+сворачиваются в суммы по игрокам векторно (TimingStats.add_moves пачками по --chunk) и, для
+сравнения, циклом Python по первым --python-moves ходам. Затем полный путь timing_report на --games
+случайных партиях с оценкой сложности позиций в текущем процессе и в --workers процессах.
+Печатается время на миллион ходов.
+
+Запуск:
+    python -m benchmarks.bench_fairplay --moves 10000000 --players 50000
+"""
+
+import argparse
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import chess
+import numpy as np
+
+from backend.clock import append_move_time
+from backend.fairplay import TimingStats, timing_report
+
+
+def python_sums(players, times, complexity, count):
+    """Те же суммы, что и в TimingStats.add_moves, циклом Python."""
+    sums = [[0.0] * count for _ in range(6)]
+    for player, t, c in zip(players.tolist(), times.tolist(), complexity.tolist()):
+        for row, value in enumerate((1, t, t * t, c, c * c, t * c)):
+            sums[row][player] += value
+    return sums
+
+
+def random_game(rng, plies):
+    board = chess.Board()
+    move_times = b''
+    while len(board.move_stack) < plies and not board.is_game_over():
+        move_times = append_move_time(move_times, rng.randint(200, 20000))
+        board.push(rng.choice(list(board.legal_moves)))
+    return ' '.join(move.uci() for move in board.move_stack), move_times
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--moves', type=int, default=10000000)
+    parser.add_argument('--players', type=int, default=50000)
+    parser.add_argument('--chunk', type=int, default=1 << 20)
+    parser.add_argument('--python-moves', type=int, default=1000000)
+    parser.add_argument('--games', type=int, default=300)
+    parser.add_argument('--plies', type=int, default=80)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(args.seed)
+    stats = TimingStats(args.chunk)
+    for user_id in range(args.players):
+        stats._index(user_id)
+    started = time.perf_counter()
+    for start in range(0, args.moves, args.chunk):
+        size = min(args.chunk, args.moves - start)
+        stats.add_moves(generator.integers(0, args.players, size), generator.random(size) * 0.05,
+                        generator.integers(1, 60, size, dtype=np.uint16))
+    vector_s = time.perf_counter() - started
+    report = stats.report(min_moves=1)
+
+    players = generator.integers(0, args.players, args.python_moves)
+    times = generator.random(args.python_moves) * 0.05
+    complexity = generator.integers(1, 60, args.python_moves, dtype=np.uint16)
+    started = time.perf_counter()
+    python_sums(players, times, complexity, args.players)
+    python_s = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    games = [SimpleNamespace(player_white_id=i % 100, player_black_id=100 + i % 100, time_control='180+2',
+                             **dict(zip(('moves', 'move_times'), random_game(rng, args.plies))))
+             for i in range(args.games)]
+    plies = sum(len(game.moves.split()) for game in games)
+    replay_s = {}
+    for workers in sorted({0, args.workers}):
+        started = time.perf_counter()
+        timing_report(games, min_moves=1, chunk_moves=args.chunk, workers=workers)
+        replay_s[workers] = time.perf_counter() - started
+
+    print(f'{args.moves} moves, {args.players} players, {len(report)} rows in the report')
+    print(f'vectorized sums: {vector_s / args.moves * 1e6:8.3f} s per million moves')
+    print(f'python loop:     {python_s / args.python_moves * 1e6:8.3f} s per million moves '
+          f'({python_s / args.python_moves / (vector_s / args.moves):.0f}x slower)')
+    for workers, seconds in replay_s.items():
+        print(f'timing_report, {workers} workers: {seconds / plies * 1e6:.1f} s per million moves '
+              f'({args.games} games, {plies} plies)')
+
+
+if __name__ == '__main__':
+    main_()
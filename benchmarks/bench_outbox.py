@@ -0,0 +1,92 @@
+# benchmarks/bench_outbox.py
+"""
+Отправка уведомлений из outbox через поддельный Bot API с лимитами частоты Telegram.
+
+Поддельный бэкенд выдает --notifications уведомлений для --chats чатов: часть чатов получает
+пачки из --burst уведомлений подряд (серия ходов), остальные — по одному. OutboxSender отправляет их
+через FakeBotAPI, который, как Telegram, отвечает 429 на сообщения сверх 30 в секунду на бота и
+1 в секунду в один чат. Печатаются время доставки, число сообщений (после склейки пачек), число
+ответов 429 и наибольшая частота сообщений за секунду.
+
+Запуск:
+    python -m benchmarks.bench_outbox --notifications 5000 --chats 1000 --burst 10
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+
+from telegram import Bot
+
+from backend.notifier import OutboxSender
+from benchmarks.fake_telegram import FakeBotAPI
+
+
+class FakeOutbox:
+    """Бэкенд с outbox в памяти: выдает уведомления пачками и учитывает подтверждения."""
+
+    def __init__(self, notifications):
+        self.queue = notifications
+        self.acked = set()
+
+    def claim_notifications(self, limit):
+        claimed, self.queue = self.queue[:limit], self.queue[limit:]
+        return claimed
+
+    def ack_notifications(self, ids):
+        self.acked.update(ids)
+
+
+def make_notifications(total, chats, burst, rng):
+    notifications = []
+    bursty = set(rng.sample(range(1, chats + 1), max(1, chats // 10)))
+    while len(notifications) < total:
+        chat_id = rng.randint(1, chats)
+        for _ in range(burst if chat_id in bursty else 1):
+            notifications.append({'id': len(notifications) + 1, 'chat_id': chat_id, 'kind': 'your_move',
+                                  'text': f'Your move in game #{chat_id}.'})
+    return notifications[:total]
+
+
+async def run(args):
+    api = FakeBotAPI(latency=args.api_latency / 1000, global_limit=30, chat_limit=1)
+    send_times = []
+    original = api.do_request
+
+    async def recording_request(url, method, request_data=None, **kwargs):
+        status, body = await original(url, method, request_data, **kwargs)
+        if url.endswith('/sendMessage') and status == 200:
+            send_times.append(time.monotonic())
+        return status, body
+
+    api.do_request = recording_request
+    source = FakeOutbox(make_notifications(args.notifications, args.chats, args.burst, random.Random(1)))
+    total = len(source.queue)
+    async with Bot('123456:bench', request=api, get_updates_request=FakeBotAPI()) as bot:
+        sender = OutboxSender(bot, source, poll_interval=0.05)
+        started = time.monotonic()
+        while len(source.acked) < total:
+            await asyncio.sleep(await sender.tick())
+        elapsed = time.monotonic() - started
+
+    per_second = Counter(int(t - started) for t in send_times)
+    print(f'{total} notifications delivered in {elapsed:.1f}s as {sender.sent_messages} messages, '
+          f'{api.rejected} rejected with 429, peak {max(per_second.values())} messages/s')
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--notifications', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--api-latency', type=float, default=20, help='задержка Bot API, мс')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,78 @@
+# benchmarks/bench_pairing.py
+"""
+Жеребьевка швейцарского турнира на большом числе участников.
+
+Проводит --rounds туров для --players участников со случайными рейтингами; результаты партий
+разыгрываются по ожиданию Эло. Для каждого тура печатается время жеребьевки (swiss_pairings),
+а в конце — худшее время, число повторных встреч, наибольший дисбаланс цветов и число
+повторных пропусков тура. Для сравнения печатается время расписания круговой системы.
+
+Запуск:
+    python -m benchmarks.bench_pairing --players 1000 --rounds 11
+"""
+
+import argparse
+import random
+import time
+
+from backend.pairing import BLACK, BYE, WHITE, Entrant, round_robin_pairings, round_robin_rounds, swiss_pairings
+
+
+def play(white, black, rng):
+    """Результат партии по ожиданию Эло (10% партий — ничьи)."""
+    expected = 1 / (1 + 10 ** ((black.rating - white.rating) / 400))
+    roll = rng.random()
+    if roll < 0.1:
+        return 0.5
+    return 1.0 if rng.random() < expected else 0.0
+
+
+def run_swiss(players, rounds, rng):
+    entrants = {i: Entrant(i, rating=rng.randint(800, 2400)) for i in range(1, players + 1)}
+    worst, repeats = 0.0, 0
+    for round_number in range(1, rounds + 1):
+        started = time.perf_counter()
+        pairs, bye = swiss_pairings(entrants.values())
+        elapsed = time.perf_counter() - started
+        worst = max(worst, elapsed)
+        for white_id, black_id in pairs:
+            white, black = entrants[white_id], entrants[black_id]
+            repeats += black_id in white.opponents
+            white.opponents.add(black_id)
+            black.opponents.add(white_id)
+            white.colors += WHITE
+            black.colors += BLACK
+            points = play(white, black, rng)
+            white.score += points
+            black.score += 1 - points
+        if bye is not None:
+            entrants[bye].colors += BYE
+            entrants[bye].score += 1
+        print(f'round {round_number:2d}: {len(pairs)} games paired in {elapsed * 1000:.1f} ms')
+    imbalance = max(abs(e.color_balance()) for e in entrants.values())
+    double_byes = sum(e.colors.count(BYE) > 1 for e in entrants.values())
+    print(f'swiss: worst round {worst * 1000:.1f} ms, {repeats} repeated pairings, '
+          f'max colour imbalance {imbalance}, {double_byes} players with two byes')
+
+
+def run_round_robin(players):
+    ids = list(range(1, players + 1))
+    started = time.perf_counter()
+    games = sum(len(round_robin_pairings(ids, r)[0]) for r in range(1, round_robin_rounds(players) + 1))
+    print(f'round robin: {games} games in {round_robin_rounds(players)} rounds scheduled in '
+          f'{(time.perf_counter() - started) * 1000:.1f} ms')
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=11)
+    parser.add_argument('--round-robin-players', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    run_swiss(args.players, args.rounds, random.Random(args.seed))
+    run_round_robin(args.round_robin_players)
+
+
+if __name__ == '__main__':
+    main_()
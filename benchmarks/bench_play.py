@@ -0,0 +1,49 @@
+# benchmarks/bench_play.py
+"""
+Сравнивает скорость /play?local=true до и после кэша отрисованной страницы.
+
+"До" — эквивалент прежнего обработчика (render_template на каждый запрос), зарегистрированный
+на время замера как отдельный маршрут; "после" — текущий /play с готовыми байтами.
+
+Запуск:
+    python -m benchmarks.bench_play --requests 5000
+"""
+
+import argparse
+import time
+
+from flask import render_template
+
+from backend.main import app
+
+
+def measure(client, url, requests, headers=None):
+    """Возвращает число запросов в секунду для url."""
+    client.get(url, headers=headers)  # прогрев: первая отрисовка и сборка кэша
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    @app.route('/bench/play-uncached')
+    def play_uncached():
+        return render_template('chess_ui.html', app_config='{"username":"Local Player","local":true}')
+
+    client = app.test_client()
+    before = measure(client, '/bench/play-uncached', args.requests)
+    after = measure(client, '/play?local=true', args.requests)
+    after_gzip = measure(client, '/play?local=true', args.requests, headers={'Accept-Encoding': 'gzip'})
+    print(f'render_template per request: {before:8.0f} req/s')
+    print(f'prebuilt local page:         {after:8.0f} req/s  ({after / before:.1f}x)')
+    print(f'prebuilt local page, gzip:   {after_gzip:8.0f} req/s  ({after_gzip / before:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_replay.py
+"""
+Время получения позиции партии по номеру полухода: полное проигрывание ходов против сохраненных позиций.
+
+Разыгрываются --games случайных партий по --moves полуходов, для каждой сохраняются позиции через
+--interval полуходов (build_checkpoints). Затем для --lookups случайных пар (партия, полуход) позиция
+восстанавливается обоими способами. Печатается среднее и худшее время одного запроса и размер
+сохраненных позиций на партию.
+
+Запуск:
+    python -m benchmarks.bench_replay --games 200 --moves 300
+"""
+
+import argparse
+import random
+import time
+
+import chess
+
+from backend.replay import CHECKPOINT_INTERVAL, build_checkpoints, position_at
+
+
+def random_moves(rng, count):
+    board = chess.Board()
+    for _ in range(count):
+        moves = list(board.legal_moves)
+        if not moves:
+            break
+        board.push(rng.choice(moves))
+    return ' '.join(move.uci() for move in board.move_stack)
+
+
+def measure(lookups, locate):
+    """Среднее и худшее время одного вызова locate(ходы, полуход) в миллисекундах."""
+    timings = []
+    for uci_moves, target in lookups:
+        started = time.perf_counter()
+        locate(uci_moves, target)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sum(timings) / len(timings), max(timings)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--moves', type=int, default=300)
+    parser.add_argument('--interval', type=int, default=CHECKPOINT_INTERVAL)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    games = [random_moves(rng, args.moves) for _ in range(args.games)]
+    checkpoints = {uci_moves: build_checkpoints(uci_moves, args.interval) for uci_moves in games}
+    lookups = []
+    for _ in range(args.lookups):
+        uci_moves = rng.choice(games)
+        lookups.append((uci_moves, rng.randint(0, len(uci_moves.split()))))
+
+    full_avg, full_max = measure(lookups, lambda uci_moves, target: position_at(uci_moves, None, target))
+    saved_avg, saved_max = measure(lookups, lambda uci_moves, target: position_at(
+        uci_moves, checkpoints[uci_moves], target, args.interval))
+    saved = sum(len(value) for value in checkpoints.values()) / len(checkpoints)
+    plies = sum(len(uci_moves.split()) for uci_moves in games) / len(games)
+
+    print(f'{args.games} games, {plies:.0f} plies on average, {args.lookups} lookups')
+    print(f'full replay:  {full_avg:.3f} ms average, {full_max:.3f} ms worst')
+    print(f'checkpoints:  {saved_avg:.3f} ms average, {saved_max:.3f} ms worst '
+          f'(every {args.interval} plies, {saved:.0f} bytes per game)')
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,97 @@
+# benchmarks/fake_telegram.py
+"""
+Локальная замена Telegram для прогонов бота без сети.
+
+FakeBotAPI подставляется в ApplicationBuilder.request(...) (или telegram.Bot(request=...)) и отвечает
+на методы Bot API так, как ответил бы Telegram, с заданной задержкой; отправленные сообщения
+сохраняются по чатам. С лимитами частоты он, как Telegram, отвечает 429 (retry_after) на сообщения
+сверх global_limit в секунду на бота или chat_limit в секунду в один чат.
+make_update собирает JSON обновления с текстовым сообщением (так его присылает Telegram на webhook).
+"""
+
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Chess Bot', 'username': 'chess_bench_bot'}
+
+
+def make_update(update_id, user_id, text):
+    """Возвращает JSON обновления: личное сообщение text от пользователя user_id."""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': f'user{user_id}'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+class FakeBotAPI(BaseRequest):
+    """Ответы Bot API без сети: getMe, отправка сообщений и документов, вызовы, не требующие данных."""
+
+    def __init__(self, latency=0.0, global_limit=None, chat_limit=None, clock=time.monotonic):
+        self.latency = latency
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.clock = clock
+        self.calls = defaultdict(int)
+        self.sent = defaultdict(list)  # chat_id -> тексты отправленных сообщений
+        self.rejected = 0  # ответов 429
+        self._message_id = 0
+        self._global_times = deque()
+        self._chat_times = defaultdict(deque)
+
+    def _over_limit(self, chat_id):
+        """Проверяет лимиты за последнюю секунду и учитывает сообщение, если оно их не превышает."""
+        now = self.clock()
+        chat_times = self._chat_times[chat_id]
+        for times in (self._global_times, chat_times):
+            while times and now - times[0] >= 1:
+                times.popleft()
+        if ((self.global_limit and len(self._global_times) >= self.global_limit)
+                or (self.chat_limit and len(chat_times) >= self.chat_limit)):
+            return True
+        self._global_times.append(now)
+        chat_times.append(now)
+        return False
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint in ('sendMessage', 'sendDocument'):
+            chat_id = int(params['chat_id'])
+            if self._over_limit(chat_id):
+                self.rejected += 1
+                return 429, json.dumps({'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                        'parameters': {'retry_after': 1}}).encode()
+            self.sent[chat_id].append(params.get('text', endpoint))
+            self._message_id += 1
+            result = {'message_id': self._message_id, 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER,
+                      'text': params.get('text', '')}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
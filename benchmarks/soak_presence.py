@@ -0,0 +1,75 @@
+# benchmarks/soak_presence.py
+"""
+Длительный прогон учета присутствия: проверяет, что память процесса не растет с числом партий.
+
+Сценарий каждой партии: оба игрока подключаются (иногда с двух вкладок), один теряет соединение
+и возвращается, затем партия либо заканчивается (release_game), либо бросается обоими игроками
+и освобождается фоновой проверкой (sweep_presence). Доски и контексты создаются так же, как в
+обработчиках. Объем памяти (tracemalloc) печатается после каждого блока партий.
+
+Запуск:
+    python -m benchmarks.soak_presence --games 200000 --report-every 20000
+"""
+
+import argparse
+import random
+import tracemalloc
+
+import logging
+
+import chess
+
+from backend import main
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def play(game_id, clock, rng):
+    room = str(game_id)
+    presence = main.presence
+    white, black = f'{game_id}-w', f'{game_id}-b'
+    presence.join(white, room, 1)
+    presence.join(black, room, 2)
+    if rng.random() < 0.3:
+        presence.join(f'{white}-tab', room, 1)
+    main.games.put(room, chess.Board())
+    presence.leave(black)
+    presence.join(f'{black}-again', room, 2)
+    if rng.random() < 0.7:
+        main.release_game(game_id)
+    else:
+        for sid in [sid for sid, (sid_room, _) in presence.sids.items() if sid_room == room]:
+            presence.leave(sid)
+    clock.now += 1
+    if game_id % 100 == 0:
+        main.sweep_presence()
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--report-every', type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    clock = FakeClock()
+    main.presence.clock = clock
+    main.presence.grace = 30
+    rng = random.Random(1)
+    tracemalloc.start()
+    for game_id in range(1, args.games + 1):
+        play(game_id, clock, rng)
+        if game_id % args.report_every == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            print(f'{game_id:8} games  {current / 1024:9.1f} KiB  rooms={len(main.presence)} '
+                  f'boards={len(main.games)} sids={len(main.presence.sids)}')
+
+
+if __name__ == '__main__':
+    main_()
@@ -5,22 +5,43 @@ from unittest.mock import MagicMock
 from backend.models import User, Game
 from backend.main import socketio, BASE_URL
 import chess
-from datetime import datetime
+from datetime import datetime, timedelta
 import urllib.parse
+import asyncio
+import gevent
+import gzip
 import json
+import os
+import random
+import re
 import uuid
 
 from unittest.mock import MagicMock, AsyncMock, patch
 
 from flask import session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from werkzeug.security import check_password_hash
 
-from backend.models import db, User, Game
+from backend.models import db, User, Game, ArchivedGame, OpeningStat, Tournament
 from backend.main import (
     app as flask_app,
     socketio,
     update_ratings_on_win,
     update_ratings_on_draw,
+    mark_game_finished,
+    update_opening,
+    get_game_context,
+    invalidate_game_contexts,
+    game_contexts,
+    arena_events,
+    pair_arenas,
+    reap,
+    play_move,
+    apply_premove,
+    premoves,
+    replays,
+    stream_replay,
 )
 from backend.bot import (
     FRONTEND_URL,
@@ -35,25 +56,54 @@ from backend.bot import (
     login_username,
     logout,
     playlocal,
+    startgame,
     register,
     register_password,
     register_username,
     start,
     leaderboard,  # Added import for leaderboard
+    exportpgn,
+    explorer,
 )
 from backend.elo import calculate_elo
+from backend.pgn_import import import_pgn
+from backend.archive import archive_finished_games
+from backend.history import iter_finished_games
+from backend.position_index import PositionIndex, position_hash
+from backend import explorer as opening_explorer
+from backend.db_profile import engine_options, install_engine_profile, install_sqlite_pragmas
+from backend.db_threads import DriverThreadPool, EventScopes, GreenQueuePool
+from backend.presence import Presence
+from backend.board_cache import MOVE_BYTES, BoardCache, BoardSnapshot, board_bytes, ply
+from backend.replay import CHECKPOINT_INTERVAL
+from backend.fairplay import OPENING_PLIES, TimingStats
+from backend.bot_updates import ChatOrderedUpdateProcessor
+from backend.bot_client import session_record
+from backend.notifier import OutboxSender
+from backend import outbox
+from backend.pairing import Entrant, round_robin_pairings, round_robin_rounds, swiss_pairings
+from backend.arena import ArenaEvent, ArenaStandings, arena_points
+from backend.tournament import advance_stalled_rounds
+from backend.clock import (
+    PREMOVE_MARK, LagTracker, TurnTimer, append_move_time, charge_move, increment_ms, parse_time_control,
+    unpack_move_times
+)
+from backend.eco import build_trie as build_eco_trie, classify
+from backend.pgn import game_to_pgn
 
 from flask_socketio import SocketIOTestClient
 
-from telegram import InlineKeyboardMarkup  # Added import for InlineKeyboardMarkup
+from telegram import InlineKeyboardMarkup, Update  # Added import for InlineKeyboardMarkup
 from telegram.ext import ConversationHandler  # Added import for ConversationHandler
 
 # ========================================= fixtures ===============================================
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """Create and configure a new app instance for each test."""
     flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database for testing
+    flask_app.config['SQLALCHEMY_BINDS'] = {'archive': 'sqlite:///:memory:'}  # In-memory game archive
+    flask_app.config['POSITION_INDEX_PATH'] = str(tmp_path / 'positions.idx')
     flask_app.config['TESTING'] = True
     flask_app.config['SECRET_KEY'] = 'testsecretkey'
     flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -68,6 +118,9 @@ def app():
         yield flask_app
         db.session.remove()
         db.drop_all()
+    game_contexts.clear()  # game ids are reused by the next in-memory database
+    arena_events.clear()
+    premoves.clear()
 
 @pytest.fixture
 def test_client(app):
@@ -237,6 +290,27 @@ def test_logout(test_client, app):
     assert response.status_code == 200, f"Expected 200 OK, got {response.status_code}"
     assert data['message'] == 'Logged out successfully.'  # Updated assertion
 
+def test_session_token_auth(app):
+    """Test the signed session token authenticates cookie-less clients until logout."""
+    with app.app_context():
+        user = User(username='botuser')
+        user.set_password('testpass')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    data = client.post('/login', data={'username': 'botuser', 'password': 'testpass'}).get_json()
+    headers = {'Authorization': f"Bearer {data['session_token']}"}
+
+    bot_client = app.test_client(use_cookies=False)
+    assert bot_client.get('/start_game').status_code == 401
+    assert bot_client.get('/start_game', headers={'Authorization': 'Bearer forged'}).status_code == 401
+    response = bot_client.get('/start_game', headers=headers)
+    assert response.status_code == 200 and response.get_json()['auth_token']
+
+    assert bot_client.get('/logout', headers=headers).status_code == 200
+    assert bot_client.get('/start_game', headers=headers).status_code == 401  # revoked on logout
+
 def test_leaderboard(test_client, app):
     """Test leaderboard retrieval."""
     with app.app_context():
@@ -285,12 +359,621 @@ def test_start_game(test_client, app):
     assert 'auth_token' in data
     assert 'your_color' in data
 
+def test_start_game_time_control(app):
+    """Test /start_game pairs players only within the requested time control."""
+    clients = {}
+    with app.app_context():
+        for name in ('tc_a', 'tc_b', 'tc_c'):
+            user = User(username=name, elorating=1500)
+            user.set_password('pass')
+            db.session.add(user)
+            db.session.commit()
+            clients[name] = app.test_client()
+            with clients[name].session_transaction() as sess:
+                sess['_user_id'] = str(user.id)
+
+    assert clients['tc_a'].get('/start_game', query_string={'time_control': '7+x'}).status_code == 400
+    blitz = clients['tc_a'].get('/start_game', query_string={'time_control': '3+2'}).get_json()
+    assert blitz['time_control'] == '180+2' and blitz['your_color'] == 'white'
+    rapid = clients['tc_b'].get('/start_game').get_json()
+    assert rapid['game_id'] != blitz['game_id'] and rapid['your_color'] == 'white'
+    joined = clients['tc_c'].get('/start_game', query_string={'time_control': '180+2'}).get_json()
+    assert joined['game_id'] == blitz['game_id'] and joined['your_color'] == 'black'
+    with app.app_context():
+        game = db.session.get(Game, blitz['game_id'])
+        assert (game.time_left_white_ms, game.time_left_black_ms) == (180000, 180000)
+
+def test_clock_charging():
+    """Test millisecond charging with increment, lag compensation and a monotonic turn timer."""
+    assert parse_time_control('2+1') == (120000, 1000)
+    assert parse_time_control('90+0') == (90000, 0)
+    assert increment_ms('-') == 0
+    with pytest.raises(ValueError):
+        parse_time_control('0+5')
+
+    assert charge_move(10000, 2500, 0, 2000) == (9500, False)
+    assert charge_move(10000, 2500, 300, 2000) == (9800, False)  # measured lag is not charged
+    assert charge_move(10000, 2500, 5000, 0) == (8500, False)  # compensation is capped
+    assert charge_move(1000, 1200, 0, 2000) == (0, True)  # no increment after the flag falls
+
+    now = [100.0]
+    wall = [datetime(2025, 1, 1, 12, 0, 0)]
+    timer = TurnTimer(clock=lambda: now[0], wall_clock=lambda: wall[0])
+    # Without an anchor the turn start is recovered from the stored last move time once.
+    assert timer.elapsed_ms('1', wall[0] - timedelta(seconds=3)) == 3000
+    wall[0] -= timedelta(hours=1)  # a wall clock jump does not affect the running turn
+    now[0] += 0.25
+    assert timer.elapsed_ms('1', None) == 3250
+    timer.start('1')
+    now[0] += 0.1
+    assert timer.elapsed_ms('1', None) == 100
+
+    lag = LagTracker(clock=lambda: now[0])
+    lag.ping('1')
+    now[0] += 0.2
+    assert round(lag.pong('1', 7)) == 200
+    lag.ping('1')
+    now[0] += 0.1
+    assert round(lag.pong('1', 7)) == 170
+    assert lag.lag_ms('1', 8) == 0
+    lag.discard('1')
+    assert not lag.estimates and not lag.pings
+
 def test_play_local(test_client):
     """Test initiating a local game."""
     response = test_client.get('/play?local=true')
     assert response.status_code == 200
     assert b'Local Player' in response.data
 
+def test_play_render_cache(test_client, app):
+    """Test the prebuilt local page and the injected config of online pages."""
+    local = test_client.get('/play?local=true')
+    assert 'no-cache' in local.headers['Cache-Control']
+    assert test_client.get('/play?local=true', headers={'If-None-Match': local.headers['ETag']}).status_code == 304
+
+    with app.app_context():
+        white = User(username='</script><b>')
+        white.set_password('pass')
+        black = User(username='shell_black')
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        game = Game(player_white_id=white.id, player_black_id=black.id)
+        db.session.add(game)
+        db.session.commit()
+        game_id = game.id
+        token = white.generate_auth_token()
+
+    page = test_client.get(f'/play?game_id={game_id}&token={token}').get_data(as_text=True)
+    blob = re.search(r'const APP_CONFIG = (.*);', page).group(1)
+    assert '</script><b>' not in page
+    assert json.loads(blob) == {'username': '</script><b>', 'game_id': str(game_id), 'local': False}
+
+def test_sqlite_engine_profile(tmp_path, test_client):
+    """Test the pooled WAL profile for file SQLite and the pool metrics endpoint."""
+    url = make_url(f'sqlite:///{tmp_path / "profile.db"}')
+    options = engine_options(url, {'DB_POOL_SIZE': 3, 'SQLITE_BUSY_TIMEOUT': 2500})
+    engine = create_engine(url, **options)
+    install_sqlite_pragmas(engine, 2500)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 2500
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+    assert engine.pool.size() == 3
+    engine.dispose()
+
+    assert engine_options(make_url('sqlite://'), {}) == {}
+    assert engine_options(make_url('postgresql://u:p@db/chess'), {})['pool_pre_ping'] is True
+
+    test_client.get('/leaderboard')
+    data = json.loads(test_client.get('/metrics/db').data)
+    assert any(engine['checkouts'] > 0 for engine in data['engines'].values())
+
+def test_driver_thread_pool(tmp_path):
+    """Test blocking driver calls run on native threads without stalling other greenlets."""
+    url = make_url(f'sqlite:///{tmp_path / "threads.db"}')
+    options = engine_options(url, {'DB_POOL_SIZE': 2, 'DB_MAX_OVERFLOW': 1, 'DB_THREADS': 2})
+    assert options['poolclass'] is GreenQueuePool
+    engine = create_engine(url, **options)
+    threads = DriverThreadPool(2)
+    install_engine_profile(engine, url, options, threads)
+
+    ticks = []
+    ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.001)) for _ in range(1000)])
+    slow = ('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 300000) '
+            'SELECT count(*) FROM c')
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql(slow).scalar() == 300000
+    assert ticks  # the event loop kept running during the query
+    ticker.kill()
+
+    # More greenlets than connections wait for the pool, and writers for the SQLite lock, cooperatively.
+    with engine.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE counter (value INTEGER)')
+        connection.exec_driver_sql('INSERT INTO counter VALUES (0)')
+
+    def query(i):
+        with engine.begin() as connection:
+            connection.exec_driver_sql('UPDATE counter SET value = value + 1')
+            gevent.sleep(0.001)  # hold the write lock across a switch
+            return connection.exec_driver_sql(f'SELECT {i}').scalar()
+    done = gevent.joinall([gevent.spawn(query, i) for i in range(10)], raise_error=True)
+    assert sorted(greenlet.value for greenlet in done) == list(range(10))
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT value FROM counter').scalar() == 10
+    assert engine.pool.checkedout() == 0 and threads.calls > 10
+    engine.dispose()
+
+    # Events of one game are handled one at a time.
+    order = []
+    scopes = EventScopes(MagicMock())
+
+    def event(name, game_id):
+        with scopes.scope(game_id):
+            order.append(f'{name}+')
+            gevent.sleep(0.01)
+            order.append(f'{name}-')
+    gevent.joinall([gevent.spawn(event, 'a', '1'), gevent.spawn(event, 'b', '1'), gevent.spawn(event, 'c', '2')])
+    assert order.index('a-') < order.index('b+') and order.index('c+') < order.index('a-')
+    assert scopes.session.remove.call_count == 3 and not scopes._queues
+
+def test_fingerprinted_assets(test_client):
+    """Test fingerprinted, precompressed static assets with immutable caching and 304s."""
+    page = test_client.get('/play?local=true').get_data(as_text=True)
+    match = re.search(r'/assets/js/script\.([0-9a-f]{12})\.js', page)
+    assert match
+    url = match.group(0)
+    with open('backend/static/js/script.js', 'rb') as f:
+        original = f.read()
+
+    response = test_client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.data) == original
+
+    plain = test_client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == original
+
+    cached = test_client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    assert test_client.get('/assets/js/script.000000000000.js').status_code == 404
+
+def test_game_context_cache(app):
+    """Test that a game context is loaded with one query and reused until invalidated."""
+    with app.app_context():
+        white = User(username='ctx_white', elorating=1300)
+        white.set_password('pass')
+        black = User(username='ctx_black', elorating=1250)
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        game = Game(player_white_id=white.id, player_black_id=black.id, is_active=True, is_waiting=False)
+        db.session.add(game)
+        db.session.commit()
+        game_id, white_id = game.id, white.id
+        db.session.expunge_all()
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            context = get_game_context(game_id)
+            assert len(statements) == 1  # game and both players in one JOIN
+            assert context.player_black.username == 'ctx_black'
+            assert context.color_of(white_id) == 'white'
+
+            statements.clear()
+            assert get_game_context(game_id) is context
+            assert statements == []
+
+            context.save(moves='e2e4', time_left_white_ms=590000)
+            db.session.commit()
+            assert all(statement.startswith(('UPDATE', 'COMMIT')) for statement in statements)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert db.session.get(Game, game_id).moves == 'e2e4'
+        invalidate_game_contexts(user_ids=[white_id])
+        assert str(game_id) not in game_contexts
+
+def test_premove(app):
+    """Test a premove is played right after the opponent's move and charged minimal time."""
+    with app.app_context():
+        white = User(username='pre_white', elorating=1500)
+        white.set_password('pass')
+        black = User(username='pre_black', elorating=1500)
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        game = Game(player_white_id=white.id, player_black_id=black.id, is_waiting=False, time_control='180+2',
+                    time_left_white_ms=180000, time_left_black_ms=180000)
+        db.session.add(game)
+        db.session.commit()
+        room = str(game.id)
+        context = get_game_context(game.id)
+        board = chess.Board()
+
+        premoves[room] = ('black', chess.Move.from_uci('e7e5'))
+        assert play_move(context, board, chess.Move.from_uci('e2e4'), 1500, 300)[0] == 'e4'
+        assert apply_premove(context, board, room)[0] == 'e5'
+        assert context.moves == 'e2e4 e7e5' and room not in premoves
+        assert (context.time_left_white_ms, context.time_left_black_ms) == (180800, 181900)
+        assert list(unpack_move_times(context.move_times)) == [1200, PREMOVE_MARK]  # not a think time
+
+        # A premove that became illegal is dropped; a flagged player's move is not played.
+        premoves[room] = ('white', chess.Move.from_uci('e4e5'))
+        assert apply_premove(context, board, room) is None and room not in premoves
+        assert play_move(context, board, chess.Move.from_uci('g1f3'), 200000, 0) == (None, False)
+        assert len(board.move_stack) == 2 and context.time_left_white_ms == 180800
+
+def test_fairplay_timing_report():
+    """Test per-player think-time statistics flag uniform times that ignore position complexity."""
+    rng = random.Random(7)
+    stats = TimingStats(chunk_moves=100)
+    timed = {1: 0, 2: 0}
+    for _ in range(6):
+        board = chess.Board()
+        move_times = b''
+        while len(board.move_stack) < 80 and not board.is_game_over():
+            complexity = board.legal_moves.count()
+            if board.turn == chess.WHITE:
+                time_ms = 3000 + rng.randint(-100, 100)  # fixed delay regardless of the position
+            elif rng.random() < 0.2:
+                time_ms = None  # a premove: its fixed charge is not a think time
+            else:
+                time_ms = int(complexity * 200 * rng.uniform(0.3, 1.7))
+            if len(board.move_stack) >= OPENING_PLIES and time_ms is not None:
+                timed[1 if board.turn == chess.WHITE else 2] += 1
+            move_times = append_move_time(move_times, time_ms)
+            board.push(rng.choice(list(board.legal_moves)))
+        uci_moves = ' '.join(move.uci() for move in board.move_stack)
+        assert stats.add_game(1, 2, uci_moves, move_times, '180+2')
+    assert not stats.add_game(1, 2, 'e2e4 e7e5', append_move_time(None, 500), '180+2')  # started before timing
+
+    bot, human = stats.report(min_moves=50)
+    assert (bot['user_id'], bot['flagged'], human['user_id'], human['flagged']) == (1, True, 2, False)
+    assert (bot['moves'], human['moves']) == (timed[1], timed[2])
+    assert bot['cv'] < 0.05 < 0.3 < human['complexity_correlation']
+    assert stats.games == 6 and stats.skipped == 1
+
+def test_presence_tracking():
+    """Test multi-connection presence, reconnect grace and room release."""
+    now = [0.0]
+    presence = Presence(grace=30, clock=lambda: now[0])
+
+    assert not presence.join('w1', '7', 1).both_present
+    joined = presence.join('b1', '7', 2)
+    assert joined.both_present and joined.first_start
+
+    # A second tab and a reconnect do not restart the game.
+    assert not presence.join('w2', '7', 1).first_start
+    assert presence.leave('w1') == ('7', 1, False)
+    assert presence.leave('w2') == ('7', 1, True)
+    now[0] = 10
+    assert presence.is_present('7', 1)
+    joined = presence.join('w3', '7', 1)
+    assert joined.reconnected and joined.both_present and not joined.first_start
+
+    # Everyone leaves; the room is released only after the grace period.
+    presence.leave('w3')
+    presence.leave('b1')
+    now[0] = 39
+    assert presence.expired_rooms() == []
+    now[0] = 41
+    assert presence.expired_rooms() == ['7']
+    presence.release('7')
+    assert len(presence) == 0 and not presence.sids and not presence.away and not presence.started
+
+def test_board_cache_eviction():
+    """Test the board cache evicts least recently used and idle boards and reloads them from moves."""
+    now = [0.0]
+    evicted = []
+    empty = board_bytes(chess.Board())
+    cache = BoardCache(max_bytes=empty * 2 + MOVE_BYTES * 3 + 100, idle=60, on_evict=evicted.append,
+                       clock=lambda: now[0])
+
+    cache.load('1', '')
+    cache.load('2', '')
+    assert cache.get('1') is not None  # '2' is now the least recently used
+    board = cache.load('3', 'e2e4 e7e5 g1f3')
+    assert evicted == ['2'] and len(cache) == 2 and cache.loads == 3
+    assert cache.bytes == empty * 2 + MOVE_BYTES * 3
+
+    board.push_uci('b8c6')
+    cache.resize('3')
+    assert evicted == ['2', '1'] and cache.bytes == board_bytes(board)
+
+    # An evicted board is rebuilt from the stored moves on the next event.
+    assert cache.load('1', 'd2d4').peek() == chess.Move.from_uci('d2d4')
+    assert evicted[-1] == '3' and cache.loads == 4
+
+    # Boards without events for longer than the idle time are evicted by the sweep.
+    now[0] = 30
+    cache.load('4', '')
+    now[0] = 61
+    assert cache.evict_idle() == 1 and '1' not in cache and '4' in cache
+
+def test_board_snapshot():
+    """Test idle boards are compacted into snapshots that inflate to an equivalent board."""
+    board = chess.Board()
+    for uci in 'e2e4 d7d5 e4e5 f7f5 e5f6 e8f7 f6g7 b8c6 g7h8q g8f6 g1f3 c8g4 f1e2 d8d6 e1g1'.split():
+        board.push_uci(uci)
+    for _ in range(2):
+        for uci in 'c6b8 f3h4 b8c6 h4f3'.split():
+            board.push_uci(uci)
+    snapshot = BoardSnapshot.from_board(board)
+    assert len(snapshot.moves) == 2 * board.halfmove_clock  # only moves since the last capture or pawn move
+    inflated = snapshot.inflate()
+    assert inflated.fen() == board.fen() and ply(inflated) == len(board.move_stack)
+    assert inflated.can_claim_threefold_repetition() == board.can_claim_threefold_repetition() is True
+    assert snapshot.nbytes() < board_bytes(board) // 20
+
+    now = [0.0]
+    cache = BoardCache(clock=lambda: now[0], compact=60)
+    cache.put('1', board)
+    now[0] = 61
+    assert cache.compact_idle() == 1 and cache.bytes == snapshot.nbytes()
+    assert cache.get('1').fen() == board.fen() and cache.inflations == 1
+
+def test_reaper(app):
+    """Test expiry of stale waiting games, abandoned games and expired tokens."""
+    with app.app_context():
+        now = datetime.utcnow()
+        white = User(username='reap_white', elorating=1500)
+        white.set_password('pass')
+        black = User(username='reap_black', elorating=1500)
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        stale = Game(player_white_id=white.id, is_waiting=True, last_move_time=now - timedelta(hours=1))
+        fresh = Game(player_white_id=white.id, is_waiting=True, last_move_time=now)
+        abandoned = Game(player_white_id=white.id, player_black_id=black.id, is_waiting=False, moves='e2e4',
+                         time_left_black_ms=300000, last_move_time=now - timedelta(minutes=20))
+        thinking = Game(player_white_id=white.id, player_black_id=black.id, is_waiting=False,
+                        time_left_white_ms=600000, last_move_time=now - timedelta(minutes=5))
+        db.session.add_all([stale, fresh, abandoned, thinking])
+        db.session.commit()
+        white.generate_auth_token()
+        white.auth_token_expires_at = now - timedelta(minutes=1)
+        db.session.commit()
+
+        assert reap(batch_size=1) == {'rooms': 0, 'waiting': 1, 'abandoned': 1, 'tokens': 1, 'rounds': 0}
+        assert not db.session.get(Game, stale.id).is_active
+        assert db.session.get(Game, fresh.id).is_active
+        assert db.session.get(Game, abandoned.id).result == 'white'  # black ran out of time on move
+        assert db.session.get(Game, abandoned.id).finished_at is not None
+        assert db.session.get(Game, thinking.id).is_active
+        assert db.session.get(User, white.id).auth_token is None
+        assert db.session.get(User, white.id).wins == 1
+
+def test_notification_outbox(app):
+    """Test outbox notifications are coalesced, leased to the bot and deleted on ack."""
+    app.config['OUTBOX_SECRET'] = 'outbox-secret'
+    client = app.test_client()
+    with app.app_context():
+        white = User(username='notify_white', elorating=1500)
+        white.set_password('pass')
+        black = User(username='notify_black', elorating=1500)
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        client.post('/login', data={'username': 'notify_white', 'password': 'pass', 'chat_id': 111})
+        client.post('/login', data={'username': 'notify_black', 'password': 'pass', 'chat_id': 222})
+        game = Game(player_white_id=white.id, player_black_id=black.id, is_waiting=False,
+                    white_elo=1500, black_elo=1500)
+        db.session.add(game)
+        db.session.commit()
+
+        context = get_game_context(game.id)
+        outbox.notify_your_move(game.id, context.player_black, context.player_white, 'e4')
+        outbox.notify_your_move(game.id, context.player_black, context.player_white, 'd4')
+        update_ratings_on_win(game, 'white', 'black')
+        mark_game_finished(game)
+        db.session.commit()
+
+    headers = {'X-Outbox-Secret': 'outbox-secret'}
+    assert client.post('/outbox/claim').status_code == 403
+    for body in ({'limit': 'abc'}, {'limit': None}, {'limit': [1]}, ['limit']):
+        assert client.post('/outbox/claim', json=body, headers=headers).status_code == 400
+    assert client.post('/outbox/ack', json={'ids': ['x']}, headers=headers).status_code == 400
+    notifications = client.post('/outbox/claim', json={'limit': 10}, headers=headers).get_json()['notifications']
+    assert [(n['chat_id'], n['kind']) for n in notifications] == [(222, 'your_move'), (111, 'game_over'),
+                                                                 (222, 'game_over')]
+    assert notifications[0]['text'].endswith('played d4.')  # the earlier move was coalesced
+    assert '(+' in notifications[1]['text'] and '(-' in notifications[2]['text']
+    assert client.post('/outbox/claim', headers=headers).get_json()['notifications'] == []  # leased
+
+    ids = [n['id'] for n in notifications]
+    assert client.post('/outbox/ack', json={'ids': ids}, headers=headers).get_json() == {'deleted': 3}
+    with app.app_context():
+        assert outbox.claim(now=datetime.utcnow() + timedelta(hours=1)) == []
+
+def test_swiss_and_round_robin_pairings():
+    """Test Swiss rounds avoid repeats and balance colours, and round robin meets everyone once."""
+    entrants = {i: Entrant(i, rating=2000 - i * 10) for i in range(1, 12)}
+    met, byes = set(), []
+    for round_number in range(5):
+        pairs, bye = swiss_pairings(entrants.values())
+        byes.append(bye)
+        assert len(pairs) == 5
+        for white_id, black_id in pairs:
+            assert frozenset((white_id, black_id)) not in met
+            met.add(frozenset((white_id, black_id)))
+            white, black = entrants[white_id], entrants[black_id]
+            white.opponents.add(black_id)
+            black.opponents.add(white_id)
+            white.colors += 'w'
+            black.colors += 'b'
+            white.score += 1  # white always wins: score groups split quickly
+        entrants[bye].colors += '-'
+        entrants[bye].score += 1
+    assert len(set(byes)) == 5
+    for entrant in entrants.values():
+        played = entrant.colors.replace('-', '')
+        assert abs(entrant.color_balance()) <= 2 and 'www' not in played and 'bbb' not in played
+
+    ids = list(range(1, 8))
+    games = [pair for r in range(1, round_robin_rounds(len(ids)) + 1) for pair in round_robin_pairings(ids, r)[0]]
+    assert len(games) == 21
+    assert {frozenset(pair) for pair in games} == {frozenset((a, b)) for a in ids for b in ids if a < b}
+
+
+def test_tournament_rounds(app):
+    """Test a Swiss tournament: bulk round creation, results from finished games and final standings."""
+    clients = {}
+    with app.app_context():
+        for i, name in enumerate(['t_alice', 't_bob', 't_carol']):
+            user = User(username=name, elorating=1600 - i * 100)
+            user.set_password('pass')
+            db.session.add(user)
+        db.session.commit()
+    for name in ['t_alice', 't_bob', 't_carol']:
+        clients[name] = app.test_client()
+        login_test_user(clients[name], name, 'pass')
+
+    response = clients['t_alice'].post('/tournaments', data={'name': 'Cup', 'kind': 'swiss', 'rounds': 3})
+    assert response.status_code == 201
+    tournament_id = response.get_json()['tournament_id']
+    for name in clients:
+        assert clients[name].post(f'/tournaments/{tournament_id}/join').status_code == 200
+    assert clients['t_bob'].post(f'/tournaments/{tournament_id}/start').status_code == 403
+    data = clients['t_alice'].post(f'/tournaments/{tournament_id}/start').get_json()
+    assert data['status'] == 'running' and data['round'] == 1 and len(data['games']) == 1
+
+    for round_number in range(1, 4):
+        with app.app_context():
+            games = Game.query.filter_by(tournament_id=tournament_id, tournament_round=round_number).all()
+            assert len(games) == 1 and not games[0].is_waiting
+            game = games[0]
+            white = db.session.get(User, game.player_white_id)
+            # /start_game opens the tournament game instead of looking for an opponent
+            response = clients[white.username].get('/start_game').get_json()
+            assert response['game_id'] == game.id and response['your_color'] == 'white'
+            update_ratings_on_win(game, 'white', 'black')
+            if round_number == 2:
+                # Simulate the last two games of a round each seeing the other as still active.
+                with patch('backend.tournament.finish_round', return_value=False):
+                    mark_game_finished(game)
+                db.session.commit()
+                assert db.session.get(Tournament, tournament_id).current_round == 2
+                assert advance_stalled_rounds() == 1
+            else:
+                mark_game_finished(game)
+            db.session.commit()
+            assert advance_stalled_rounds() == 0
+
+    data = app.test_client().get(f'/tournaments/{tournament_id}').get_json()
+    assert data['status'] == 'finished' and data['round'] == 3
+    # Each player had one bye and one game with each colour; white won every game.
+    assert [row['score'] for row in data['standings']] == [2.0, 2.0, 2.0]
+    assert all(sorted(row['colors']) == ['-', 'b', 'w'] for row in data['standings'])
+    assert [row['rank'] for row in data['standings']] == [1, 2, 3]
+
+    # Tournament games stay out of the archive: pairings and Buchholz are computed from them.
+    with app.app_context():
+        for game in Game.query.filter_by(tournament_id=tournament_id):
+            game.finished_at -= timedelta(days=30)
+        db.session.commit()
+        assert archive_finished_games(timedelta(days=7)) == 0
+
+
+def test_arena_standings_and_pairing():
+    """Test standings deltas replay to the full table and arena pairing avoids immediate rematches."""
+    standings = ArenaStandings()
+    standings.update([(i, f'p{i}', 0) for i in range(1, 6)])
+    client_rows = standings.snapshot()['rows']
+    for changes in ([(5, 'p5', 4)], [(3, 'p3', 2), (1, 'p1', 2)], [(5, 'p5', 4), (4, 'p4', 6)]):
+        delta = standings.update(changes)
+        assert len(delta['moves']) == len(changes)
+        for move in delta['moves']:  # what a client does with a delta
+            client_rows = [row for row in client_rows if row['user_id'] != move['user_id']]
+            client_rows.insert(move['rank'] - 1, move)
+        assert [(r['user_id'], r['score']) for r in client_rows] == \
+            [(r['user_id'], r['score']) for r in standings.snapshot()['rows']]
+    assert delta['from_version'] == 3 and delta['version'] == 4
+    assert [row['user_id'] for row in standings.snapshot()['rows']] == [4, 5, 1, 3, 2]
+
+    assert arena_points(1, 0) == (2, 1) and arena_points(1, 2) == (4, 3)
+    assert arena_points(0.5, 2) == (2, 0) and arena_points(0, 5) == (0, 0)
+
+    event = ArenaEvent(1)
+    event.standings = standings
+    for user_id in (1, 2, 3, 4):
+        event.enqueue(user_id)
+    pairs = event.pair()
+    assert {frozenset(pair) for pair in pairs} == {frozenset((4, 1)), frozenset((3, 2))}  # neighbours by score
+    for user_id in (1, 2, 3, 4):
+        event.enqueue(user_id)
+    assert {frozenset(pair) for pair in event.pair()} == {frozenset((4, 3)), frozenset((1, 2))}
+    event.enqueue(1)
+    event.enqueue(3)
+    event.last_opponent.update({1: 3, 3: 1})
+    assert event.pair() == []  # only the previous opponents are waiting: wait for others first
+
+
+def test_arena_tournament(app):
+    """Test an arena re-queues players as their games finish and keeps pairing until it ends."""
+    clients = {}
+    with app.app_context():
+        for name in ['a_one', 'a_two', 'a_three', 'a_four']:
+            user = User(username=name, elorating=1500)
+            user.set_password('pass')
+            db.session.add(user)
+        db.session.commit()
+    for name in ['a_one', 'a_two', 'a_three', 'a_four']:
+        clients[name] = app.test_client()
+        login_test_user(clients[name], name, 'pass')
+
+    response = clients['a_one'].post('/tournaments', data={'name': 'Arena', 'kind': 'arena'})
+    assert response.status_code == 400  # an arena needs a duration
+    response = clients['a_one'].post('/tournaments', data={'name': 'Arena', 'kind': 'arena', 'duration': 60})
+    tournament_id = response.get_json()['tournament_id']
+    for name in ['a_one', 'a_two', 'a_three']:
+        clients[name].post(f'/tournaments/{tournament_id}/join')
+    assert clients['a_one'].post(f'/tournaments/{tournament_id}/start').get_json()['status'] == 'running'
+    assert clients['a_four'].post(f'/tournaments/{tournament_id}/join').status_code == 200  # late entry
+
+    def finish(game_id, winner):
+        with app.app_context():
+            game = db.session.get(Game, game_id)
+            update_ratings_on_win(game, winner, 'black' if winner == 'white' else 'white')
+            mark_game_finished(game)
+            db.session.commit()
+
+    with app.app_context():
+        assert pair_arenas() == 2
+        first, second = Game.query.filter_by(tournament_id=tournament_id).order_by(Game.id).all()
+        first_pair = {first.player_white_id, first.player_black_id}
+    finish(first.id, 'white')
+    event = arena_events[tournament_id]
+    assert first_pair <= set(event.waiting)
+    with app.app_context():
+        assert pair_arenas() == 0  # the only waiting players have just played each other
+    finish(second.id, 'white')
+    with app.app_context():
+        assert pair_arenas() == 2
+        new_games = Game.query.filter_by(tournament_id=tournament_id, is_active=True).all()
+        assert all({g.player_white_id, g.player_black_id} != first_pair for g in new_games)
+
+    arena_events.clear()  # another worker (or a restart) rebuilds the state from the database
+    finish(new_games[0].id, 'white')
+    with app.app_context():
+        db.session.get(Tournament, tournament_id).ends_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert pair_arenas() == 0
+    assert len(arena_events[tournament_id].waiting) == 0
+    finish(new_games[1].id, 'black')
+    assert tournament_id not in arena_events
+
+    data = app.test_client().get(f'/tournaments/{tournament_id}').get_json()
+    assert data['status'] == 'finished'
+    assert sorted(row['score'] for row in data['standings']) == [0, 2, 2, 4]
+
+
 def test_update_ratings_on_win(app):
     """Test updating ratings on a win."""
     with app.app_context():
@@ -308,8 +991,8 @@ def test_update_ratings_on_win(app):
             player_black_id=player_black.id,
             is_active=True,
             fen=chess.Board().fen(),
-            time_left_white=600,
-            time_left_black=600,
+            time_left_white_ms=600000,
+            time_left_black_ms=600000,
             last_move_time=datetime.utcnow()
         )
         db.session.add(game)
@@ -342,8 +1025,8 @@ def test_update_ratings_on_draw(app):
             player_black_id=player_black.id,
             is_active=True,
             fen=chess.Board().fen(),
-            time_left_white=600,
-            time_left_black=600,
+            time_left_white_ms=600000,
+            time_left_black_ms=600000,
             last_move_time=datetime.utcnow()
         )
         db.session.add(game)
@@ -381,6 +1064,438 @@ def test_error_handlers(test_client, app):
     if original_play_route:
         flask_app.view_functions['play'] = original_play_route
 
+def test_export_games_pgn(test_client, app):
+    """Test streaming PGN export of a user's finished games."""
+    with app.app_context():
+        white = User(username='pgn_white', elorating=1510)
+        white.set_password('pass')
+        black = User(username='pgn_black', elorating=1490)
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+
+        finished = Game(
+            player_white_id=white.id,
+            player_black_id=black.id,
+            is_active=False,
+            is_waiting=False,
+            moves='f2f3 e7e5 g2g4 d8h4',
+            white_elo=1510,
+            black_elo=1490,
+            time_control='600+0',
+            result='black',
+            finished_at=datetime(2024, 12, 14, 12, 0)
+        )
+        unfinished = Game(player_white_id=white.id, player_black_id=black.id, moves='e2e4')
+        db.session.add_all([finished, unfinished])
+        db.session.commit()
+
+    response = test_client.get('/users/pgn_white/games.pgn')
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-chess-pgn'
+    assert '[White "pgn_white"]' in text
+    assert '[Black "pgn_black"]' in text
+    assert '[Result "0-1"]' in text
+    assert '[WhiteElo "1510"]' in text
+    assert '[TimeControl "600+0"]' in text
+    assert '1. f3 e5 2. g4 Qh4# 0-1' in text
+    assert text.count('[Event ') == 1  # unfinished games are not exported
+
+    response = test_client.get('/users/nobody/games.pgn')
+    assert response.status_code == 404
+
+def test_game_history_pagination(test_client, app):
+    """Test keyset-paginated game history with result and colour filters."""
+    with app.app_context():
+        hero = User(username='hero')
+        hero.set_password('pass')
+        rival = User(username='rival')
+        rival.set_password('pass')
+        db.session.add_all([hero, rival])
+        db.session.commit()
+        results = ['white', 'black', 'draw', 'white', 'black']
+        for i, result in enumerate(results):
+            white, black = (hero, rival) if i % 2 == 0 else (rival, hero)
+            db.session.add(Game(player_white_id=white.id, player_black_id=black.id, is_active=False,
+                                result=result, finished_at=datetime(2024, 12, 1 + i)))
+        db.session.add(Game(player_white_id=hero.id, player_black_id=rival.id, is_active=True))
+        db.session.commit()
+
+        plan = db.session.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM game WHERE player_white_id = 1 AND finished_at < "2025" '
+            'ORDER BY finished_at DESC, id DESC LIMIT 3'
+        ).fetchall()
+        assert any('ix_game_white_finished' in row[-1] for row in plan)
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/users/hero/games?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = json.loads(test_client.get(url).data)
+        assert len(data['games']) <= 2
+        seen.extend(game['finished_at'] for game in data['games'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == 5  # the active game is not part of the history
+
+    data = json.loads(test_client.get('/users/hero/games?result=win').data)
+    assert [game['your_color'] for game in data['games']] == ['black', 'white']
+
+    data = json.loads(test_client.get('/users/hero/games?color=black&result=loss').data)
+    assert [game['result'] for game in data['games']] == ['white']
+
+    assert test_client.get('/users/hero/games?cursor=broken').status_code == 400
+    assert test_client.get('/users/hero/games?color=red').status_code == 400
+    assert test_client.get('/users/nobody/games').status_code == 404
+
+def test_archive_finished_games(test_client, app):
+    """Test moving old finished games to the archive while keeping them readable."""
+    with app.app_context():
+        white = User(username='arch_white')
+        white.set_password('pass')
+        black = User(username='arch_black')
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        old = Game(player_white_id=white.id, player_black_id=black.id, is_active=False, result='black',
+                   moves='f2f3 e7e5 g2g4 d8h4', finished_at=datetime.utcnow() - timedelta(days=30))
+        recent = Game(player_white_id=white.id, player_black_id=black.id, is_active=False, result='draw',
+                      finished_at=datetime.utcnow())
+        live = Game(player_white_id=white.id, player_black_id=black.id, is_active=True)
+        db.session.add_all([old, recent, live])
+        db.session.commit()
+        old_id = old.id
+
+        assert archive_finished_games(timedelta(days=7)) == 1
+        assert db.session.get(Game, old_id) is None
+        assert Game.query.count() == 2
+        archived = db.session.get(ArchivedGame, old_id)
+        assert archived.moves == 'f2f3 e7e5 g2g4 d8h4'
+
+    data = json.loads(test_client.get('/users/arch_white/games').data)
+    assert [game['id'] for game in data['games']][-1] == old_id
+    assert data['games'][-1]['black'] == 'arch_black'
+
+    text = test_client.get('/users/arch_white/games.pgn').get_data(as_text=True)
+    assert '1. f3 e5 2. g4 Qh4# 0-1' in text
+
+    with app.app_context():
+        # An archive run interrupted before deleting the originals leaves a game in both tables.
+        recent = Game.query.filter_by(result='draw').one()
+        db.session.add(ArchivedGame.from_game(recent))
+        db.session.commit()
+        assert sorted(game.id for game in iter_finished_games(batch_size=1)) == sorted([old_id, recent.id])
+
+def test_game_position_replay(test_client, app):
+    """Test random access to a stored game's plies through checkpoints and the streaming replay."""
+    board = chess.Board()
+    for _ in range(40):
+        board.push(sorted(board.legal_moves, key=lambda move: move.uci())[0])
+    uci_moves = ' '.join(move.uci() for move in board.move_stack)
+    with app.app_context():
+        white = User(username='replay_white')
+        white.set_password('pass')
+        db.session.add(white)
+        db.session.commit()
+        game = Game(player_white_id=white.id, result='draw', moves=uci_moves)
+        db.session.add(game)
+        db.session.commit()
+        mark_game_finished(game)
+        assert len(game.checkpoints.split('\n')) == 40 // CHECKPOINT_INTERVAL
+        game.finished_at -= timedelta(days=30)
+        db.session.commit()
+        game_id = game.id
+        assert archive_finished_games(timedelta(days=7)) == 1
+
+    expected = chess.Board()
+    for move in board.move_stack[:37]:
+        expected.push(move)
+    data = json.loads(test_client.get(f'/games/{game_id}/position', query_string={'ply': 37}).data)
+    assert data['fen'] == expected.fen() and data['move'] == board.move_stack[36].uci()
+    assert data['plies'] == 40 and data['replayed'] == 37 - 2 * CHECKPOINT_INTERVAL
+    assert json.loads(test_client.get(f'/games/{game_id}/position').data)['fen'] == board.fen()
+    assert test_client.get(f'/games/{game_id}/position', query_string={'ply': 41}).status_code == 400
+    assert test_client.get('/games/999999/position').status_code == 404
+
+    replays['sid'] = 1
+    with patch.object(socketio, 'emit') as emit_mock:
+        stream_replay('sid', 1, uci_moves, 38, 10.0, lambda _: None)
+    frames = [call.args for call in emit_mock.call_args_list]
+    assert [name for name, _ in frames] == ['replay_move', 'replay_move', 'replay_end']
+    assert frames[1][1]['ply'] == 40 and frames[1][1]['fen'] == board.fen()
+
+    with patch.object(socketio, 'emit') as emit_mock:
+        stream_replay('sid', 0, uci_moves, 0, 10.0, lambda _: None)  # superseded by a newer replay
+    emit_mock.assert_not_called()
+    replays.clear()
+
+def test_position_index_merge_and_reload(tmp_path):
+    """Test the sorted position index across delta, merge and reopen."""
+    path = str(tmp_path / 'positions.idx')
+    index = PositionIndex(path, merge_threshold=1000)
+    index.add_game(1, 'e2e4 e7e5 g1f3')
+    index.add_game(2, 'g1f3 e7e5 e2e4')  # transposes into the same position
+    index.add_game(3, 'd2d4 d7d5')
+
+    board = chess.Board()
+    for uci in ['e2e4', 'e7e5', 'g1f3']:
+        board.push_uci(uci)
+    assert index.lookup_board(board) == ([2, 1], 2)
+
+    index.merge()
+    index.add_game(4, 'e2e4 e7e5 g1f3 b8c6')
+    assert index.lookup_board(board) == ([4, 2, 1], 3)
+    assert index.lookup_board(board, limit=2) == ([4, 2], 3)
+    index.close()
+
+    reopened = PositionIndex(path)
+    assert reopened.lookup_board(board) == ([4, 2, 1], 3)
+    assert reopened.lookup(position_hash(chess.Board())) == ([], 0)
+    reopened.close()
+
+def test_position_index_shared_between_processes(tmp_path):
+    """Test that indexes sharing files (one per worker process) see each other's games across merges."""
+    path = str(tmp_path / 'positions.idx')
+    first = PositionIndex(path, merge_threshold=4)
+    second = PositionIndex(path, merge_threshold=4)
+    first.add_game(1, 'e2e4 e7e5')
+    second.add_game(2, 'e2e4 c7c5')
+    assert first.merge_due()
+
+    board = chess.Board()
+    board.push_uci('e2e4')
+    assert first.lookup_board(board) == ([2, 1], 2)
+    assert first.merge()
+    assert not os.path.exists(f'{path}.delta')
+
+    # The other worker's records were merged, not dropped, and it picks up the new main file.
+    second.add_game(3, 'e2e4 e7e6')
+    assert second.lookup_board(board) == ([3, 2, 1], 3)
+    assert first.lookup_board(board) == ([3, 2, 1], 3)
+    assert len(first) == 6
+    first.close()
+    second.close()
+
+def test_search_position(test_client, app):
+    """Test that finished games are indexed and searchable by FEN."""
+    with app.app_context():
+        white = User(username='idx_white')
+        white.set_password('pass')
+        black = User(username='idx_black')
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        game = Game(player_white_id=white.id, player_black_id=black.id, is_active=True, moves='e2e4 e7e5')
+        db.session.add(game)
+        db.session.commit()
+        game.result = 'draw'
+        mark_game_finished(game)
+        db.session.commit()
+        game_id = game.id
+
+    board = chess.Board()
+    board.push_uci('e2e4')
+    response = test_client.get('/search/position', query_string={'fen': board.fen()})
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data == {'game_ids': [game_id], 'total': 1}
+
+    assert test_client.get('/search/position', query_string={'fen': 'not a fen'}).status_code == 400
+
+def test_opening_explorer(test_client, app):
+    """Test incremental explorer aggregation and the bulk rebuild."""
+    with app.app_context():
+        white = User(username='exp_white')
+        white.set_password('pass')
+        black = User(username='exp_black')
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        specs = [('e2e4 e7e5', 'white', 1600, 1400), ('e2e4 c7c5', 'draw', 1500, 1500), ('d2d4 d7d5', 'black', None, 1500)]
+        for moves, result, white_elo, black_elo in specs:
+            game = Game(player_white_id=white.id, player_black_id=black.id, is_active=True, moves=moves,
+                        white_elo=white_elo, black_elo=black_elo)
+            db.session.add(game)
+            db.session.commit()
+            game.result = result
+            mark_game_finished(game)
+            db.session.commit()
+
+    assert test_client.get('/explorer').status_code == 401
+    test_client.post('/login', data={'username': 'exp_white', 'password': 'pass'})
+    data = json.loads(test_client.get('/explorer').data)
+    assert data['moves'][0] == {'uci': 'e2e4', 'san': 'e4', 'games': 2, 'white_wins': 1, 'draws': 1,
+                                'black_wins': 0, 'average_rating': 1500}
+    assert data['moves'][1]['san'] == 'd4'
+    assert data['moves'][1]['average_rating'] is None
+
+    board = chess.Board()
+    board.push_uci('e2e4')
+    data = json.loads(test_client.get('/explorer', query_string={'fen': board.fen()}).data)
+    assert sorted(move['san'] for move in data['moves']) == ['c5', 'e5']
+
+    with app.app_context():
+        before = [(row.position_hash, row.move, row.white_wins, row.draws, row.black_wins)
+                  for row in OpeningStat.query.order_by(OpeningStat.position_hash, OpeningStat.move)]
+        assert opening_explorer.rebuild(Game.query.all()) == 3
+        after = [(row.position_hash, row.move, row.white_wins, row.draws, row.black_wins)
+                 for row in OpeningStat.query.order_by(OpeningStat.position_hash, OpeningStat.move)]
+        assert before == after
+
+        # A position first reached by two games at once: the second insert adds to the first one's row.
+        key = (12345, 'e2e4')
+        opening_explorer.apply_deltas({key: [1, 0, 0, 1500, 1]})
+        opening_explorer.apply_deltas({key: [0, 1, 0, 0, 0]})
+        db.session.commit()
+        row = db.session.get(OpeningStat, key)
+        assert (row.white_wins, row.draws, row.black_wins, row.rating_sum, row.rated_games) == (1, 1, 0, 1500, 1)
+
+    # A player in a live game gets no explorer hints until the game is over.
+    with app.app_context():
+        white, black = [User.query.filter_by(username=name).one() for name in ('exp_white', 'exp_black')]
+        live = Game(player_white_id=white.id, player_black_id=black.id, is_active=True, is_waiting=False)
+        db.session.add(live)
+        db.session.commit()
+        live_id = live.id
+    assert test_client.get('/explorer').status_code == 403
+    with app.app_context():
+        db.session.get(Game, live_id).is_active = False
+        db.session.commit()
+    assert test_client.get('/explorer').status_code == 200
+
+def test_eco_classification(app, tmp_path):
+    """Test ECO classification by the longest matching opening line."""
+    assert classify('e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1e3') == \
+        ('B90', 'Sicilian Defense: Najdorf Variation')
+    assert classify('e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 h2h3') == ('C68', 'Ruy Lopez: Morphy Defense')
+    assert classify('a2a4') == (None, None)
+
+    # A full external table split into several files (a.tsv … e.tsv) is read from a directory.
+    source_dir = tmp_path / 'chess-openings'
+    source_dir.mkdir()
+    (source_dir / 'a.tsv').write_text('eco\tname\tpgn\nA00\tWare Opening\t1. a4\n', encoding='utf-8')
+    (source_dir / 'b.tsv').write_text('eco\tname\tpgn\nB01\tScandinavian Defense\t1. e4 d5\n'
+                                      'B01\tScandinavian Defense: Mieses-Kotroc Variation\t1. e4 d5 2. exd5 Qxd5\n',
+                                      encoding='utf-8')
+    trie_path = str(tmp_path / 'eco.trie.json')
+    assert build_eco_trie([str(source_dir)], trie_path) == 3
+    assert classify('a2a4 e7e5', trie_path) == ('A00', 'Ware Opening')
+    assert classify('e2e4 d7d5 e4d5 d8d5 b1c3', trie_path) == \
+        ('B01', 'Scandinavian Defense: Mieses-Kotroc Variation')
+
+    with app.app_context():
+        white = User(username='eco_white')
+        white.set_password('pass')
+        black = User(username='eco_black')
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        game = Game(player_white_id=white.id, player_black_id=black.id, is_active=True)
+        db.session.add(game)
+        db.session.commit()
+
+        board = chess.Board()
+        changes = []
+        for uci in ['d2d4', 'g8f6', 'c2c4', 'e7e6', 'b1c3', 'f8b4']:
+            board.push_uci(uci)
+            game.moves = f'{game.moves} {uci}' if game.moves else uci
+            changes.append(update_opening(game, board))
+        assert changes == [True, True, True, True, False, True]
+        assert (game.eco, game.opening) == ('E20', 'Nimzo-Indian Defense')
+
+        game.result = 'draw'
+        mark_game_finished(game)
+        db.session.commit()
+        pgn = game_to_pgn(game)
+        assert '[ECO "E20"]' in pgn
+        assert '[Opening "Nimzo-Indian Defense"]' in pgn
+
+SAMPLE_PGN = """[Event "Club"]
+[Date "2024.11.02"]
+[White "alice"]
+[Black "bob"]
+[Result "1-0"]
+[WhiteElo "1650"]
+[BlackElo "1580"]
+[TimeControl "300+3"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+[Event "Club"]
+[White "bob"]
+[Black "carol"]
+[Result "1/2-1/2"]
+
+1. d4 d5 1/2-1/2
+
+[Event "Club"]
+[White "carol"]
+[Black "alice"]
+[Result "*"]
+
+1. c4 *
+"""
+
+def test_import_pgn(app, tmp_path):
+    """Test bulk PGN import with batching and checkpoint resume."""
+    path = tmp_path / 'club.pgn'
+    path.write_text(SAMPLE_PGN)
+
+    with app.app_context():
+        existing = User(username='bob', elorating=1200)
+        existing.set_password('pass')
+        db.session.add(existing)
+        db.session.commit()
+
+        total = import_pgn(str(path), batch_size=1, workers=0, chunk_size=64)
+        assert total == 2  # the unfinished game is skipped
+        assert Game.query.count() == 2
+
+        alice = User.query.filter_by(username='alice').first()
+        bob = User.query.filter_by(username='bob').first()
+        assert alice.elorating == 1650
+        assert alice.wins == 1
+        assert bob.elorating == 1200  # existing ratings are not overwritten
+        assert bob.losses == 1
+        assert not alice.check_password('')
+
+        game = Game.query.filter_by(player_white_id=alice.id).first()
+        assert game.result == 'white'
+        assert game.moves.split()[-1] == 'h5f7'
+        assert game.time_control == '300+3'
+        assert game.eco == 'C20'
+        assert game.finished_at == datetime(2024, 11, 2)
+
+        # A second run resumes from the checkpoint at the end of the file.
+        assert import_pgn(str(path), batch_size=1, workers=0) == 2
+        assert Game.query.count() == 2
+
+    # The real owner of an imported name can register it and keeps the imported games.
+    client = app.test_client()
+    assert client.post('/register', data={'username': 'alice', 'password': 'secret'}).status_code == 200
+    assert client.post('/register', data={'username': 'alice', 'password': 'other'}).status_code == 400
+    with app.app_context():
+        alice = User.query.filter_by(username='alice').one()
+        assert alice.check_password('secret') and alice.wins == 1
+
+def test_import_pgn_skips_non_standard_start(app, tmp_path):
+    """Test that games from a set-up position or of a chess variant are not imported."""
+    path = tmp_path / 'setup.pgn'
+    path.write_text(
+        '[Event "Study"]\n[White "alice"]\n[Black "bob"]\n[Result "1-0"]\n[SetUp "1"]\n'
+        '[FEN "4k3/8/8/8/8/8/4P3/4K2R w K - 0 1"]\n\n1. Rh8# 1-0\n\n'
+        '[Event "Zh"]\n[White "alice"]\n[Black "bob"]\n[Result "0-1"]\n[Variant "Crazyhouse"]\n\n'
+        '1. e4 e5 0-1\n\n'
+        '[Event "Club"]\n[White "alice"]\n[Black "bob"]\n[Result "1/2-1/2"]\n[Variant "Standard"]\n\n'
+        '1. e4 e5 1/2-1/2\n')
+
+    with app.app_context():
+        assert import_pgn(str(path), batch_size=10, workers=0) == 1
+        assert [game.moves for game in Game.query.all()] == ['e2e4 e7e5']
+
 # ========================================= bot.py tests ===============================================
 
 @pytest.mark.asyncio
@@ -435,7 +1550,7 @@ async def test_register_username_handler():
 @pytest.mark.asyncio
 async def test_register_password_success():
     """Test the register_password handler on successful registration."""
-    with patch('requests.post') as mock_post:
+    with patch('backend.bot.backend.post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {'message': 'Registration successful'}
@@ -452,7 +1567,7 @@ async def test_register_password_success():
 
         # Assertions
         mock_post.assert_called_with(
-            f'{BASE_URL}/register',
+            '/register',
             data={'username': 'testuser', 'password': 'testpassword'}
         )
 
@@ -462,7 +1577,7 @@ async def test_register_password_success():
 @pytest.mark.asyncio
 async def test_register_password_failure():
     """Test the register_password handler on failed registration."""
-    with patch('requests.post') as mock_post:
+    with patch('backend.bot.backend.post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 400
         mock_response.json.return_value = {'message': 'Username already exists'}
@@ -479,7 +1594,7 @@ async def test_register_password_failure():
 
         # Assertions
         mock_post.assert_called_with(
-            f'{BASE_URL}/register',
+            '/register',
             data={'username': 'testuser', 'password': 'testpassword'}
         )
 
@@ -521,18 +1636,17 @@ async def test_login_username_handler():
 
 @pytest.mark.asyncio
 async def test_login_password_success():
-    """Test the login_password handler on successful login."""
-    with patch('requests.Session') as mock_session_class:
-        mock_session = MagicMock()
+    """Test the login_password handler keeps only a compact session record on successful login."""
+    with patch('backend.bot.backend.post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {'auth_token': 'test_token'}
-        mock_session.post.return_value = mock_response
-        mock_session_class.return_value = mock_session
+        mock_response.json.return_value = {'auth_token': 'test_token', 'user_id': 7, 'session_token': 'signed'}
+        mock_post.return_value = mock_response
 
         update = MagicMock()
         update.message.text = 'testpassword'
         update.message.reply_text = AsyncMock()
+        update.effective_chat.id = 42
         context = MagicMock()
         context.user_data = {'username': 'testuser'}
 
@@ -540,33 +1654,30 @@ async def test_login_password_success():
         result = await login_password(update, context)
 
         # Assertions
-        mock_session.post.assert_called_with(
-            f'{BASE_URL}/login',
-            data={'username': 'testuser', 'password': 'testpassword'}
+        mock_post.assert_called_with(
+            '/login',
+            data={'username': 'testuser', 'password': 'testpassword', 'chat_id': 42}
         )
 
         update.message.reply_text.assert_called_once_with(
             "Login successful! Use /startgame to play online or /playlocal to play locally."
         )
-        assert context.user_data['auth_token'] == 'test_token'
-        assert context.user_data['session'] == mock_session
-        assert context.user_data['username'] == 'testuser'
+        assert context.user_data == {'session': {'user_id': 7, 'username': 'testuser', 'token': 'signed'}}
         assert result == ConversationHandler.END
 
 @pytest.mark.asyncio
 async def test_login_password_failure():
     """Test the login_password handler on failed login."""
-    with patch('requests.Session') as mock_session_class:
-        mock_session = MagicMock()
+    with patch('backend.bot.backend.post') as mock_post:
         mock_response = MagicMock()
         mock_response.status_code = 400
         mock_response.json.return_value = {'message': 'Invalid credentials'}
-        mock_session.post.return_value = mock_response
-        mock_session_class.return_value = mock_session
+        mock_post.return_value = mock_response
 
         update = MagicMock()
         update.message.text = 'wrongpassword'
         update.message.reply_text = AsyncMock()
+        update.effective_chat.id = 42
         context = MagicMock()
         context.user_data = {'username': 'testuser'}
 
@@ -574,36 +1685,52 @@ async def test_login_password_failure():
         result = await login_password(update, context)
 
         # Assertions
-        mock_session.post.assert_called_with(
-            f'{BASE_URL}/login',
-            data={'username': 'testuser', 'password': 'wrongpassword'}
+        mock_post.assert_called_with(
+            '/login',
+            data={'username': 'testuser', 'password': 'wrongpassword', 'chat_id': 42}
         )
 
         update.message.reply_text.assert_called_once_with(
             "Login failed: Invalid credentials"
         )
+        assert 'session' not in context.user_data
         assert result == ConversationHandler.END
 
 @pytest.mark.asyncio
 async def test_logout_logged_in():
     """Test the /logout command when user is logged in."""
-    with patch('backend.bot.requests.Session') as mock_session_class:
-        mock_session = MagicMock()
-        mock_session.get.return_value = MagicMock(status_code=200)
-        mock_session_class.return_value = mock_session
+    with patch('backend.bot.backend.get') as mock_get:
+        mock_get.return_value = MagicMock(status_code=200)
 
         update = MagicMock()
         update.message.reply_text = AsyncMock()
         context = MagicMock()
-        context.user_data = MagicMock()
-        context.user_data.clear = MagicMock()
-        context.user_data.get.return_value = mock_session  # Ensure 'session' is returned
+        record = session_record(7, 'testuser', 'signed')
+        context.user_data = {'session': record}
 
         # Call the handler
         await logout(update, context)
 
         # Assertions
-        mock_session.get.assert_called_with(f'{BASE_URL}/logout')
+        mock_get.assert_called_with('/logout', record)
+        assert context.user_data == {}
+        update.message.reply_text.assert_called_once_with("You have been logged out.")
+
+@pytest.mark.asyncio
+async def test_startgame_expired_session():
+    """Test /startgame drops a session the backend no longer accepts."""
+    with patch('backend.bot.backend.get') as mock_get:
+        mock_get.return_value = MagicMock(status_code=401)
+
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+        context = MagicMock()
+        context.user_data = {'session': session_record(7, 'testuser', 'revoked')}
+
+        await startgame(update, context)
+
+        assert context.user_data == {}
+        update.message.reply_text.assert_called_once_with("Your session has expired. Please /login again.")
 
 @pytest.mark.asyncio
 async def test_logout_not_logged_in():
@@ -638,7 +1765,7 @@ async def test_playlocal_command():
 @pytest.mark.asyncio
 async def test_leaderboard_success():
     """Test the /leaderboard command handler on success."""
-    with patch('requests.get') as mock_get:
+    with patch('backend.bot.backend.get') as mock_get:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = [
@@ -666,7 +1793,7 @@ async def test_leaderboard_success():
 @pytest.mark.asyncio
 async def test_leaderboard_failure():
     """Test the /leaderboard command handler on failure."""
-    with patch('requests.get') as mock_get:
+    with patch('backend.bot.backend.get') as mock_get:
         mock_response = MagicMock()
         mock_response.status_code = 500
         mock_get.return_value = mock_response
@@ -681,6 +1808,124 @@ async def test_leaderboard_failure():
         # Assertions
         update.message.reply_text.assert_called_once_with("Error fetching leaderboard.")
 
+@pytest.mark.asyncio
+async def test_exportpgn_sends_document():
+    """Test the /exportpgn command streams the PGN into a document."""
+    with patch('backend.bot.backend.get') as mock_get:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.iter_content.return_value = [b'[Event "x"]\n', b'\n1. e4 *\n\n']
+        mock_get.return_value = mock_response
+
+        update = MagicMock()
+        update.message.reply_document = AsyncMock()
+        context = MagicMock()
+        context.args = []
+        context.user_data = {'session': session_record(7, 'testuser', 'signed')}
+
+        await exportpgn(update, context)
+
+        mock_get.assert_called_once_with('/users/testuser/games.pgn', stream=True)
+        update.message.reply_document.assert_called_once()
+        assert update.message.reply_document.call_args.kwargs['filename'] == 'testuser.pgn'
+
+@pytest.mark.asyncio
+async def test_exportpgn_requires_username():
+    """Test the /exportpgn command without a username or login."""
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    context = MagicMock()
+    context.args = []
+    context.user_data = {}
+
+    await exportpgn(update, context)
+
+    update.message.reply_text.assert_called_once_with("Usage: /exportpgn <username>, or /login first.")
+
+@pytest.mark.asyncio
+async def test_explorer_command():
+    """Test the /explorer command formats the explorer response."""
+    with patch('backend.bot.backend.get') as mock_get:
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'moves': [
+            {'san': 'e5', 'games': 10, 'white_wins': 4, 'draws': 3, 'black_wins': 3, 'average_rating': 1550}
+        ]}
+        mock_get.return_value = mock_response
+
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+        context = MagicMock()
+        context.args = ['e4']
+        context.user_data = {'session': session_record(7, 'testuser', 'token')}
+
+        await explorer(update, context)
+
+        board = chess.Board()
+        board.push_san('e4')
+        mock_get.assert_called_once_with('/explorer', context.user_data['session'], params={'fen': board.fen()})
+        update.message.reply_text.assert_called_once_with(
+            "Opening explorer:\ne5: 10 games (+4 =3 -3), avg 1550\n"
+        )
+
+@pytest.mark.asyncio
+async def test_explorer_command_illegal_move():
+    """Test the /explorer command rejects illegal moves."""
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    context = MagicMock()
+    context.args = ['e5']
+    context.user_data = {'session': session_record(7, 'testuser', 'token')}
+
+    await explorer(update, context)
+
+    update.message.reply_text.assert_called_once_with("Illegal move: e5")
+
+@pytest.mark.asyncio
+async def test_explorer_command_refused_during_game(app, test_client):
+    """Test the bot's /explorer goes through the player's session and is refused during their live game."""
+    with app.app_context():
+        white = User(username='bot_exp_white')
+        white.set_password('pass')
+        black = User(username='bot_exp_black')
+        black.set_password('pass')
+        db.session.add_all([white, black])
+        db.session.commit()
+        token = white.generate_session_token()
+        game = Game(player_white_id=white.id, player_black_id=black.id, is_active=True, is_waiting=False)
+        db.session.add(game)
+        db.session.commit()
+        game_id = game.id
+
+    def backend_get(path, session=None, params=None):
+        headers = {'Authorization': f"Bearer {session['token']}"} if session else {}
+        response = test_client.get(path, query_string=params, headers=headers)
+        return MagicMock(status_code=response.status_code, json=response.get_json)
+
+    update = MagicMock()
+    update.message.reply_text = AsyncMock()
+    context = MagicMock()
+    context.args = ['e4']
+    context.user_data = {'session': session_record(1, 'bot_exp_white', token)}
+    assert test_client.get('/explorer').status_code == 401  # anonymous requests are not served
+    with patch('backend.bot.backend.get', side_effect=backend_get) as mock_get:
+        await explorer(update, context)
+    update.message.reply_text.assert_called_once_with(
+        "The opening explorer is unavailable while you are playing a game.")
+
+    with app.app_context():
+        db.session.get(Game, game_id).is_active = False
+        db.session.commit()
+    update.message.reply_text.reset_mock()
+    with patch('backend.bot.backend.get', side_effect=backend_get):
+        await explorer(update, context)
+    update.message.reply_text.assert_called_once_with("No games found for this position.")
+
+    context.user_data = {}
+    update.message.reply_text.reset_mock()
+    await explorer(update, context)
+    update.message.reply_text.assert_called_once_with("You need to /login first.")
+
 @pytest.mark.asyncio
 async def test_cancel_command():
     """Test the /cancel command handler."""
@@ -695,6 +1940,67 @@ async def test_cancel_command():
     update.message.reply_text.assert_called_once_with("Operation cancelled.")
     assert result == ConversationHandler.END
 
+@pytest.mark.asyncio
+async def test_chat_ordered_update_processor():
+    """Test updates of one chat are processed in order while other chats run concurrently."""
+    processor = ChatOrderedUpdateProcessor(max_running=8)
+    log = []
+
+    def update_from(chat_id):
+        update = MagicMock(spec=Update)
+        update.effective_chat.id = chat_id
+        return update
+
+    async def handle(chat_id, step, delay):
+        log.append(('start', chat_id, step))
+        await asyncio.sleep(delay)
+        log.append(('end', chat_id, step))
+
+    await asyncio.gather(
+        processor.process_update(update_from(1), handle(1, 0, 0.05)),
+        processor.process_update(update_from(1), handle(1, 1, 0)),
+        processor.process_update(update_from(2), handle(2, 0, 0)),
+    )
+
+    assert [entry for entry in log if entry[1] == 1] == [('start', 1, 0), ('end', 1, 0), ('start', 1, 1), ('end', 1, 1)]
+    assert log.index(('end', 2, 0)) < log.index(('end', 1, 0))  # another chat is not blocked
+    assert len(processor) == 0  # per-chat queues are released when idle
+
+@pytest.mark.asyncio
+async def test_outbox_sender_rate_limits():
+    """Test the outbox sender coalesces a chat's burst and respects per-chat rate limits."""
+    class FakeSource:
+        def __init__(self):
+            self.queue = []
+            self.acked = []
+
+        def claim_notifications(self, limit):
+            claimed, self.queue = self.queue[:limit], self.queue[limit:]
+            return claimed
+
+        def ack_notifications(self, ids):
+            self.acked.extend(ids)
+
+    now = [0.0]
+    source = FakeSource()
+    bot = MagicMock()
+    bot.send_message = AsyncMock()
+    sender = OutboxSender(bot, source, chat_rate=1, chat_burst=1, clock=lambda: now[0])
+
+    source.queue = [{'id': 1, 'chat_id': 7, 'text': 'a'}, {'id': 2, 'chat_id': 7, 'text': 'b'},
+                    {'id': 3, 'chat_id': 8, 'text': 'c'}]
+    await sender.tick()
+    assert sorted(call.kwargs['text'] for call in bot.send_message.call_args_list) == ['a\nb', 'c']
+    assert sorted(source.acked) == [1, 2, 3]
+
+    source.queue = [{'id': 4, 'chat_id': 7, 'text': 'd'}]
+    delay = await sender.tick()
+    assert bot.send_message.call_count == 2 and 0 < delay <= 1  # chat 7 is rate limited
+    now[0] += delay
+    await sender.tick()
+    bot.send_message.assert_called_with(chat_id=7, text='d')
+    assert sorted(source.acked) == [1, 2, 3, 4] and not sender.pending
+
 # ========================================= elo.py tests ===============================================
 
 def test_winner_elo_increase():
@@ -751,8 +2057,8 @@ def test_socketio_join_game(app):
             player_white_id=user.id,
             is_active=True,
             fen=chess.Board().fen(),
-            time_left_white=600,
-            time_left_black=600,
+            time_left_white_ms=600000,
+            time_left_black_ms=600000,
             last_move_time=datetime.utcnow()
         )
         db.session.add(game)
@@ -0,0 +1,53 @@
+"""initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2024-12-14 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Схема, которую создавал db.create_all() до появления миграций.
+    # Существующие базы достаточно пометить командой "flask db stamp 0001".
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('password_hash', sa.String(length=128), nullable=False),
+    sa.Column('elorating', sa.Integer(), nullable=True),
+    sa.Column('wins', sa.Integer(), nullable=True),
+    sa.Column('losses', sa.Integer(), nullable=True),
+    sa.Column('auth_token', sa.String(length=36), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('auth_token'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('game',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('player_white_id', sa.Integer(), nullable=False),
+    sa.Column('player_black_id', sa.Integer(), nullable=True),
+    sa.Column('fen', sa.String(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('is_waiting', sa.Boolean(), nullable=True),
+    sa.Column('time_left_white', sa.Integer(), nullable=True),
+    sa.Column('time_left_black', sa.Integer(), nullable=True),
+    sa.Column('last_move_time', sa.DateTime(), nullable=True),
+    sa.Column('result', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['player_black_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['player_white_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('game')
+    op.drop_table('user')
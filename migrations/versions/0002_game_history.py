@@ -0,0 +1,50 @@
+"""game history columns and indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-12-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('moves', sa.Text(), server_default='', nullable=False))
+        batch_op.add_column(sa.Column('white_elo', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('black_elo', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('time_control', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('started_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('finished_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_game_white_finished', ['player_white_id', 'finished_at'], unique=False)
+        batch_op.create_index('ix_game_black_finished', ['player_black_id', 'finished_at'], unique=False)
+
+    # Для уже завершенных партий время окончания неизвестно — берем время последнего хода.
+    game = sa.table('game',
+                    sa.column('is_active', sa.Boolean),
+                    sa.column('last_move_time', sa.DateTime),
+                    sa.column('started_at', sa.DateTime),
+                    sa.column('finished_at', sa.DateTime))
+    op.execute(game.update()
+               .where(sa.or_(game.c.is_active == sa.false(), game.c.is_active.is_(None)))
+               .values(finished_at=game.c.last_move_time, started_at=game.c.last_move_time))
+
+
+def downgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.drop_index('ix_game_black_finished')
+        batch_op.drop_index('ix_game_white_finished')
+        batch_op.drop_column('finished_at')
+        batch_op.drop_column('started_at')
+        batch_op.drop_column('time_control')
+        batch_op.drop_column('black_elo')
+        batch_op.drop_column('white_elo')
+        batch_op.drop_column('moves')
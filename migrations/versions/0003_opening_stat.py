@@ -0,0 +1,33 @@
+"""opening explorer statistics
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-12-27 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('opening_stat',
+    sa.Column('position_hash', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('move', sa.String(length=5), nullable=False),
+    sa.Column('white_wins', sa.Integer(), nullable=False),
+    sa.Column('draws', sa.Integer(), nullable=False),
+    sa.Column('black_wins', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.BigInteger(), nullable=False),
+    sa.Column('rated_games', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('position_hash', 'move')
+    )
+
+
+def downgrade():
+    op.drop_table('opening_stat')
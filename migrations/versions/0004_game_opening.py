@@ -0,0 +1,28 @@
+"""eco opening classification of games
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-12-28 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('eco', sa.String(length=3), nullable=True))
+        batch_op.add_column(sa.Column('opening', sa.String(length=128), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.drop_column('opening')
+        batch_op.drop_column('eco')
@@ -0,0 +1,42 @@
+"""auth token expiry and index for the background reaper
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-12-29 12:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('auth_token_expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_user_auth_token_expires_at'), ['auth_token_expires_at'], unique=False)
+
+    # Уже выданные токены получают обычный срок действия, считая от момента миграции.
+    user = sa.table('user', sa.column('auth_token', sa.String), sa.column('auth_token_expires_at', sa.DateTime))
+    op.execute(user.update()
+               .where(user.c.auth_token.isnot(None))
+               .values(auth_token_expires_at=datetime.utcnow() + timedelta(hours=24)))
+
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.create_index('ix_game_active_waiting', ['is_active', 'is_waiting', 'last_move_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.drop_index('ix_game_active_waiting')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_auth_token_expires_at'))
+        batch_op.drop_column('auth_token_expires_at')
@@ -0,0 +1,47 @@
+"""telegram chat id and notification outbox
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-12-31 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('telegram_chat_id', sa.BigInteger(), nullable=True))
+
+    op.create_table('notification',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('game_id', sa.Integer(), nullable=True),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('leased_until', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.create_index('ix_notification_chat_kind_game', ['chat_id', 'kind', 'game_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_notification_leased_until'), ['leased_until'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notification_leased_until'))
+        batch_op.drop_index('ix_notification_chat_kind_game')
+
+    op.drop_table('notification')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('telegram_chat_id')
@@ -0,0 +1,60 @@
+"""swiss and round-robin tournaments
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2025-01-06 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tournament',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('rounds', sa.Integer(), nullable=True),
+    sa.Column('current_round', sa.Integer(), nullable=False),
+    sa.Column('time_control', sa.String(length=16), nullable=False),
+    sa.Column('created_by', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('tournament_player',
+    sa.Column('tournament_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=False),
+    sa.Column('colors', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['tournament_id'], ['tournament.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('tournament_id', 'user_id')
+    )
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tournament_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tournament_round', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_game_tournament_id', 'tournament', ['tournament_id'], ['id'])
+        batch_op.create_index('ix_game_tournament_round', ['tournament_id', 'tournament_round'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.drop_index('ix_game_tournament_round')
+        batch_op.drop_constraint('fk_game_tournament_id', type_='foreignkey')
+        batch_op.drop_column('tournament_round')
+        batch_op.drop_column('tournament_id')
+
+    op.drop_table('tournament_player')
+    op.drop_table('tournament')
@@ -0,0 +1,36 @@
+"""arena tournaments
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2025-01-08 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tournament', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duration', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('ends_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('tournament_player', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('streak', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('withdrawn', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('tournament_player', schema=None) as batch_op:
+        batch_op.drop_column('withdrawn')
+        batch_op.drop_column('streak')
+
+    with op.batch_alter_table('tournament', schema=None) as batch_op:
+        batch_op.drop_column('ends_at')
+        batch_op.drop_column('duration')
@@ -0,0 +1,34 @@
+"""millisecond clocks
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2025-01-10 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.alter_column('time_left_white', new_column_name='time_left_white_ms', existing_type=sa.Integer())
+        batch_op.alter_column('time_left_black', new_column_name='time_left_black_ms', existing_type=sa.Integer())
+
+    op.execute('UPDATE game SET time_left_white_ms = time_left_white_ms * 1000, '
+               'time_left_black_ms = time_left_black_ms * 1000')
+
+
+def downgrade():
+    op.execute('UPDATE game SET time_left_white_ms = time_left_white_ms / 1000, '
+               'time_left_black_ms = time_left_black_ms / 1000')
+
+    with op.batch_alter_table('game', schema=None) as batch_op:
+        batch_op.alter_column('time_left_black_ms', new_column_name='time_left_black', existing_type=sa.Integer())
+        batch_op.alter_column('time_left_white_ms', new_column_name='time_left_white', existing_type=sa.Integer())